@@ -0,0 +1,432 @@
+# almacen_salidas.py
+"""Almacenamiento comprimido de las salidas de ORCA y política de retención.
+
+Una salida terminada <job>.out se guarda como <job>.out.zst (o .out.gz si no
+está instalado zstandard): una secuencia de tramas independientes, cada una
+con BLOQUE bytes del texto original, que zstdcat/zcat leen como un archivo
+normal. Junto a ella, <job>.out.zst.idx guarda dónde empieza cada trama en
+el archivo comprimido y en el original, de modo que leer un rango de la
+salida (una sección cuyo offset guarda el sidecar) sólo descomprime las
+tramas que lo cubren.
+
+El resto del proyecto sigue usando la ruta lógica <job>.out: resolver()
+devuelve el archivo que existe realmente y leer_rango()/descomprimir() dan
+su contenido sin comprimir, sea cual sea el formato.
+
+La retención (podar) borra de los pasos terminados los temporales de ORCA y
+los intermedios grandes, y los .gbw que ya no leerá ningún cálculo: se
+conserva el del último paso de cada trabajo y los que alguna entrada
+pendiente lee con %moinp.
+
+    python almacen_salidas.py runs/                 # comprimir y podar todo runs/
+    python almacen_salidas.py runs/water --simular  # qué se borraría, sin tocar nada
+"""
+import os
+import re
+import gzip
+import json
+import mmap
+import zlib
+import bisect
+import shutil
+import fnmatch
+import argparse
+import tempfile
+
+# Configuración (se puede sobrescribir por entorno)
+FORMATO = os.environ.get("ORCA_COMPRESION", "zstd")          # "zstd", "gzip" o "no"
+BLOQUE = int(float(os.environ.get("ORCA_BLOQUE_MB", 4)) * 1024 * 1024)
+RETENCION_MB = float(os.environ.get("ORCA_RETENCION_MB", 50))  # intermedios mayores se borran
+
+NIVELES = {"zstd": 9, "gzip": 6}
+EXTENSIONES = {"zstd": ".zst", "gzip": ".gz"}
+
+# Temporales de ORCA (siempre se borran) e intermedios que sólo se borran si son grandes
+TEMPORALES = ("*.tmp", "*.tmp.*")
+INTERMEDIOS = (".densities", ".densitiesinfo", ".cis", ".loc", ".uno", ".unso", ".qro")
+FIN_NORMAL = b"ORCA TERMINATED NORMALLY"
+
+_moinp_re = re.compile(r'^\s*%moinp\s+"([^"]+)"', re.M | re.I)
+_aviso_zstd = []
+
+
+def _zstd():
+    """Módulo zstandard, o None si no está instalado."""
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def formato_efectivo(formato=None):
+    """Formato con el que se comprime: zstd cae a gzip si zstandard no está instalado."""
+    formato = formato or FORMATO
+    if formato == "zstd" and _zstd() is None:
+        if not _aviso_zstd:
+            print("⚠️ zstandard no está instalado: las salidas se comprimen con gzip")
+            _aviso_zstd.append(True)
+        return "gzip"
+    return formato
+
+
+# --------- Rutas ---------
+def comprimida(ruta):
+    """True si la ruta es una salida comprimida (.zst o .gz)."""
+    return ruta.endswith(tuple(EXTENSIONES.values()))
+
+
+def ruta_logica(ruta):
+    """Ruta .out de una salida, sin la extensión de compresión."""
+    for ext in EXTENSIONES.values():
+        if ruta.endswith(ext):
+            return ruta[:-len(ext)]
+    return ruta
+
+
+def ruta_indice(comprimido):
+    return comprimido + ".idx"
+
+
+def resolver(outfile):
+    """Archivo real de una salida: el .out si existe; si no, su versión comprimida."""
+    if comprimida(outfile) or os.path.exists(outfile):
+        return outfile
+    for ext in EXTENSIONES.values():
+        if os.path.exists(outfile + ext):
+            return outfile + ext
+    return outfile
+
+
+def existe(outfile):
+    return os.path.exists(resolver(outfile))
+
+
+def salida_de(nombre):
+    """Nombre lógico .out de un archivo de salida (plano o comprimido), o None si no lo es."""
+    nombre = ruta_logica(nombre)
+    return nombre if nombre.endswith(".out") else None
+
+
+# --------- Compresión ---------
+def _formato_de(ruta):
+    return "zstd" if ruta.endswith(EXTENSIONES["zstd"]) else "gzip"
+
+
+def _compresor(formato):
+    if formato == "zstd":
+        # compress() escribe el tamaño original en la cabecera de cada trama
+        return _zstd().ZstdCompressor(level=NIVELES["zstd"]).compress
+    return lambda datos: gzip.compress(datos, NIVELES["gzip"], mtime=0)
+
+
+def _descompresor(formato):
+    if formato == "zstd":
+        return _zstd().ZstdDecompressor().decompressobj()
+    return zlib.decompressobj(wbits=31)
+
+
+def _escribir_indice(ruta, indice):
+    tmp = f"{ruta}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(indice, f)
+    os.replace(tmp, ruta)
+
+
+def comprimir_archivo(origen, destino=None, formato=None, bloque=BLOQUE):
+    """Comprime `origen` en tramas independientes de `bloque` bytes y escribe su índice.
+
+    El archivo comprimido conserva la fecha del original. Devuelve su ruta.
+    """
+    formato = formato_efectivo(formato)
+    destino = destino or origen + EXTENSIONES[formato]
+    comprimir = _compresor(formato)
+    posiciones, comprimidos = [], [0]
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(destino) or ".", prefix=".comprimir-")
+    try:
+        with open(origen, "rb") as fi, os.fdopen(fd, "wb") as fo:
+            while True:
+                posiciones.append(fi.tell())
+                datos = fi.read(bloque)
+                if not datos:
+                    break
+                fo.write(comprimir(datos))
+                comprimidos.append(fo.tell())
+            tamano = posiciones.pop()
+        st = os.stat(origen)
+        os.utime(tmp, ns=(st.st_atime_ns, st.st_mtime_ns))
+        _escribir_indice(ruta_indice(destino), {"formato": formato, "tamano": tamano,
+                                                "posiciones": posiciones, "comprimidos": comprimidos})
+        os.replace(tmp, destino)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return destino
+
+
+def _tramas(f, formato, trozo=1 << 20):
+    """Genera (offset comprimido al final de la trama, bytes) de cada trama de `f`, en orden."""
+    d, partes, pos = _descompresor(formato), [], 0
+    while True:
+        datos = f.read(trozo)
+        if not datos:
+            break
+        while datos:
+            partes.append(d.decompress(datos))
+            if not d.eof:
+                pos += len(datos)
+                break
+            resto = d.unused_data
+            pos += len(datos) - len(resto)
+            yield pos, b"".join(partes)
+            d, partes, datos = _descompresor(formato), [], resto
+    if any(partes):
+        yield pos, b"".join(partes)   # trama final truncada: se entrega lo que haya
+
+
+def _reconstruir_indice(ruta):
+    """Índice de un archivo comprimido sin .idx (p. ej. comprimido a mano con gzip)."""
+    formato = _formato_de(ruta)
+    posiciones, comprimidos, tamano = [], [0], 0
+    with open(ruta, "rb") as f:
+        for fin, datos in _tramas(f, formato):
+            posiciones.append(tamano)
+            comprimidos.append(fin)
+            tamano += len(datos)
+    return {"formato": formato, "tamano": tamano, "posiciones": posiciones, "comprimidos": comprimidos}
+
+
+def indice(ruta):
+    """Índice de tramas {formato, tamano, posiciones, comprimidos}; se reconstruye si falta o no cuadra."""
+    try:
+        with open(ruta_indice(ruta)) as f:
+            idx = json.load(f)
+        if idx["comprimidos"][-1] == os.path.getsize(ruta):
+            return idx
+    except (OSError, ValueError, KeyError, IndexError):
+        pass
+    idx = _reconstruir_indice(ruta)
+    try:
+        _escribir_indice(ruta_indice(ruta), idx)
+    except OSError:
+        pass  # directorio de sólo lectura: se usa el índice en memoria
+    return idx
+
+
+def tamano(outfile):
+    """Tamaño de la salida sin comprimir."""
+    ruta = resolver(outfile)
+    return indice(ruta)["tamano"] if comprimida(ruta) else os.path.getsize(ruta)
+
+
+# --------- Lectura ---------
+def leer_rango(outfile, inicio=0, fin=None):
+    """Bytes [inicio, fin) de la salida sin comprimir; `inicio` negativo cuenta desde el final.
+
+    En una salida comprimida sólo se leen y descomprimen las tramas que cubren el rango.
+    """
+    ruta = resolver(outfile)
+    if not comprimida(ruta):
+        with open(ruta, "rb") as f:
+            total = os.fstat(f.fileno()).st_size
+            inicio, fin, _ = slice(inicio, fin).indices(total)
+            f.seek(inicio)
+            return f.read(max(0, fin - inicio))
+    idx = indice(ruta)
+    inicio, fin, _ = slice(inicio, fin).indices(idx["tamano"])
+    if fin <= inicio:
+        return b""
+    posiciones, comprimidos = idx["posiciones"], idx["comprimidos"]
+    primera = bisect.bisect_right(posiciones, inicio) - 1
+    ultima = bisect.bisect_left(posiciones, fin) - 1
+    partes = []
+    with open(ruta, "rb") as f:
+        f.seek(comprimidos[primera])
+        for k in range(primera, ultima + 1):
+            partes.append(_descompresor(idx["formato"]).decompress(
+                f.read(comprimidos[k + 1] - comprimidos[k])))
+    base = posiciones[primera]
+    return b"".join(partes)[inicio - base:fin - base]
+
+
+def descomprimir(outfile, umbral_mmap=8 * 1024 * 1024):
+    """Contenido completo de una salida comprimida, descomprimido en streaming.
+
+    Por debajo de `umbral_mmap` se devuelven bytes; por encima, un mmap de
+    sólo lectura sobre un temporal local (borrado al cerrarlo), para no
+    retener en memoria salidas de cientos de MB.
+    """
+    ruta = resolver(outfile)
+    formato = _formato_de(ruta)
+    with open(ruta, "rb") as f:
+        if indice(ruta)["tamano"] < umbral_mmap:
+            return b"".join(datos for _, datos in _tramas(f, formato))
+        with tempfile.TemporaryFile() as tmp:
+            for _, datos in _tramas(f, formato):
+                tmp.write(datos)
+            tmp.flush()
+            return mmap.mmap(tmp.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def terminada(outfile):
+    """True si ORCA terminó normalmente (se mira sólo el final de la salida)."""
+    return existe(outfile) and FIN_NORMAL in leer_rango(outfile, -4096)
+
+
+# --------- Archivo de salidas ---------
+def _retirar(outfile, salvo):
+    """Borra las demás versiones (plana o comprimidas) de una salida: quedarían obsoletas."""
+    for ruta in (outfile, *(outfile + ext for ext in EXTENSIONES.values())):
+        if ruta != salvo and os.path.exists(ruta):
+            os.unlink(ruta)
+            if comprimida(ruta) and os.path.exists(ruta_indice(ruta)):
+                os.unlink(ruta_indice(ruta))
+
+
+def copiar(origen, outfile, comprimir=False):
+    """Copia una salida (plana o comprimida, con su índice) a la ruta lógica `outfile`.
+
+    Con `comprimir`, una salida plana se guarda comprimida en FORMATO (salvo
+    que sea "no"). Devuelve la ruta real del destino.
+    """
+    ruta = resolver(origen)
+    formato = formato_efectivo() if comprimir else "no"
+    if not comprimida(ruta) and formato != "no":
+        destino = comprimir_archivo(ruta, outfile + EXTENSIONES[formato], formato)
+    else:
+        destino = outfile + ruta[len(ruta_logica(ruta)):]
+        shutil.copyfile(ruta, destino)
+        if comprimida(ruta) and os.path.exists(ruta_indice(ruta)):
+            shutil.copyfile(ruta_indice(ruta), ruta_indice(destino))
+    _retirar(outfile, destino)
+    return destino
+
+
+def archivar(outfile, formato=None, bloque=BLOQUE):
+    """Comprime una salida terminada y mantiene vigente su sidecar.
+
+    El sidecar se calcula antes sobre el texto plano (sus offsets son del
+    texto sin comprimir) y después se reescribe con el tamaño y el hash del
+    comprimido. Devuelve la ruta comprimida, o None si no había nada que comprimir.
+    """
+    from parser_orca import leer_resultado, escribir_sidecar
+    formato = formato_efectivo(formato)
+    if formato == "no" or comprimida(outfile) or not os.path.exists(outfile):
+        return None
+    resultado = leer_resultado(outfile)
+    destino = comprimir_archivo(outfile, formato=formato, bloque=bloque)
+    _retirar(outfile, destino)
+    try:
+        escribir_sidecar(outfile, resultado)
+    except OSError:
+        pass
+    return destino
+
+
+def _orden_paso(carpeta):
+    """Posición de la carpeta de un paso: <n>_<paso> en las cadenas, 0 en un cálculo simple."""
+    prefijo = os.path.basename(carpeta).split("_", 1)[0]
+    return int(prefijo) if prefijo.isdigit() else 0
+
+
+def _grupo(carpeta):
+    """Cálculos que se encadenan entre sí: los pasos <n>_<paso> de un trabajo, o la carpeta sola."""
+    return os.path.dirname(carpeta) if _orden_paso(carpeta) else carpeta
+
+
+def pasos(raiz):
+    """(carpeta de la entrada, nombre, salida lógica o None) de cada .inp bajo `raiz`.
+
+    La salida está junto a la entrada (cadenas) o en ../outputs (cálculo simple).
+    """
+    for d, subdirs, archivos in os.walk(raiz):
+        subdirs.sort()
+        for archivo in sorted(archivos):
+            if archivo.endswith(".inp"):
+                nombre = archivo[:-4]
+                candidatos = (os.path.join(d, nombre + ".out"),
+                              os.path.join(os.path.dirname(d), "outputs", nombre + ".out"))
+                yield d, nombre, next((c for c in candidatos if existe(c)), None)
+
+
+def podar(raiz, retencion_mb=None, simular=False):
+    """Borra temporales, intermedios grandes y .gbw innecesarios de los pasos terminados.
+
+    Sólo se tocan las carpetas de pasos cuya salida terminó normalmente. Un
+    .gbw se conserva si es el del último paso terminado de su cadena o de un
+    cálculo simple (punto de partida de un recálculo) o si lo lee con %moinp una entrada que aún
+    no ha terminado. Devuelve [(ruta, bytes)] de lo borrado (o de lo que se
+    borraría, con `simular`).
+    """
+    retencion = (RETENCION_MB if retencion_mb is None else retencion_mb) * 1024 * 1024
+    todos = list(pasos(raiz))
+    hechos = {(d, n) for d, n, out in todos if out and terminada(out)}
+    necesarios = set()
+    for d, n, out in todos:
+        if (d, n) not in hechos:
+            with open(os.path.join(d, n + ".inp"), errors="replace") as f:
+                necesarios.update(os.path.normpath(os.path.join(d, m)) for m in _moinp_re.findall(f.read()))
+    ultimos = {}
+    for d, n in sorted(hechos):
+        grupo = _grupo(d)
+        if grupo not in ultimos or _orden_paso(d) >= _orden_paso(ultimos[grupo][0]):
+            ultimos[grupo] = (d, n)
+    necesarios.update(os.path.normpath(os.path.join(d, n + ".gbw")) for d, n in ultimos.values())
+
+    borrados = []
+    for d in sorted({d for d, _ in hechos}):
+        for archivo in sorted(os.listdir(d)):
+            ruta = os.path.join(d, archivo)
+            if not os.path.isfile(ruta):
+                continue
+            tam = os.path.getsize(ruta)
+            if (any(fnmatch.fnmatch(archivo, p) for p in TEMPORALES)
+                    or (archivo.endswith(INTERMEDIOS) and tam > retencion)
+                    or (archivo.endswith(".gbw") and os.path.normpath(ruta) not in necesarios)):
+                if not simular:
+                    os.unlink(ruta)
+                borrados.append((ruta, tam))
+    return borrados
+
+
+def archivar_trabajo(raiz, formato=None, podar_intermedios=True, retencion_mb=None):
+    """Comprime las salidas terminadas bajo `raiz` y aplica la retención (podar).
+
+    Devuelve ([(comprimida, bytes antes, bytes después)], [(borrado, bytes)]).
+    """
+    comprimidas = []
+    for _, _, outfile in pasos(raiz):
+        if outfile and os.path.exists(outfile) and terminada(outfile):
+            antes = os.path.getsize(outfile)
+            destino = archivar(outfile, formato)
+            if destino:
+                comprimidas.append((destino, antes, os.path.getsize(destino)))
+    borrados = podar(raiz, retencion_mb) if podar_intermedios else []
+    return comprimidas, borrados
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compresión y retención de las salidas de ORCA")
+    parser.add_argument("raiz", nargs="?", default="runs", help="Directorio de trabajos")
+    parser.add_argument("--formato", default=None, choices=["zstd", "gzip", "no"],
+                        help=f"Compresión de las salidas (por defecto {FORMATO}; 'no' sólo poda)")
+    parser.add_argument("--retencion-mb", type=float, default=None,
+                        help=f"Intermedios de más de estos MB se borran (por defecto {RETENCION_MB:g})")
+    parser.add_argument("--sin-podar", action="store_true", help="Sólo comprimir")
+    parser.add_argument("--simular", action="store_true", help="Listar lo que se borraría sin borrar nada")
+    args = parser.parse_args()
+
+    if args.simular:
+        borrados = podar(args.raiz, args.retencion_mb, simular=True)
+        for ruta, tam in borrados:
+            print(f"{tam / 1024**2:10.1f} MB  {ruta}")
+        print(f"📊 Se borrarían {len(borrados)} archivos ({sum(t for _, t in borrados) / 1024**2:.1f} MB)")
+    else:
+        comprimidas, borrados = archivar_trabajo(args.raiz, args.formato, not args.sin_podar,
+                                                 args.retencion_mb)
+        if comprimidas:
+            antes = sum(a for _, a, _ in comprimidas) / 1024**2
+            despues = sum(d for _, _, d in comprimidas) / 1024**2
+            print(f"✅ {len(comprimidas)} salidas comprimidas: {antes:.1f} MB → {despues:.1f} MB")
+        if not args.sin_podar:
+            print(f"✅ Poda: {len(borrados)} archivos, {sum(t for _, t in borrados) / 1024**2:.1f} MB liberados")
@@ -1,18 +1,15 @@
 import os
+import uuid
+import time
 import streamlit as st
-import subprocess
-import tempfile
 import py3Dmol
 import streamlit.components.v1 as components
-import shutil
-import time
-import signal
-from subprocess import Popen, PIPE, TimeoutExpired
+import servicio_trabajos as servicio
+import busqueda_espectros
 
 # Initialize session state with more variables
 if 'initialized' not in st.session_state:
     st.session_state.initialized = False
-    st.session_state.temp_dir = None
     st.session_state.previous_upload = None
 
 # Disable usage stats and set up configuration
@@ -27,9 +24,10 @@ st.set_page_config(
 for dir_path in ["results/reportes", "results/espectros", "results/moleculas_3d"]:
     os.makedirs(dir_path, exist_ok=True)
 
-# Directorio base del proyecto
-PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
-RUN_ORCA = os.path.join(PROJECT_DIR, "run_orca.py")
+# Segundos entre consultas de estado mientras un trabajo está en curso
+INTERVALO_SONDEO = 1.5
+# Entradas máximas de cada caché de la app (las menos usadas se descartan)
+MAX_CACHE = int(os.environ.get("ORCA_APP_CACHE", 64))
 
 @st.cache_resource
 def init_session():
@@ -40,6 +38,14 @@ def init_session():
 # Initialize session
 init_session()
 
+# El usuario y el trabajo seleccionado viven en la URL para sobrevivir a recargas
+if "usuario" not in st.query_params:
+    st.query_params["usuario"] = uuid.uuid4().hex[:12]
+usuario = st.query_params["usuario"]
+
+# Arrancar el servicio de trabajos si no está corriendo
+servicio.asegurar_servicio()
+
 st.title("🔬 Generador de cálculos ORCA")
 st.markdown("Sube una molécula `.xyz` y genera automáticamente:")
 st.markdown("- ✅ Energía total")
@@ -47,176 +53,220 @@ st.markdown("- ✅ Espectro IR (PNG + CSV)")
 st.markdown("- ✅ Visualización 3D interactiva")
 st.markdown("- ✅ Reporte en PDF")
 
-# Función para mostrar molécula en 3D
-@st.cache_resource
-def mostrar_molecula_3d(xyz_file):
-    try:
-        with open(xyz_file) as f:
-            xyz_data = f.read()
+# Las cachés se indexan por la huella del contenido subido (no por rutas, que
+# cambian en cada subida); los argumentos con "_" no forman parte de la clave
+@st.cache_data(max_entries=MAX_CACHE, show_spinner=False)
+def html_molecula(huella, _xyz_file):
+    with open(_xyz_file) as f:
+        xyz_data = f.read()
+    view = py3Dmol.view(width=500, height=400)
+    view.addModel(xyz_data, "xyz")
+    view.setStyle({"stick": {}})
+    view.zoomTo()
+    return view._make_html()
+
+
+@st.cache_data(max_entries=MAX_CACHE, show_spinner=False)
+def leer_artefacto(huella, sufijo, _ruta):
+    """Bytes de un PNG, CSV o PDF de resultados."""
+    with open(_ruta, "rb") as f:
+        return f.read()
 
-        view = py3Dmol.view(width=500, height=400)
-        view.addModel(xyz_data, "xyz")
-        view.setStyle({"stick": {}})
-        view.zoomTo()
 
-        html = view._make_html()
-        components.html(html, height=500, width=600)
+def mostrar_molecula_3d(trabajo):
+    try:
+        components.html(html_molecula(trabajo["huella"] or trabajo["id"], trabajo["molfile"]),
+                        height=500, width=600)
     except Exception as e:
         st.error(f"Error al visualizar molécula: {str(e)}")
 
-# Cleanup function
-def cleanup_temp_files():
-    if st.session_state.temp_dir and os.path.exists(st.session_state.temp_dir):
-        shutil.rmtree(st.session_state.temp_dir)
-        st.session_state.temp_dir = None
 
-# Modified processing section
+def _artefacto(trabajo, sufijo):
+    """Contenido del resultado que termina en `sufijo` (p. ej. "_IR.csv"), o None.
+
+    Se busca por sufijo porque un trabajo reutilizado conserva los nombres de
+    archivo del trabajo original.
+    """
+    ruta = next((r for n, r in trabajo["resultados"].items() if n.endswith(sufijo)), None)
+    if ruta is None or not os.path.exists(ruta):
+        return None
+    return leer_artefacto(trabajo["huella"] or trabajo["id"], sufijo, ruta)
+
+
+def mostrar_resultados(trabajo):
+    """Muestra espectros, CSV, PDF y la molécula 3D de un trabajo terminado."""
+    jobname = os.path.splitext(trabajo["nombre"])[0]
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        # Espectros IR
+        st.subheader("📊 Espectros IR")
+
+        # Mostrar los tres espectros
+        espectros = [
+            ("discrete", "Espectro de Picos Discretos", "Picos IR individuales"),
+            ("smooth", "Espectro Suavizado", "Espectro IR suavizado"),
+            ("labeled", "Espectro con Etiquetas", "Espectro IR con frecuencias etiquetadas"),
+        ]
+        for variante, titulo, caption in espectros:
+            png = _artefacto(trabajo, f"_IR_{variante}.png")
+            if png is not None:
+                st.markdown(f"### {titulo}")
+                st.image(png, caption=caption)
+
+        # CSV
+        csv = _artefacto(trabajo, "_IR.csv")
+        if csv is not None:
+            st.subheader("📑 Frecuencias (CSV)")
+            st.download_button(
+                label="⬇️ Descargar CSV",
+                data=csv,
+                file_name=f"{jobname}_IR.csv",
+                mime="text/csv",
+                key=f"csv_{trabajo['id']}",
+            )
+
+        # Espectros RMN (sólo si el cálculo tenía apantallamientos)
+        rmn_png = [(iso, _artefacto(trabajo, f"_NMR_{iso}.png")) for iso in ("1H", "13C")]
+        rmn_csv = _artefacto(trabajo, "_NMR.csv")
+        if rmn_csv is not None or any(png is not None for _, png in rmn_png):
+            st.subheader("🧲 Espectros RMN")
+            for iso, png in rmn_png:
+                if png is not None:
+                    st.image(png, caption=f"Espectro RMN {iso} (desplazamientos frente a TMS)")
+            if rmn_csv is not None:
+                st.download_button(
+                    label="⬇️ Descargar desplazamientos (CSV)",
+                    data=rmn_csv,
+                    file_name=f"{jobname}_NMR.csv",
+                    mime="text/csv",
+                    key=f"nmr_{trabajo['id']}",
+                )
+
+    with col2:
+        # Molécula en 3D
+        st.subheader("🧩 Visualización 3D interactiva")
+        mostrar_molecula_3d(trabajo)
+
+        # PDF
+        pdf = _artefacto(trabajo, "_IR.pdf")
+        if pdf is not None:
+            st.subheader("📄 Reporte en PDF")
+            st.download_button(
+                label="⬇️ Descargar PDF",
+                data=pdf,
+                file_name=f"{jobname}_IR.pdf",
+                mime="application/pdf",
+                key=f"pdf_{trabajo['id']}",
+            )
+
+
+def mostrar_lote(trabajos):
+    """Una fila de progreso por molécula del lote. Devuelve True si alguna sigue en curso."""
+    st.subheader(f"🧪 Lote de {len(trabajos)} moléculas")
+    for t in trabajos:
+        col1, col2, col3 = st.columns([2, 4, 1])
+        col1.markdown(f"**{t['nombre']}**")
+        if t["estado"] == servicio.ERROR:
+            col2.error(t["mensaje"].splitlines()[-1] if t["mensaje"] else "Error en ORCA")
+        else:
+            texto = "En cola" if t["estado"] == servicio.PENDIENTE else t["mensaje"]
+            col2.progress(t["progreso"], text=texto)
+        if t["estado"] == servicio.TERMINADO and col3.button("Ver", key=f"ver_{t['id']}"):
+            st.query_params["trabajo"] = t["id"]
+    return any(t["estado"] in servicio.ACTIVOS for t in trabajos)
+
+
+@st.cache_resource
+def indice_espectros(tipo):
+    # Se comparte entre sesiones; buscar() relee el índice si cambió en disco
+    return busqueda_espectros.IndiceEspectros(tipo)
+
+
+def buscar_por_espectro():
+    """Sube un espectro experimental y muestra las moléculas calculadas más parecidas."""
+    with st.expander("🔎 Buscar moléculas por espectro experimental"):
+        archivo = st.file_uploader("Espectro experimental (CSV/TXT: número de onda, intensidad)",
+                                   type=["csv", "txt", "dat"], key="espectro_upload")
+        col1, col2, col3 = st.columns(3)
+        tipo = col1.selectbox("Tipo", ["ir", "raman"])
+        metrica = col1.selectbox("Métrica", busqueda_espectros.METRICAS)
+        escala = col2.number_input("Factor de escala", value=1.0, step=0.005, format="%.3f")
+        tolerancia = col2.number_input("Tolerancia de desplazamiento (cm-1)", value=10.0, step=2.0)
+        n = col3.number_input("Resultados", value=10, min_value=1, max_value=100)
+        transmitancia = col3.checkbox("Transmitancia")
+        indice = indice_espectros(tipo)
+        if st.button("Actualizar índice"):
+            indice.actualizar()
+        if archivo is not None:
+            x, y = busqueda_espectros.leer_espectro(archivo)
+            if transmitancia:
+                y = busqueda_espectros.absorbancia(y)
+            resultados = indice.buscar(x, y, int(n), metrica, escala, tolerancia)
+            if resultados:
+                st.dataframe(resultados, use_container_width=True)
+            else:
+                st.info("El índice está vacío: pulsa «Actualizar índice» tras calcular algunas moléculas.")
+
+
+# Historial de trabajos del usuario
+with st.sidebar:
+    st.subheader("🗂️ Mis trabajos")
+    for t in servicio.listar(usuario):
+        etiqueta = f"{t['nombre']} · {t['estado']}"
+        if st.button(etiqueta, key=f"trabajo_{t['id']}"):
+            st.query_params["trabajo"] = t["id"]
+
 try:
-    molfile = st.file_uploader("Sube un archivo .xyz de la molécula", type=["xyz"], 
-                              key="mol_upload", on_change=cleanup_temp_files)
-
-    if molfile is not None and molfile != st.session_state.previous_upload:
-        st.session_state.previous_upload = molfile
-        
-        # Create progress bars
-        progress_placeholder = st.empty()
-        progress_bar = st.progress(0)
-        status_text = st.empty()
-        
+    molfiles = st.file_uploader("Sube uno o varios archivos .xyz", type=["xyz"],
+                                accept_multiple_files=True, key="mol_upload")
+
+    # Encolar cada subida nueva una sola vez
+    upload_id = tuple(getattr(m, "file_id", None) or (m.name, m.size) for m in molfiles)
+    if molfiles and upload_id != st.session_state.previous_upload:
+        st.session_state.previous_upload = upload_id
         try:
-            # Step 1: File preparation (10%)
-            status_text.text("Preparando archivo...")
-            progress_bar.progress(10)
-            
-            cleanup_temp_files()
-            st.session_state.temp_dir = tempfile.mkdtemp()
-            mol_path = os.path.join(st.session_state.temp_dir, molfile.name)
-            
-            with open(mol_path, "wb") as f:
-                f.write(molfile.getbuffer())
-
-            jobname = os.path.splitext(os.path.basename(mol_path))[0]
-            progress_placeholder.info(f"📂 Procesando molécula: **{jobname}**")
-            
-            # Step 2: ORCA Execution (50%)
-            status_text.text("Iniciando cálculos ORCA...")
-            progress_bar.progress(30)
-            
-            try:
-                # Run ORCA with real-time output reading
-                process = Popen(
-                    ["python", RUN_ORCA, "--mol", mol_path, "--pdf", "--csv", "--view"],
-                    cwd=PROJECT_DIR,
-                    stdout=PIPE,
-                    stderr=PIPE,
-                    text=True,
-                    universal_newlines=True
-                )
-                
-                # Read output in real-time
-                while True:
-                    output = process.stdout.readline()
-                    if output == '' and process.poll() is not None:
-                        break
-                    if output:
-                        status_text.text(f"ORCA: {output.strip()}")
-                
-                # Get final results
-                _, stderr = process.communicate()
-                
-                if process.returncode != 0:
-                    raise Exception(f"ORCA failed: {stderr}")
-                
-                progress_bar.progress(50)
-                status_text.text("Cálculos ORCA completados...")
-                
-            except Exception as e:
-                cleanup_temp_files()
-                status_text.text("Error en cálculos ORCA")
-                st.error(f"Error en ORCA: {str(e)}")
-                # Detener procesamiento adicional en caso de error
-                raise Exception("Deteniendo procesamiento por error en ORCA")
-
-            # Step 3: Processing results (70%)
-            status_text.text("Procesando resultados...")
-            progress_bar.progress(70)
-
-            # Rutas de salida
-            pdf_path = f"results/reportes/{jobname}_IR.pdf"
-            csv_path = f"results/espectros/{jobname}_IR.csv"
-            png_path = f"results/espectros/{jobname}_IR.png"
-
-            # Step 4: Generating visualizations (90%)
-            status_text.text("Generando visualizaciones...")
-            progress_bar.progress(90)
-
-            col1, col2 = st.columns(2)
-
-            with col1:
-                # Espectros IR
-                st.subheader("📊 Espectros IR")
-                
-                # Rutas de los tres tipos de espectros
-                png_discrete = f"results/espectros/{jobname}_IR_discrete.png"
-                png_smooth = f"results/espectros/{jobname}_IR_smooth.png"
-                png_labeled = f"results/espectros/{jobname}_IR_labeled.png"
-                
-                # Mostrar los tres espectros
-                if os.path.exists(png_discrete):
-                    st.markdown("### Espectro de Picos Discretos")
-                    st.image(png_discrete, caption="Picos IR individuales")
-                
-                if os.path.exists(png_smooth):
-                    st.markdown("### Espectro Suavizado")
-                    st.image(png_smooth, caption="Espectro IR suavizado")
-                
-                if os.path.exists(png_labeled):
-                    st.markdown("### Espectro con Etiquetas")
-                    st.image(png_labeled, caption="Espectro IR con frecuencias etiquetadas")
-
-                # CSV (mantener la funcionalidad existente)
-                if os.path.exists(csv_path):
-                    st.subheader("📑 Frecuencias (CSV)")
-                    with open(csv_path) as f:
-                        st.download_button(
-                            label="⬇️ Descargar CSV",
-                            data=f,
-                            file_name=f"{jobname}_IR.csv",
-                            mime="text/csv",
-                        )
-
-            with col2:
-                # Molécula en 3D
-                st.subheader("🧩 Visualización 3D interactiva")
-                mostrar_molecula_3d(mol_path)
-
-                # PDF
-                if os.path.exists(pdf_path):
-                    st.subheader("📄 Reporte en PDF")
-                    with open(pdf_path, "rb") as f:
-                        st.download_button(
-                            label="⬇️ Descargar PDF",
-                            data=f,
-                            file_name=f"{jobname}_IR.pdf",
-                            mime="application/pdf",
-                        )
-
-            # Step 5: Complete (100%)
-            progress_bar.progress(100)
-            status_text.text("¡Proceso completado!")
-            time.sleep(1)  # Keep the 100% visible briefly
-            
-            # Clear progress indicators
-            status_text.empty()
-            progress_bar.empty()
-            progress_placeholder.empty()
-
-        except Exception as e:
-            progress_bar.empty()
-            status_text.empty()
-            cleanup_temp_files()
-            st.error(f"Error procesando el archivo: {str(e)}")
-            
+            if len(molfiles) == 1:
+                st.query_params["trabajo"] = servicio.encolar(molfiles[0].getvalue(), molfiles[0].name,
+                                                              usuario)
+            else:
+                ids = servicio.encolar_lote(((m.getvalue(), m.name) for m in molfiles), usuario)
+                st.query_params["lote"] = ",".join(ids)
+                st.query_params.pop("trabajo", None)
+        except servicio.LimiteExcedido as e:
+            st.warning(str(e))
+
+    # Lote en curso: se sondea hasta que todas sus moléculas terminen
+    lote = servicio.estados(st.query_params["lote"].split(",")) if "lote" in st.query_params else []
+    lote_activo = mostrar_lote(lote) if lote else False
+
+    trabajo = servicio.estado(st.query_params["trabajo"]) if "trabajo" in st.query_params else None
+    if trabajo is None and lote_activo:
+        time.sleep(INTERVALO_SONDEO)
+        st.rerun()
+    if trabajo is not None:
+        jobname = os.path.splitext(trabajo["nombre"])[0]
+        st.info(f"📂 Molécula: **{jobname}** · trabajo `{trabajo['id']}`")
+
+        if trabajo["estado"] in servicio.ACTIVOS:
+            st.progress(trabajo["progreso"])
+            if trabajo["estado"] == servicio.PENDIENTE:
+                st.text("En cola, esperando un worker libre...")
+            else:
+                st.text(f"ORCA: {trabajo['mensaje']}")
+            # Sondeo: se vuelve a consultar el estado sin bloquear la sesión
+            time.sleep(INTERVALO_SONDEO)
+            st.rerun()
+        elif trabajo["estado"] == servicio.ERROR:
+            st.error(f"Error en ORCA: {trabajo['mensaje']}")
+        else:
+            mostrar_resultados(trabajo)
+            if lote_activo:
+                time.sleep(INTERVALO_SONDEO)
+                st.rerun()
+
+    buscar_por_espectro()
+
 except Exception as e:
-    cleanup_temp_files()
     st.error(f"Error en la aplicación: {str(e)}")
@@ -0,0 +1,225 @@
+# base_espectros.py
+import os
+import re
+import time
+import uuid
+import argparse
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import almacen_salidas
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Raíz de la base columnar (se puede sobrescribir por entorno); relativa al
+# proyecto para que todos los trabajos, se ejecuten donde se ejecuten, escriban en ella
+BASE_DIR = os.environ.get("ORCA_BASE_DIR", os.path.join(PROJECT_DIR, "results", "base"))
+
+# Una fila por cálculo
+ESQUEMA_CALCULOS = pa.schema([
+    ("molecula", pa.string()),
+    ("metodo", pa.string()),
+    ("base", pa.string()),
+    ("input_hash", pa.string()),
+    ("energia", pa.float64()),
+    ("n_ir", pa.int32()),
+    ("n_raman", pa.int32()),
+    ("n_nmr", pa.int32()),
+    ("tiempo_orca_s", pa.float64()),
+    ("fecha", pa.timestamp("s")),
+    ("outfile", pa.string()),
+])
+
+# Una fila por pico (IR, Raman) o núcleo (NMR). Los núcleos van como tipo "nmr" si la
+# salida ya trae desplazamientos (tabla CHEMICAL SHIFTS antigua) o como
+# "nmr_apantallamiento" con el σ isotrópico de ORCA 5/6, que depende del nivel de teoría
+ESQUEMA_PICOS = pa.schema([
+    ("molecula", pa.string()),
+    ("metodo", pa.string()),
+    ("base", pa.string()),
+    ("input_hash", pa.string()),
+    ("tipo", pa.string()),
+    ("modo", pa.int32()),
+    ("elemento", pa.string()),
+    ("valor", pa.float64()),       # frecuencia (cm-1), desplazamiento δ o apantallamiento σ (ppm)
+    ("intensidad", pa.float64()),
+])
+
+# Columnas de partición: las consultas por molécula o método sólo abren sus carpetas
+PARTICION = ds.partitioning(pa.schema([("metodo", pa.string()), ("molecula", pa.string())]),
+                            flavor="hive")
+
+_tiempo_re = re.compile(
+    rb"TOTAL RUN TIME:\s*(\d+) days\s+(\d+) hours\s+(\d+) minutes\s+(\d+) seconds\s+(\d+) msec"
+)
+
+
+def metodo_y_base(inpfile):
+    """Método y base de la línea de palabras clave (!) de un .inp de ORCA."""
+    with open(inpfile) as f:
+        for linea in f:
+            if linea.startswith("!"):
+                palabras = linea[1:].split()
+                return (palabras[0] if palabras else "", palabras[1] if len(palabras) > 1 else "")
+    return "", ""
+
+
+def tiempo_orca(outfile):
+    """Segundos de TOTAL RUN TIME al final del .out (plano o comprimido), o None."""
+    m = _tiempo_re.search(almacen_salidas.leer_rango(outfile, -4096))
+    if not m:
+        return None
+    d, h, mi, s, ms = (int(g) for g in m.groups())
+    return ((d * 24 + h) * 60 + mi) * 60 + s + ms / 1000
+
+
+def _particion(carpeta, metodo, molecula, raiz):
+    return os.path.join(raiz, carpeta, f"metodo={metodo}", f"molecula={molecula}")
+
+
+def _escribir(tabla, carpeta, raiz):
+    """Añade un archivo parquet nuevo; nunca reescribe los existentes."""
+    metodo = tabla.column("metodo")[0].as_py()
+    molecula = tabla.column("molecula")[0].as_py()
+    destino = _particion(carpeta, metodo, molecula, raiz)
+    os.makedirs(destino, exist_ok=True)
+    nombre = f"part-{int(time.time())}-{uuid.uuid4().hex[:8]}.parquet"
+    # Escritura atómica: un lector nunca ve un archivo a medias
+    tmp = os.path.join(destino, f".{nombre}.tmp")
+    pq.write_table(tabla.drop_columns(["metodo", "molecula"]), tmp, compression="zstd")
+    os.replace(tmp, os.path.join(destino, nombre))
+
+
+def registrado(molecula, metodo, input_hash, raiz=None):
+    """True si el cálculo (mismo hash de entrada) ya está en la base; sólo lee su partición."""
+    destino = _particion("calculos", metodo or "desconocido", molecula, raiz or BASE_DIR)
+    if not input_hash or not os.path.isdir(destino):
+        return False
+    dataset = ds.dataset(destino, format="parquet", exclude_invalid_files=True, ignore_prefixes=["."])
+    return dataset.count_rows(filter=ds.field("input_hash") == input_hash) > 0
+
+
+def agregar_resultado(molecula, resultado, metodo="", base="", input_hash="",
+                      tiempo_orca_s=None, raiz=None):
+    """Añade a la base los resultados parseados (OrcaResult) de un cálculo.
+
+    Un cálculo ya registrado con el mismo `input_hash` (una repetición o un
+    acierto de caché) no se vuelve a añadir. Devuelve True si se añadió.
+    """
+    raiz = raiz or BASE_DIR
+    if registrado(molecula, metodo, input_hash, raiz):
+        return False
+    comunes = {"molecula": molecula, "metodo": metodo or "desconocido", "base": base,
+               "input_hash": input_hash}
+
+    calculo = pa.table({
+        **{k: [v] for k, v in comunes.items()},
+        "energia": [resultado.energia],
+        "n_ir": [int(resultado.ir_freqs.size)],
+        "n_raman": [int(resultado.raman_freqs.size)],
+        "n_nmr": [int(resultado.nmr_shift.size)],
+        "tiempo_orca_s": [tiempo_orca_s],
+        "fecha": [int(time.time())],
+        "outfile": [resultado.outfile],
+    }, schema=ESQUEMA_CALCULOS)
+
+    ir, raman, nmr = (resultado.espectro(t) for t in ("ir", "raman", "nmr"))
+    tipo_nmr = "nmr" if nmr.meta["magnitud"] == "desplazamiento" else "nmr_apantallamiento"
+    bloques = [
+        ("ir", ir.x, ir.intensidad, ir.modo, [""] * len(ir)),
+        ("raman", raman.x, raman.intensidad, raman.modo, [""] * len(raman)),
+        (tipo_nmr, nmr.x, np.full(len(nmr), np.nan), nmr.modo, nmr.elemento.tolist()),
+    ]
+    n = sum(b[1].size for b in bloques)
+    if n:
+        picos = pa.table({
+            **{k: pa.array([v] * n, pa.string()) for k, v in comunes.items()},
+            "tipo": np.concatenate([[t] * v.size for t, v, *_ in bloques]).astype(str),
+            "modo": np.concatenate([b[3] for b in bloques]).astype(np.int32),
+            "elemento": sum((list(b[4]) for b in bloques), []),
+            "valor": np.concatenate([b[1] for b in bloques]).astype(np.float64),
+            "intensidad": np.concatenate([b[2] for b in bloques]).astype(np.float64),
+        }, schema=ESQUEMA_PICOS)
+        _escribir(picos, "picos", raiz)
+    # La fila de `calculos` va la última: es la que marca el cálculo como registrado
+    _escribir(calculo, "calculos", raiz)
+    return True
+
+
+def _dataset(carpeta, esquema, raiz):
+    ruta = os.path.join(raiz or BASE_DIR, carpeta)
+    if not os.path.isdir(ruta):
+        return None
+    return ds.dataset(ruta, schema=esquema, format="parquet", partitioning=PARTICION,
+                      exclude_invalid_files=True, ignore_prefixes=["."])
+
+
+def _filtro(moleculas=None, metodos=None):
+    expr = None
+    for campo, valores in (("molecula", moleculas), ("metodo", metodos)):
+        if valores:
+            cond = ds.field(campo).isin(list(valores))
+            expr = cond if expr is None else expr & cond
+    return expr
+
+
+def consultar_picos(tipo="ir", vmin=None, vmax=None, columnas=("molecula", "metodo", "valor", "intensidad"),
+                    moleculas=None, metodos=None, raiz=None):
+    """Picos de un tipo en un rango de valores; sólo se leen las columnas pedidas.
+
+    Devuelve una tabla de pyarrow (usar .to_pandas() si hace falta).
+    """
+    dataset = _dataset("picos", ESQUEMA_PICOS, raiz)
+    if dataset is None:
+        return ESQUEMA_PICOS.empty_table().select(list(columnas))
+    expr = ds.field("tipo") == tipo
+    if vmin is not None:
+        expr &= ds.field("valor") >= vmin
+    if vmax is not None:
+        expr &= ds.field("valor") <= vmax
+    extra = _filtro(moleculas, metodos)
+    if extra is not None:
+        expr &= extra
+    return dataset.to_table(columns=list(columnas), filter=expr)
+
+
+def moleculas_con_banda(vmin, vmax, tipo="ir", metodos=None, raiz=None):
+    """Moléculas con al menos un pico entre vmin y vmax, con su pico más intenso en el rango."""
+    tabla = consultar_picos(tipo, vmin, vmax, ("molecula", "metodo", "valor", "intensidad"),
+                            metodos=metodos, raiz=raiz)
+    return tabla.group_by(["molecula", "metodo"]).aggregate(
+        [("intensidad", "max"), ("valor", "count")]
+    )
+
+
+def consultar_calculos(columnas=("molecula", "metodo", "base", "energia", "tiempo_orca_s"),
+                       moleculas=None, metodos=None, raiz=None):
+    """Metadatos de los cálculos registrados (sólo las columnas pedidas)."""
+    dataset = _dataset("calculos", ESQUEMA_CALCULOS, raiz)
+    if dataset is None:
+        return ESQUEMA_CALCULOS.empty_table().select(list(columnas))
+    return dataset.to_table(columns=list(columnas), filter=_filtro(moleculas, metodos))
+
+
+def agregado(columna, funcion="mean", por=("metodo",), tabla="calculos", raiz=None):
+    """Agregado (mean, min, max, count, sum...) de una columna agrupado por `por`."""
+    if tabla == "calculos":
+        datos = consultar_calculos((*por, columna), raiz=raiz)
+    else:
+        datos = consultar_picos(tabla, columnas=(*por, columna), raiz=raiz)
+    return datos.group_by(list(por)).aggregate([(columna, funcion)])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Consultas sobre la base de espectros")
+    parser.add_argument("--banda", nargs=2, type=float, metavar=("MIN", "MAX"),
+                        help="Moléculas con una banda en el rango (cm-1 o ppm)")
+    parser.add_argument("--tipo", default="ir", help="ir, raman, nmr o nmr_apantallamiento")
+    parser.add_argument("--raiz", default=None, help="Directorio de la base")
+    args = parser.parse_args()
+
+    if args.banda:
+        print(moleculas_con_banda(*args.banda, tipo=args.tipo, raiz=args.raiz).to_pandas())
+    else:
+        print(consultar_calculos(raiz=args.raiz).to_pandas())
@@ -0,0 +1,218 @@
+# benchmark.py
+"""Benchmark del pipeline (parse, ensanchado, gráficos, PDF y 3D) sin ORCA.
+
+Genera salidas sintéticas de ORCA de distintos tamaños, mide tiempo y pico
+de memoria de cada etapa, guarda los resultados en JSON y los compara con
+una línea base guardada.
+
+    python benchmark.py --tamanos pequeno mediano grande --salida bench.json
+    python benchmark.py --guardar-base benchmarks_base.json
+    python benchmark.py --comparar benchmarks_base.json
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import tracemalloc
+import numpy as np
+
+# Tamaños de las salidas sintéticas: átomos y relleno de iteraciones SCF (MB)
+TAMANOS = {
+    "pequeno": {"atomos": 3, "relleno_mb": 0},       # como data/water.xyz
+    "mediano": {"atomos": 24, "relleno_mb": 1},      # como data/glucosa.xyz
+    "grande": {"atomos": 400, "relleno_mb": 20},     # ~1200 modos
+    "enorme": {"atomos": 1200, "relleno_mb": 300},   # ~3600 modos, log de cientos de MB
+}
+ETAPAS = ("parse", "sidecar", "modos", "ensanchado", "ensanchado_lote", "graficos", "pdf", "3d")
+
+# Una etapa es regresión si tarda más que la base por este factor
+UMBRAL_REGRESION = 1.25
+
+
+def generar_xyz(path, n_atomos, semilla=0):
+    """Escribe una molécula sintética (cadena de C con H) de n_atomos."""
+    rng = np.random.default_rng(semilla)
+    elementos = ["C" if i % 3 == 0 else "H" for i in range(n_atomos)]
+    coords = np.cumsum(rng.normal(0, 0.9, (n_atomos, 3)), axis=0)
+    with open(path, "w") as f:
+        f.write(f"{n_atomos}\nMolécula sintética de benchmark\n")
+        for e, (x, y, z) in zip(elementos, coords):
+            f.write(f"{e}  {x:12.6f} {y:12.6f} {z:12.6f}\n")
+    return path
+
+
+def generar_salida(path, n_atomos, relleno_mb=0, semilla=0):
+    """Escribe un .out con la estructura de ORCA (SCF, frecuencias, modos normales, IR y Raman)."""
+    rng = np.random.default_rng(semilla)
+    n_modos = 3 * n_atomos
+    freqs = np.sort(rng.uniform(50, 3900, n_modos))
+    freqs[:6] = 0.0
+    with open(path, "w") as f:
+        f.write("                                 * O   R   C   A *\n\n")
+        # Relleno: iteraciones SCF hasta el tamaño pedido
+        f.write("SCF ITERATIONS\nITER       Energy         Delta-E        Max-DP      RMS-DP\n")
+        linea = "  {:3d}   -76.3205623400   0.000000001234  0.000012  0.000001\n"
+        escrito = 0
+        i = 0
+        while escrito < relleno_mb * 1024 * 1024:
+            bloque = "".join(linea.format(j % 1000) for j in range(i, i + 1000))
+            f.write(bloque)
+            escrito += len(bloque)
+            i += 1000
+        f.write("\n-------------------------   --------------------\n")
+        f.write("FINAL SINGLE POINT ENERGY      -76.320562340000\n")
+        f.write("-------------------------   --------------------\n\n")
+
+        f.write("-----------------------\nVIBRATIONAL FREQUENCIES\n-----------------------\n\n")
+        f.write("Scaling factor for frequencies =  1.000000000  (already applied!)\n\n")
+        for k, fr in enumerate(freqs):
+            f.write(f"   {k:4d}:   {fr:10.2f} cm**-1\n")
+
+        f.write("\n\n------------\nNORMAL MODES\n------------\n\n")
+        for c0 in range(0, n_modos, 6):
+            cols = range(c0, min(c0 + 6, n_modos))
+            f.write("      " + "".join(f"{c:12d}" for c in cols) + "\n")
+            datos = rng.uniform(-0.5, 0.5, (n_modos, len(cols)))
+            for r in range(n_modos):
+                f.write(f"{r:6d}" + "".join(f"{v:12.6f}" for v in datos[r]) + "\n")
+
+        f.write("\n-----------\nIR SPECTRUM\n-----------\n\n")
+        f.write(" Mode   freq       eps      Int      T**2         TX        TY        TZ\n")
+        f.write("----------------------------------------------------------------------------\n")
+        for k in range(6, n_modos):
+            f.write(f"  {k:4d}:   {freqs[k]:8.2f}   {rng.uniform(0, 0.05):.6f}   "
+                    f"{rng.uniform(0, 100):7.2f}  0.001000  ( 0.0  0.0  0.0)\n")
+
+        f.write("\n--------------\nRAMAN SPECTRUM\n--------------\n\n")
+        f.write(" Mode    freq (cm**-1)   Activity   Depolarization\n")
+        f.write("-------------------------------------------------------------------\n")
+        for k in range(6, n_modos):
+            f.write(f"  {k:4d}:   {freqs[k]:10.2f}   {rng.uniform(0, 200):12.6f}   0.750000\n")
+
+        f.write("\n                             ****ORCA TERMINATED NORMALLY****\n")
+        f.write("TOTAL RUN TIME: 0 days 0 hours 1 minutes 2 seconds 345 msec\n")
+    return path
+
+
+def medir(funcion, repeticiones=3):
+    """Ejecuta `funcion` varias veces; devuelve mediana, mínimo y pico de memoria (MB)."""
+    tiempos = []
+    pico = 0
+    for _ in range(repeticiones):
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - t0)
+        pico = max(pico, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return {
+        "tiempo_s": float(np.median(tiempos)),
+        "min_s": float(min(tiempos)),
+        "pico_mb": pico / 1024**2,
+        "repeticiones": repeticiones,
+    }
+
+
+def ejecutar(tamanos, etapas=ETAPAS, repeticiones=3, directorio=None):
+    """Genera los fixtures y mide cada etapa. Devuelve el dict de resultados."""
+    # Importaciones aquí para que el generador de fixtures no dependa de ellas
+    from parser_orca import parse_orca, leer_resultado, process_ir_data, parse_normal_modes
+    from ensanchamiento import ensanchar_lote
+    from spectra import plot_ir_variants
+    from visualize import save_molecule_html
+    from run_orca import generar_reporte_pdf
+
+    directorio = directorio or tempfile.mkdtemp(prefix="bench_orca_")
+    anterior = os.getcwd()
+    os.chdir(directorio)  # los módulos escriben en results/ relativo al cwd
+    resultados = {}
+    try:
+        for nombre in tamanos:
+            cfg = TAMANOS[nombre]
+            xyz = generar_xyz(f"{nombre}.xyz", cfg["atomos"])
+            out = generar_salida(f"{nombre}.out", cfg["atomos"], cfg["relleno_mb"])
+            tam_mb = os.path.getsize(out) / 1024**2
+            print(f"📦 {nombre}: {cfg['atomos']} átomos, {tam_mb:.1f} MB")
+
+            res = leer_resultado(out)  # deja escrito el sidecar para la etapa "sidecar"
+            ir = res.espectro("ir")
+            freqs, intens = ir.x, ir.intensidad
+            lote = [freqs * (1 + 0.01 * k) for k in range(100)]
+            x = np.linspace(400, 4000, 1000)
+            funciones = {
+                "parse": lambda: parse_orca(out),
+                "sidecar": lambda: leer_resultado(out),
+                "modos": lambda: parse_normal_modes(out, memmap=False),
+                "ensanchado": lambda: process_ir_data(freqs, intens),
+                "ensanchado_lote": lambda: ensanchar_lote(lote, [intens] * len(lote), x, ventana="auto"),
+                "graficos": lambda: plot_ir_variants(xyz, ir, procesos=1, forzar=True),
+                "pdf": lambda: generar_reporte_pdf(xyz, res.energia, ir),
+                "3d": lambda: save_molecule_html(xyz),
+            }
+            for etapa in etapas:
+                r = medir(funciones[etapa], repeticiones)
+                r["archivo_mb"] = tam_mb
+                resultados[f"{nombre}/{etapa}"] = r
+                print(f"   {etapa:16s} {r['tiempo_s'] * 1000:10.1f} ms   {r['pico_mb']:8.1f} MB")
+    finally:
+        os.chdir(anterior)
+
+    return {
+        "meta": {
+            "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "maquina": platform.node(),
+            "cpus": os.cpu_count(),
+        },
+        "resultados": resultados,
+    }
+
+
+def comparar(actual, base, umbral=UMBRAL_REGRESION):
+    """Compara con una línea base. Devuelve la lista de regresiones."""
+    regresiones = []
+    for clave, r in actual["resultados"].items():
+        b = base["resultados"].get(clave)
+        if not b:
+            continue
+        ratio = r["min_s"] / max(b["min_s"], 1e-9)
+        marca = "❌" if ratio > umbral else ("✅" if ratio < 1 / umbral else "  ")
+        print(f"{marca} {clave:28s} {b['min_s'] * 1000:10.1f} → {r['min_s'] * 1000:10.1f} ms  (x{ratio:.2f})")
+        if ratio > umbral:
+            regresiones.append(clave)
+    return regresiones
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark del pipeline ORCA sin ejecutar ORCA")
+    parser.add_argument("--tamanos", nargs="+", default=["pequeno", "mediano", "grande"],
+                        choices=list(TAMANOS), help="Tamaños de salida sintética")
+    parser.add_argument("--etapas", nargs="+", default=list(ETAPAS), choices=list(ETAPAS))
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--salida", default="bench_resultados.json", help="JSON de resultados")
+    parser.add_argument("--guardar-base", metavar="JSON", help="Guardar también como línea base")
+    parser.add_argument("--comparar", metavar="JSON", help="Comparar con una línea base")
+    parser.add_argument("--umbral", type=float, default=UMBRAL_REGRESION)
+    args = parser.parse_args()
+
+    actual = ejecutar(args.tamanos, args.etapas, args.repeticiones)
+    with open(args.salida, "w") as f:
+        json.dump(actual, f, indent=2)
+    print(f"✅ Resultados guardados en {args.salida}")
+
+    if args.guardar_base:
+        with open(args.guardar_base, "w") as f:
+            json.dump(actual, f, indent=2)
+        print(f"✅ Línea base guardada en {args.guardar_base}")
+
+    if args.comparar:
+        with open(args.comparar) as f:
+            base = json.load(f)
+        regresiones = comparar(actual, base, args.umbral)
+        if regresiones:
+            print(f"❌ {len(regresiones)} etapas más lentas que la base")
+            sys.exit(1)
@@ -0,0 +1,380 @@
+# busqueda_espectros.py
+"""Búsqueda de moléculas calculadas por similitud con un espectro experimental.
+
+Los espectros de la biblioteca (base_espectros) se ensanchan una sola vez
+sobre una rejilla común y se guardan como filas de norma 1 en una matriz
+float32 mapeada en disco. Una consulta es un producto matriz-vector (una
+columna por cada desplazamiento probado), opcionalmente sobre una proyección
+PCA de pocas componentes con reordenado exacto de los mejores candidatos.
+
+    python busqueda_espectros.py --actualizar --pca 64
+    python busqueda_espectros.py --buscar experimental.csv --escala 0.967 --tolerancia 20
+"""
+import os
+import io
+import json
+import fcntl
+import argparse
+import tempfile
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+import base_espectros
+from ensanchamiento import ensanchar_lote, FWHM_DEFECTO
+from parser_orca import process_ir_data
+
+# Directorio de los índices, uno por tipo de espectro (se puede sobrescribir por entorno)
+INDICE_DIR = os.environ.get("ORCA_INDICE_DIR",
+                            os.path.join(base_espectros.PROJECT_DIR, "results", "indice_espectros"))
+
+# Rejilla común por defecto: 400-4000 cm-1 cada 2 cm-1
+INICIO, FIN, PUNTOS = 400.0, 4000.0, 1801
+METRICAS = ("coseno", "correlacion")
+LOTE = 256                  # espectros ensanchados a la vez al actualizar
+CANDIDATOS_PCA = 50         # filas que se reordenan con el espectro completo tras la búsqueda PCA
+
+
+def leer_espectro(archivo):
+    """(x, y) de un CSV/TXT con dos columnas numéricas (separador autodetectado).
+
+    `archivo` es una ruta o un archivo abierto (p. ej. una subida de la web).
+    Sirve tanto para espectros experimentales como para las tablas de
+    frecuencias que escribe spectra.export_csv.
+    """
+    if hasattr(archivo, "read"):
+        texto = archivo.read()
+    else:
+        with open(archivo, "rb") as f:
+            texto = f.read()
+    if isinstance(texto, bytes):
+        texto = texto.decode("utf-8", errors="replace")
+    # Sin cabecera fija: las filas no numéricas (cabecera incluida) se descartan
+    df = pd.read_csv(io.StringIO(texto), sep=None, engine="python", comment="#", header=None)
+    numericas = df.apply(pd.to_numeric, errors="coerce").dropna(axis=1, how="all").dropna()
+    if numericas.shape[1] < 2:
+        raise ValueError(f"{getattr(archivo, 'name', archivo)}: se necesitan dos columnas numéricas (número de onda, intensidad)")
+    x = numericas.iloc[:, 0].to_numpy(np.float64)
+    y = numericas.iloc[:, 1].to_numpy(np.float64)
+    orden = np.argsort(x)
+    return x[orden], y[orden]
+
+
+def absorbancia(y):
+    """Convierte transmitancia (0-1 o 0-100 %) en absorbancia."""
+    t = np.asarray(y, dtype=np.float64)
+    if t.max() > 1.5:
+        t = t / 100.0
+    return -np.log10(np.clip(t, 1e-4, 1.0))
+
+
+class IndiceEspectros:
+    """Matriz de espectros ensanchados de la biblioteca, mapeada en disco.
+
+    En <directorio>/<tipo>/ se guardan matriz.f32 (filas de norma 1, con
+    capacidad de sobra para añadir sin reescribir), sumas.npy (suma de cada
+    fila, para la correlación), meta.json (rejilla y claves (molécula,
+    método, hash de entrada) de cada fila) y, si se ajustó PCA, pca.npz y
+    proyeccion.f32. La rejilla, el ancho y la forma de línea se fijan al
+    crear el índice; un índice existente conserva los suyos.
+    """
+
+    def __init__(self, tipo="ir", directorio=None, inicio=INICIO, fin=FIN, puntos=PUNTOS,
+                 fwhm=FWHM_DEFECTO, forma="gauss"):
+        self.tipo = tipo
+        self.dir = os.path.join(directorio or INDICE_DIR, tipo)
+        self.meta = {"version": 1, "tipo": tipo, "rejilla": [inicio, fin, puntos], "fwhm": float(fwhm),
+                     "forma": forma, "n": 0, "capacidad": 0, "claves": [], "pca": 0}
+        self.claves, self.matriz, self.sumas, self.pca = [], None, np.empty(0), None
+        self._mtime = None
+        self._cargar()
+
+    # ----- Archivos -----
+    def _ruta(self, nombre):
+        return os.path.join(self.dir, nombre)
+
+    @property
+    def x(self):
+        inicio, fin, puntos = self.meta["rejilla"]
+        return np.linspace(inicio, fin, int(puntos))
+
+    def __len__(self):
+        return self.meta["n"]
+
+    def _cargar(self):
+        """Relee meta.json y reabre las matrices si el índice cambió en disco."""
+        try:
+            mtime = os.stat(self._ruta("meta.json")).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._mtime:
+            return
+        with open(self._ruta("meta.json")) as f:
+            self.meta = json.load(f)
+        self._mtime = mtime
+        n, puntos = self.meta["n"], int(self.meta["rejilla"][2])
+        self.claves = [tuple(c) for c in self.meta["claves"]]
+        self.matriz = np.memmap(self._ruta("matriz.f32"), np.float32, "r", shape=(n, puntos)) if n else None
+        self.sumas = np.load(self._ruta("sumas.npy")) if n else np.empty(0)
+        self.pca = None
+        if self.meta["pca"] and n:
+            with np.load(self._ruta("pca.npz")) as datos:
+                self.pca = {"media": datos["media"], "componentes": datos["componentes"]}
+            self.proyeccion = np.memmap(self._ruta("proyeccion.f32"), np.float32, "r",
+                                        shape=(n, self.meta["pca"]))
+
+    def _guardar_meta(self):
+        fd, tmp = tempfile.mkstemp(dir=self.dir, prefix=".meta-")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp, self._ruta("meta.json"))
+
+    @contextmanager
+    def _bloqueo(self):
+        """Un solo proceso modifica el índice a la vez."""
+        os.makedirs(self.dir, exist_ok=True)
+        with open(self._ruta(".lock"), "w") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                self._cargar()
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _reservar(ruta, filas, columnas):
+        """Memmap escribible de (filas, columnas) float32, agrandando el archivo si hace falta."""
+        with open(ruta, "ab") as f:
+            if f.tell() < filas * columnas * 4:
+                f.truncate(filas * columnas * 4)
+        return np.memmap(ruta, np.float32, "r+", shape=(filas, columnas))
+
+    # ----- Construcción -----
+    def ensanchar(self, lista_freqs, lista_intens):
+        """Filas del índice (norma 1, float32) para listas de picos."""
+        y = ensanchar_lote(lista_freqs, lista_intens, self.x, self.meta["fwhm"], self.meta["forma"],
+                           ventana="auto")
+        normas = np.linalg.norm(y, axis=1, keepdims=True)
+        np.divide(y, normas, out=y, where=normas > 0)
+        return y.astype(np.float32)
+
+    def agregar(self, claves, lista_freqs, lista_intens):
+        """Añade espectros de picos al índice; las claves ya presentes se ignoran.
+
+        Devuelve el número de filas añadidas.
+        """
+        with self._bloqueo():
+            existentes = set(self.claves) if self.meta["n"] else set()
+            nuevas = [(tuple(c), f, i) for c, f, i in zip(claves, lista_freqs, lista_intens)
+                      if tuple(c) not in existentes]
+            if not nuevas:
+                return 0
+            n, puntos = self.meta["n"], int(self.meta["rejilla"][2])
+            total = n + len(nuevas)
+            capacidad = max(self.meta["capacidad"], 1024)
+            while capacidad < total:
+                capacidad *= 2
+            matriz = self._reservar(self._ruta("matriz.f32"), capacidad, puntos)
+            sumas = np.empty(total)
+            sumas[:n] = self.sumas
+            k = self.meta["pca"]
+            if k:
+                proyeccion = self._reservar(self._ruta("proyeccion.f32"), capacidad, k)
+            for i in range(0, len(nuevas), LOTE):
+                lote = nuevas[i:i + LOTE]
+                filas = self.ensanchar([b[1] for b in lote], [b[2] for b in lote])
+                ini = n + i
+                matriz[ini:ini + len(lote)] = filas
+                sumas[ini:ini + len(lote)] = filas.sum(axis=1)
+                if k:
+                    proyeccion[ini:ini + len(lote)] = (filas - self.pca["media"]) @ self.pca["componentes"].T
+            matriz.flush()
+            if k:
+                proyeccion.flush()
+            np.save(self._ruta("sumas.npy"), sumas)
+            # meta.json se escribe al final: hasta entonces los lectores ven el índice anterior
+            self.meta.update(n=total, capacidad=capacidad,
+                             claves=self.meta["claves"] + [list(c) for c, _, _ in nuevas])
+            self._guardar_meta()
+            self._mtime = None
+            self._cargar()
+            return len(nuevas)
+
+    def actualizar(self, raiz=None):
+        """Añade los cálculos de la base de espectros que aún no están en el índice."""
+        calculos = base_espectros.consultar_calculos(("molecula", "metodo", "input_hash"), raiz=raiz)
+        presentes = set(self.claves) if self.meta["n"] else set()
+        pendientes = {tuple(v or "" for v in c.values()) for c in calculos.to_pylist()} - presentes
+        if not pendientes:
+            print(f"✅ Índice {self.tipo} al día ({len(self)} espectros)")
+            return 0
+        picos = base_espectros.consultar_picos(
+            self.tipo, columnas=("molecula", "metodo", "input_hash", "valor", "intensidad"),
+            moleculas={c[0] for c in pendientes}, raiz=raiz,
+        ).to_pandas().fillna({"metodo": "", "input_hash": ""})
+        claves, freqs, intens = [], [], []
+        for clave, grupo in picos.groupby(["molecula", "metodo", "input_hash"], sort=True):
+            if clave in pendientes:
+                claves.append(clave)
+                freqs.append(grupo["valor"].to_numpy())
+                intens.append(grupo["intensidad"].to_numpy())
+        n = self.agregar(claves, freqs, intens)
+        print(f"✅ Índice {self.tipo}: {n} espectros nuevos, {len(self)} en total")
+        return n
+
+    def ajustar_pca(self, componentes=64, muestra=5000, semilla=0):
+        """Ajusta PCA sobre una muestra de filas y proyecta todo el índice.
+
+        Las filas que se añadan después se proyectan con las mismas
+        componentes. Con componentes=0 se desactiva la PCA.
+        """
+        with self._bloqueo():
+            n = self.meta["n"]
+            if not n or not componentes:
+                self.meta["pca"] = 0
+                self._guardar_meta()
+                self._mtime = None
+                self._cargar()
+                return 0
+            rng = np.random.default_rng(semilla)
+            idx = np.sort(rng.choice(n, min(n, muestra), replace=False))
+            datos = np.asarray(self.matriz[idx], dtype=np.float64)
+            media = datos.mean(axis=0)
+            _, _, vt = np.linalg.svd(datos - media, full_matrices=False)
+            k = min(componentes, vt.shape[0])
+            comp = vt[:k].astype(np.float32)
+            media = media.astype(np.float32)
+            np.savez(self._ruta("pca.npz"), media=media, componentes=comp)
+            fd, tmp = tempfile.mkstemp(dir=self.dir, prefix=".proyeccion-")
+            os.close(fd)
+            try:
+                proyeccion = self._reservar(tmp, self.meta["capacidad"], k)
+                for i in range(0, n, 4096):
+                    fin = min(i + 4096, n)
+                    proyeccion[i:fin] = (self.matriz[i:fin] - media) @ comp.T
+                proyeccion.flush()
+                del proyeccion
+                os.replace(tmp, self._ruta("proyeccion.f32"))
+            except BaseException:
+                os.unlink(tmp)
+                raise
+            self.meta["pca"] = k
+            self._guardar_meta()
+            self._mtime = None
+            self._cargar()
+            print(f"✅ PCA con {k} componentes sobre {len(idx)} espectros")
+            return k
+
+    # ----- Consulta -----
+    def consultas(self, x, y, escala=1.0, tolerancia=0.0, paso=None, picos=None):
+        """Matriz (desplazamientos × puntos) con el espectro experimental llevado a la rejilla.
+
+        El espectro calculado escalado coincide con el experimental cuando
+        E(escala·x + d) ≈ S(x): para cada desplazamiento d en ±tolerancia se
+        muestrea el experimental en escala·x + d. Si `picos` (por defecto,
+        cuando los puntos están muy separados) el archivo es una lista de
+        picos y se ensancha antes con process_ir_data.
+        """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        rejilla = self.x
+        dx = rejilla[1] - rejilla[0]
+        paso = paso or dx
+        desplazamientos = np.arange(-tolerancia, tolerancia + paso / 2, paso) if tolerancia > 0 else np.zeros(1)
+        if picos is None:
+            picos = x.size < 2 or np.median(np.diff(x)) > 4 * dx
+        if picos:
+            lo = escala * rejilla[0] - tolerancia - 5 * self.meta["fwhm"]
+            hi = escala * rejilla[-1] + tolerancia + 5 * self.meta["fwhm"]
+            x, y, _ = process_ir_data(x, y, lo, hi, int((hi - lo) / dx) + 1, fwhm=self.meta["fwhm"],
+                                      forma=self.meta["forma"], ventana="auto")
+        q = np.stack([np.interp(escala * rejilla + d, x, y, left=0.0, right=0.0) for d in desplazamientos])
+        return q.astype(np.float32), desplazamientos
+
+    def buscar(self, x, y, n=10, metrica="coseno", escala=1.0, tolerancia=0.0, paso=None,
+               picos=None, usar_pca=True):
+        """Las `n` filas más parecidas al espectro (x, y).
+
+        metrica="coseno" compara las formas tal cual; "correlacion" resta
+        antes la media de cada espectro (insensible a una línea base
+        constante). Con PCA la búsqueda se hace sobre la proyección y los
+        CANDIDATOS_PCA mejores se reordenan con el espectro completo.
+        Devuelve una lista de dicts {molecula, metodo, input_hash, similitud, desplazamiento}.
+        """
+        if metrica not in METRICAS:
+            raise ValueError(f"Métrica desconocida: {metrica} (opciones: {', '.join(METRICAS)})")
+        self._cargar()
+        if not self.meta["n"]:
+            return []
+        q, desplazamientos = self.consultas(x, y, escala, tolerancia, paso, picos)
+        if metrica == "correlacion":
+            q -= q.mean(axis=1, keepdims=True)
+        normas = np.linalg.norm(q, axis=1, keepdims=True)
+        np.divide(q, normas, out=q, where=normas > 0)
+
+        def puntuar(filas, productos):
+            if metrica == "correlacion":
+                # |a - media(a)| de filas de norma 1: sqrt(1 - suma²/puntos)
+                centradas = np.sqrt(np.clip(1.0 - self.sumas[filas] ** 2 / q.shape[1], 1e-12, None))
+                productos = productos / centradas[:, None]
+            return productos
+
+        if usar_pca and self.pca is not None and self.meta["n"] > CANDIDATOS_PCA:
+            aprox = self.proyeccion @ (self.pca["componentes"] @ q.T) + self.pca["media"] @ q.T
+            aprox = puntuar(np.arange(self.meta["n"]), aprox).max(axis=1)
+            m = max(n, CANDIDATOS_PCA)
+            filas = np.sort(np.argpartition(-aprox, min(m, aprox.size) - 1)[:m])
+            puntos = puntuar(filas, self.matriz[filas] @ q.T)
+        else:
+            filas = np.arange(self.meta["n"])
+            puntos = puntuar(filas, self.matriz @ q.T)
+
+        mejor = puntos.argmax(axis=1)
+        similitud = puntos[np.arange(filas.size), mejor]
+        orden = np.argsort(-similitud)[:n]
+        return [
+            {"molecula": self.claves[filas[i]][0], "metodo": self.claves[filas[i]][1],
+             "input_hash": self.claves[filas[i]][2], "similitud": float(similitud[i]),
+             "desplazamiento": float(desplazamientos[mejor[i]])}
+            for i in orden
+        ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Búsqueda de moléculas por similitud espectral")
+    parser.add_argument("--tipo", default="ir", choices=["ir", "raman"], help="Tipo de espectro")
+    parser.add_argument("--actualizar", action="store_true",
+                        help="Añadir al índice los cálculos nuevos de la base de espectros")
+    parser.add_argument("--pca", type=int, metavar="K", default=None,
+                        help="Ajustar PCA con K componentes (0 = sin PCA)")
+    parser.add_argument("--agregar-csv", nargs="+", metavar="CSV", default=None,
+                        help="Añadir tablas de frecuencias de export_csv (molécula = nombre del archivo)")
+    parser.add_argument("--buscar", metavar="ESPECTRO", help="CSV/TXT con el espectro experimental")
+    parser.add_argument("-n", type=int, default=10, help="Número de resultados")
+    parser.add_argument("--metrica", default="coseno", choices=METRICAS)
+    parser.add_argument("--escala", type=float, default=1.0,
+                        help="Factor de escala de las frecuencias calculadas (p. ej. 0.967)")
+    parser.add_argument("--tolerancia", type=float, default=0.0,
+                        help="Desplazamiento máximo probado (cm-1)")
+    parser.add_argument("--transmitancia", action="store_true",
+                        help="El espectro está en transmitancia (se convierte a absorbancia)")
+    parser.add_argument("--raiz", default=None, help="Directorio de la base de espectros")
+    parser.add_argument("--directorio", default=None, help="Directorio de los índices")
+    args = parser.parse_args()
+
+    indice = IndiceEspectros(args.tipo, args.directorio)
+    if args.actualizar:
+        indice.actualizar(args.raiz)
+    if args.agregar_csv:
+        tablas = [leer_espectro(c) for c in args.agregar_csv]
+        claves = [(os.path.splitext(os.path.basename(c))[0], "csv", "") for c in args.agregar_csv]
+        print(f"✅ {indice.agregar(claves, [t[0] for t in tablas], [t[1] for t in tablas])} espectros añadidos")
+    if args.pca is not None:
+        indice.ajustar_pca(args.pca)
+    if args.buscar:
+        x, y = leer_espectro(args.buscar)
+        if args.transmitancia:
+            y = absorbancia(y)
+        resultados = indice.buscar(x, y, args.n, args.metrica, args.escala, args.tolerancia)
+        for i, r in enumerate(resultados, 1):
+            print(f"{i:3d}. {r['molecula']:30s} {r['metodo']:12s} {r['similitud']:.4f}"
+                  f"  (desplazamiento {r['desplazamiento']:+.1f} cm-1)")
@@ -0,0 +1,181 @@
+# cache_orca.py
+import os
+import re
+import shutil
+import hashlib
+import tempfile
+from parser_orca import guardar_npz, cargar_npz, VERSION_SIDECAR
+import almacen_salidas
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Directorio y tamaño máximo de la caché (se pueden sobrescribir por entorno).
+# Relativo al proyecto, no al directorio actual: los trabajos de la web y de la
+# cola se ejecutan en su propia carpeta y deben compartir la misma caché
+CACHE_DIR = os.environ.get("ORCA_CACHE_DIR", os.path.join(PROJECT_DIR, "cache"))
+CACHE_MAX_BYTES = int(os.environ.get("ORCA_CACHE_MAX_BYTES", 2 * 1024**3))
+
+SALIDA = "salida.out"
+RESULTADO = "resultado.npz"
+
+# Bloques que sólo afectan a los recursos, no al resultado del cálculo
+_recursos_re = re.compile(r"^%(pal|maxcore)\b", re.IGNORECASE)
+# Función de onda inicial (MORead): cambia el punto de partida del SCF, no el resultado.
+# Así un paso de una cadena sigue acertando aunque se haya podado el .gbw del anterior
+_guess_re = re.compile(r"^%moinp\b", re.IGNORECASE)
+_coord_re = re.compile(r"^\s*([A-Za-z]{1,2}\d*)\s+(\S+)\s+(\S+)\s+(\S+)\s*$")
+
+
+def _normalizar_inp(texto):
+    """Normaliza un .inp para que entradas equivalentes den el mismo hash."""
+    lineas = []
+    en_recursos = False
+    for linea in texto.splitlines():
+        linea = linea.split("#", 1)[0].strip()
+        m = _recursos_re.match(linea)
+        if m:
+            # %maxcore ocupa una línea; %pal puede abarcar varias hasta "end"
+            en_recursos = m.group(1).lower() == "pal" and not re.search(r"\bend$", linea, re.I)
+            continue
+        if en_recursos:
+            en_recursos = linea.lower() != "end"
+            continue
+        if not linea or _guess_re.match(linea):
+            continue
+        if linea.startswith("!"):
+            # Palabras clave: sin distinguir mayúsculas ni orden de espacios
+            linea = "! " + " ".join(p for p in linea[1:].upper().split() if p != "MOREAD")
+        else:
+            m = _coord_re.match(linea)
+            try:
+                coords = [float(v) for v in m.groups()[1:]] if m else None
+            except ValueError:
+                coords = None
+            if coords:
+                linea = m.group(1).capitalize() + "".join(f" {c:.6f}" for c in coords)
+            else:
+                linea = " ".join(linea.split())
+        lineas.append(linea)
+    return "\n".join(lineas)
+
+
+def huella_orca(orca_bin):
+    """Identifica la versión de ORCA por la ruta, tamaño y fecha del ejecutable."""
+    try:
+        st = os.stat(orca_bin)
+        return f"{os.path.realpath(orca_bin)}:{st.st_size}:{st.st_mtime_ns}"
+    except OSError:
+        return orca_bin
+
+
+# Variables de entorno con rutas de almacenes compartidos entre trabajos
+RUTAS_COMPARTIDAS = ("ORCA_CACHE_DIR", "ORCA_BASE_DIR", "ORCA_INDICE_DIR", "ORCA_METRICAS_DIR",
+                     "ORCA_NMR_REFERENCIAS", "ORCA_COSTES", "ORCA_JOBS_DB")
+
+
+def entorno_hijo():
+    """Entorno para un proceso hijo que se ejecuta en otra carpeta.
+
+    Las rutas de RUTAS_COMPARTIDAS dadas como relativas se resuelven contra
+    el directorio actual del padre, de modo que el hijo usa los mismos
+    almacenes; la caché se pasa siempre como ruta absoluta.
+    """
+    entorno = dict(os.environ)
+    for variable in RUTAS_COMPARTIDAS:
+        if entorno.get(variable):
+            entorno[variable] = os.path.abspath(entorno[variable])
+    entorno["ORCA_CACHE_DIR"] = os.path.abspath(CACHE_DIR)
+    return entorno
+
+
+def clave_entrada(inpfile, orca_bin):
+    """Hash SHA-256 del .inp normalizado y de la versión de ORCA."""
+    with open(inpfile) as f:
+        texto = _normalizar_inp(f.read())
+    h = hashlib.sha256()
+    h.update(huella_orca(orca_bin).encode())
+    h.update(b"\0")
+    h.update(texto.encode())
+    return h.hexdigest()
+
+
+def _entrada_dir(clave, cache_dir=None):
+    return os.path.join(cache_dir or CACHE_DIR, clave[:2], clave)
+
+
+def en_cache(clave, cache_dir=None):
+    """True si la caché tiene la salida de esa entrada."""
+    return almacen_salidas.existe(os.path.join(_entrada_dir(clave, cache_dir), SALIDA))
+
+
+def recuperar_salida(clave, outfile, cache_dir=None):
+    """Copia el .out cacheado a `outfile`. Devuelve True si había acierto.
+
+    Si la entrada guarda la salida comprimida, se copia comprimida (con su
+    índice) junto a la ruta lógica `outfile`, sin descomprimirla.
+    """
+    entrada = _entrada_dir(clave, cache_dir)
+    origen = os.path.join(entrada, SALIDA)
+    if not almacen_salidas.existe(origen):
+        return False
+    almacen_salidas.copiar(origen, outfile)
+    os.utime(entrada)  # marca de uso para la política LRU
+    return True
+
+
+def cargar_resultado(clave, cache_dir=None):
+    """Devuelve el OrcaResult cacheado o None (también si lo escribió otra versión del parser)."""
+    ruta = os.path.join(_entrada_dir(clave, cache_dir), RESULTADO)
+    if not os.path.exists(ruta):
+        return None
+    resultado, meta = cargar_npz(ruta)
+    return resultado if meta.get("version") == VERSION_SIDECAR else None
+
+
+def guardar(clave, outfile=None, resultado=None, cache_dir=None, max_bytes=None):
+    """Guarda la salida y/o el resultado parseado bajo `clave` y aplica la poda LRU.
+
+    La salida se guarda comprimida (almacen_salidas.FORMATO) salvo con ORCA_COMPRESION=no.
+    """
+    entrada = _entrada_dir(clave, cache_dir)
+    os.makedirs(os.path.dirname(entrada), exist_ok=True)
+    # Se escribe en un temporal y se renombra para no dejar entradas a medias
+    tmp = tempfile.mkdtemp(dir=os.path.dirname(entrada), prefix=".tmp-")
+    try:
+        if os.path.isdir(entrada):
+            for nombre in os.listdir(entrada):
+                shutil.copy2(os.path.join(entrada, nombre), tmp)
+        if outfile:
+            almacen_salidas.copiar(outfile, os.path.join(tmp, SALIDA), comprimir=True)
+        if resultado is not None:
+            guardar_npz(os.path.join(tmp, RESULTADO), resultado, {"version": VERSION_SIDECAR})
+        shutil.rmtree(entrada, ignore_errors=True)
+        os.rename(tmp, entrada)
+    except OSError:
+        # Otro proceso escribió la misma entrada a la vez: se conserva la suya
+        shutil.rmtree(tmp, ignore_errors=True)
+    podar(max_bytes, cache_dir)
+
+
+def podar(max_bytes=None, cache_dir=None):
+    """Elimina las entradas menos usadas hasta que la caché quepa en `max_bytes`."""
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    raiz = cache_dir or CACHE_DIR
+    entradas = []
+    total = 0
+    for prefijo in os.scandir(raiz) if os.path.isdir(raiz) else []:
+        if not prefijo.is_dir():
+            continue
+        for entrada in os.scandir(prefijo.path):
+            if entrada.name.startswith(".tmp-") or not entrada.is_dir():
+                continue
+            tam = sum(f.stat().st_size for f in os.scandir(entrada.path))
+            entradas.append((entrada.stat().st_mtime, tam, entrada.path))
+            total += tam
+
+    for _, tam, ruta in sorted(entradas):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(ruta, ignore_errors=True)
+        total -= tam
+    return total
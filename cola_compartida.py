@@ -0,0 +1,381 @@
+# cola_compartida.py
+"""Cola de trabajos ORCA en un directorio compartido entre varios hosts.
+
+Cualquier número de workers (`python run_orca.py --worker COLA`), en una o
+varias máquinas que vean el mismo sistema de archivos, toman trabajos de
+(primero los de menor coste estimado que quepan en sus núcleos libres, ver
+modelo_costes.py):
+
+    <cola>/pendientes/<id>.json          trabajos esperando
+    <cola>/en_curso/<id>@<worker>.json   arrendamiento de un worker; su mtime es el latido
+    <cola>/hechos/<id>.json
+    <cola>/fallidos/<id>.json
+
+Todas las transiciones son os.rename dentro del mismo sistema de archivos,
+que es atómico también en NFS: de varios workers que intentan tomar el mismo
+trabajo sólo uno lo consigue. El worker renueva su arrendamiento tocando el
+archivo; si deja de hacerlo durante más de TTL segundos (el host murió o
+perdió la red), cualquier otro worker lo devuelve a pendientes/. Un worker
+que descubre que perdió su arrendamiento detiene el cálculo y lo descarta.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import signal
+import socket
+import argparse
+import subprocess
+from dataclasses import dataclass
+import entradas_orca
+import modelo_costes
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+RUN_ORCA = os.path.join(PROJECT_DIR, "run_orca.py")
+
+# Configuración (se puede sobrescribir por entorno)
+TTL = float(os.environ.get("ORCA_COLA_TTL", 120))             # segundos sin latido
+MAX_INTENTOS = int(os.environ.get("ORCA_COLA_INTENTOS", 3))   # arrendamientos vencidos antes de fallar
+VENTANA = int(os.environ.get("ORCA_COLA_VENTANA", 100))       # pendientes más antiguos que se planifican
+
+PENDIENTES, EN_CURSO, HECHOS, FALLIDOS = "pendientes", "en_curso", "hechos", "fallidos"
+ESTADOS = (PENDIENTES, EN_CURSO, HECHOS, FALLIDOS)
+
+
+def identificador_worker():
+    """Nombre único del worker en el clúster: host y pid."""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def preparar(cola):
+    for estado in ESTADOS:
+        os.makedirs(os.path.join(cola, estado), exist_ok=True)
+
+
+def _json_de(ruta):
+    """Trabajos de un estado, ordenados por id (orden de llegada)."""
+    return sorted(n for n in os.listdir(ruta) if n.endswith(".json"))
+
+
+def encolar(cola, molfile, job="optfreq", opciones=(), nucleos=None):
+    """Añade un trabajo a la cola. Devuelve su id.
+
+    `molfile` debe estar en el sistema de archivos compartido; `opciones` son
+    argumentos extra de run_orca.py (p. ej. ["--pdf", "--csv"]). `nucleos`
+    (por defecto, los de este host) acota los núcleos de la estimación de coste.
+    """
+    preparar(cola)
+    # Prefijo de tiempo: el orden alfabético de los ids es el de llegada
+    trabajo_id = f"{time.time_ns():020d}-{uuid.uuid4().hex[:6]}"
+    trabajo = {"id": trabajo_id, "molfile": os.path.abspath(molfile), "job": job,
+               "opciones": list(opciones), "intentos": 0, "creado": time.time()}
+    # Coste estimado para que los workers ejecuten primero lo más corto
+    tarea = modelo_costes.estimar_trabajo(molfile, ["--job", job, *opciones], nucleos)
+    if tarea is not None:
+        trabajo["estimacion"] = {"tiempo_s": tarea.tiempo_s, "nucleos": tarea.nucleos,
+                                 "memoria_mb": tarea.memoria_mb}
+    # Se escribe fuera de pendientes/ y se publica con rename: nadie ve un JSON a medias
+    tmp = os.path.join(cola, f".{trabajo_id}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(trabajo, f)
+    os.rename(tmp, os.path.join(cola, PENDIENTES, f"{trabajo_id}.json"))
+    return trabajo_id
+
+
+def _ahora(cola, worker):
+    """Hora según el servidor de archivos (mtime de un archivo recién tocado).
+
+    Los latidos se comparan con esta hora y no con el reloj local, que puede
+    ir desfasado respecto a los de otros hosts.
+    """
+    reloj = os.path.join(cola, f".reloj-{worker}")
+    with open(reloj, "a"):
+        pass
+    os.utime(reloj)
+    return os.stat(reloj).st_mtime
+
+
+def _modificar(lease, **campos):
+    """Actualiza el JSON de un arrendamiento propio. Devuelve el trabajo o None si ya no existe."""
+    try:
+        # r+ y no w: si el arrendamiento se perdió no se crea uno fantasma
+        with open(lease, "r+") as f:
+            trabajo = json.load(f)
+            trabajo.update(campos)
+            f.seek(0)
+            json.dump(trabajo, f)
+            f.truncate()
+        return trabajo
+    except FileNotFoundError:
+        return None
+
+
+def _tarea(trabajo, cores, nucleos_defecto=1):
+    """Tarea de planificación de un trabajo de la cola, con sus núcleos limitados a `cores`."""
+    estimacion = trabajo.get("estimacion") or {}
+    return modelo_costes.Tarea(trabajo["id"], min(estimacion.get("nucleos", nucleos_defecto), cores),
+                               estimacion.get("tiempo_s", 0.0), estimacion.get("memoria_mb", 0.0),
+                               trabajo.get("creado", 0.0))
+
+
+def _planificados(pendientes, nombres, libres, en_curso, cores, nucleos_defecto):
+    """`nombres` en el orden del planificador (sólo los que caben en `libres` núcleos)."""
+    tareas = []
+    for nombre in nombres:
+        try:
+            with open(os.path.join(pendientes, nombre)) as f:
+                tareas.append(_tarea(json.load(f), cores, nucleos_defecto))
+        except (FileNotFoundError, ValueError):
+            continue  # otro worker lo tomó mientras se leía
+    elegidas = modelo_costes.planificar(tareas, libres, en_curso=en_curso, ahora=time.time())
+    return [f"{t.clave}.json" for t in elegidas]
+
+
+def tomar(cola, worker, libres=None, en_curso=(), cores=None, nucleos_defecto=1):
+    """Toma un trabajo pendiente. Devuelve (lease, trabajo) o None si no hay.
+
+    Sin `libres` se toma el más antiguo. Con `libres` (núcleos libres del
+    worker), `en_curso` (pares (Tarea, inicio) de lo que ya ejecuta) y
+    `cores` se toma, entre los VENTANA más antiguos, el que elige
+    modelo_costes.planificar: el más corto con envejecimiento que quepa.
+    """
+    pendientes = os.path.join(cola, PENDIENTES)
+    nombres = _json_de(pendientes)
+    if libres is not None:
+        nombres = _planificados(pendientes, nombres[:VENTANA], libres, en_curso,
+                                cores or libres, nucleos_defecto)
+    for nombre in nombres:
+        trabajo_id = nombre[:-5]
+        origen = os.path.join(pendientes, nombre)
+        lease = os.path.join(cola, EN_CURSO, f"{trabajo_id}@{worker}.json")
+        try:
+            # rename conserva el mtime: se toca antes para que el arrendamiento nazca vigente
+            os.utime(origen)
+            os.rename(origen, lease)
+        except FileNotFoundError:
+            continue  # otro worker lo tomó antes
+        with open(lease) as f:
+            intentos = json.load(f).get("intentos", 0) + 1
+        trabajo = _modificar(lease, intentos=intentos, worker=worker, iniciado=time.time())
+        if trabajo is None:
+            continue
+        if intentos > MAX_INTENTOS:
+            cerrar(cola, lease, FALLIDOS, error=f"Arrendamiento vencido {intentos - 1} veces")
+            print(f"❌ Trabajo {trabajo_id}: demasiados intentos")
+            continue
+        return lease, trabajo
+    return None
+
+
+def latir(lease):
+    """Renueva el arrendamiento. False si se perdió (otro worker lo reclamó)."""
+    try:
+        os.utime(lease)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def devolver(cola, lease):
+    """Devuelve un arrendamiento a pendientes/ (al parar un worker o al vencer)."""
+    trabajo_id = os.path.basename(lease).split("@", 1)[0]
+    try:
+        os.rename(lease, os.path.join(cola, PENDIENTES, f"{trabajo_id}.json"))
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def reclamar_vencidos(cola, ttl=TTL, worker=None):
+    """Devuelve a la cola los arrendamientos sin latido desde hace más de `ttl` s."""
+    ahora = _ahora(cola, worker or identificador_worker())
+    en_curso = os.path.join(cola, EN_CURSO)
+    devueltos = []
+    for nombre in _json_de(en_curso):
+        lease = os.path.join(en_curso, nombre)
+        try:
+            edad = ahora - os.stat(lease).st_mtime
+        except FileNotFoundError:
+            continue
+        if edad > ttl and devolver(cola, lease):
+            devueltos.append(nombre)
+            print(f"♻️ Arrendamiento vencido ({edad:.0f} s sin latido): {nombre} vuelve a la cola")
+    return devueltos
+
+
+def cerrar(cola, lease, estado, **campos):
+    """Anota `campos` y mueve el arrendamiento a hechos/ o fallidos/.
+
+    Devuelve False si el arrendamiento ya no era nuestro.
+    """
+    trabajo = _modificar(lease, terminado=time.time(), **campos)
+    if trabajo is None:
+        return False
+    try:
+        os.rename(lease, os.path.join(cola, estado, f"{trabajo['id']}.json"))
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def resumen(cola):
+    """Número de trabajos en cada estado."""
+    preparar(cola)
+    return {estado: len(_json_de(os.path.join(cola, estado))) for estado in ESTADOS}
+
+
+# --------- Worker ---------
+@dataclass
+class Ejecucion:
+    """Un trabajo en marcha en este worker."""
+    trabajo: dict
+    lease: str
+    carpeta: str        # carpeta privada del intento: <outdir>/.intentos/<id>@<worker>
+    proc: subprocess.Popen
+    log: object
+    tarea: modelo_costes.Tarea
+    inicio: float
+
+
+def _lanzar(trabajo, lease, outdir, worker, tarea):
+    """Ejecuta run_orca.py para el trabajo en su carpeta de intento con los núcleos de `tarea`."""
+    carpeta = os.path.abspath(os.path.join(outdir, ".intentos", f"{trabajo['id']}@{worker}"))
+    os.makedirs(carpeta, exist_ok=True)
+    comando = [sys.executable, RUN_ORCA, "--mol", trabajo["molfile"], "--job", trabajo["job"],
+               "--outdir", carpeta, "--cores", str(tarea.nucleos), *trabajo["opciones"]]
+    log = open(os.path.join(carpeta, "worker.log"), "w")
+    # results/ de run_orca (espectros, PDF) queda dentro del intento; la caché, la base de
+    # espectros y las métricas se pasan como rutas absolutas para que sean las compartidas
+    from cache_orca import entorno_hijo
+    proc = subprocess.Popen(comando, cwd=carpeta, stdout=log, stderr=subprocess.STDOUT,
+                            env=entorno_hijo())
+    print(f"▶️ {trabajo['id']} ({os.path.basename(trabajo['molfile'])}, intento {trabajo['intentos']})")
+    return Ejecucion(trabajo, lease, carpeta, proc, log, tarea, time.time())
+
+
+def _parar(ej, espera=30):
+    """Detiene run_orca (que a su vez detiene ORCA) y espera a que termine."""
+    if ej.proc.poll() is None:
+        ej.proc.send_signal(signal.SIGTERM)
+        try:
+            ej.proc.wait(timeout=espera)
+        except subprocess.TimeoutExpired:
+            ej.proc.kill()
+            ej.proc.wait()
+    ej.log.close()
+
+
+def _publicar(ej, outdir):
+    """Mueve el resultado del intento a <outdir>/<molécula>/ (results/ y log incluidos)."""
+    nombre = os.path.splitext(os.path.basename(ej.trabajo["molfile"]))[0]
+    origen = os.path.join(ej.carpeta, nombre)
+    os.makedirs(origen, exist_ok=True)
+    for extra in ("results", "worker.log"):
+        if os.path.exists(os.path.join(ej.carpeta, extra)):
+            os.rename(os.path.join(ej.carpeta, extra), os.path.join(origen, extra))
+    destino = os.path.join(outdir, nombre)
+    if os.path.exists(destino):
+        # Un resultado anterior de la misma molécula se sustituye entero
+        anterior = ej.carpeta + ".anterior"
+        os.rename(destino, anterior)
+        os.rename(origen, destino)
+        shutil.rmtree(anterior, ignore_errors=True)
+    else:
+        os.rename(origen, destino)
+    shutil.rmtree(ej.carpeta, ignore_errors=True)
+    return destino
+
+
+def _finalizar(ej, cola, outdir):
+    """Publica o anota el error de un trabajo cuyo proceso ya terminó."""
+    ej.log.close()
+    if ej.proc.returncode != 0:
+        with open(os.path.join(ej.carpeta, "worker.log"), errors="replace") as f:
+            cola_log = f.readlines()[-20:]
+        if cerrar(cola, ej.lease, FALLIDOS, codigo=ej.proc.returncode, carpeta=ej.carpeta,
+                  error="".join(cola_log).strip()):
+            print(f"❌ {ej.trabajo['id']}: run_orca terminó con código {ej.proc.returncode}")
+        return
+    if not latir(ej.lease):
+        # Otro worker ya lo está repitiendo: se descarta este resultado
+        print(f"⚠️ {ej.trabajo['id']}: arrendamiento perdido, resultado descartado")
+        shutil.rmtree(ej.carpeta, ignore_errors=True)
+        return
+    # Primero los resultados y después el estado: un trabajo en hechos/ siempre tiene resultados
+    destino = _publicar(ej, outdir)
+    cerrar(cola, ej.lease, HECHOS, resultado=os.path.abspath(destino))
+    print(f"✅ {ej.trabajo['id']}: resultados en {destino}")
+
+
+def trabajar(cola, outdir="runs", jobs=1, cores=None, ttl=TTL, intervalo=2.0, hasta_vaciar=False):
+    """Bucle del worker: toma hasta `jobs` trabajos a la vez y los ejecuta con run_orca.py.
+
+    En cada vuelta renueva sus arrendamientos, recoge los trabajos terminados
+    y devuelve a la cola los arrendamientos vencidos de cualquier worker.
+    Cada trabajo pide los núcleos estimados al encolarlo (los trabajos sin
+    estimación, cores/jobs) y se toman primero los más cortos que quepan en
+    los `cores` libres (por defecto, los del host). Con hasta_vaciar=True
+    termina cuando no queda nada pendiente ni en curso. Al parar (Ctrl-C,
+    SIGTERM) devuelve sus trabajos a la cola.
+    """
+    preparar(cola)
+    worker = identificador_worker()
+    cores = cores or entradas_orca.recursos_host()[0]
+    nucleos_defecto = max(1, cores // jobs)
+    activos = {}
+    print(f"🚀 Worker {worker}: hasta {jobs} trabajos simultáneos con {cores} núcleos, cola {cola}")
+    try:
+        while True:
+            reclamar_vencidos(cola, ttl, worker)
+            for lease, ej in list(activos.items()):
+                if ej.proc.poll() is None:
+                    if not latir(lease):
+                        print(f"⚠️ {ej.trabajo['id']}: arrendamiento perdido, deteniendo el cálculo")
+                        _parar(ej)
+                        shutil.rmtree(ej.carpeta, ignore_errors=True)
+                        del activos[lease]
+                    continue
+                del activos[lease]
+                _finalizar(ej, cola, outdir)
+            while len(activos) < jobs:
+                en_curso = [(ej.tarea, ej.inicio) for ej in activos.values()]
+                libres = cores - sum(t.nucleos for t, _ in en_curso)
+                tomado = tomar(cola, worker, libres, en_curso, cores, nucleos_defecto)
+                if tomado is None:
+                    break
+                lease, trabajo = tomado
+                activos[lease] = _lanzar(trabajo, lease, outdir, worker,
+                                         _tarea(trabajo, cores, nucleos_defecto))
+            if hasta_vaciar and not activos:
+                estados = resumen(cola)
+                if not estados[PENDIENTES] and not estados[EN_CURSO]:
+                    break
+            time.sleep(intervalo)
+    finally:
+        for lease, ej in activos.items():
+            _parar(ej)
+            shutil.rmtree(ej.carpeta, ignore_errors=True)
+            # Una parada ordenada no cuenta como intento fallido
+            _modificar(lease, intentos=ej.trabajo["intentos"] - 1)
+            if devolver(cola, lease):
+                print(f"↩️ {ej.trabajo['id']} devuelto a la cola")
+        try:
+            os.unlink(os.path.join(cola, f".reloj-{worker}"))
+        except FileNotFoundError:
+            pass
+    print(f"✅ Worker {worker} terminado: {resumen(cola)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cola de trabajos ORCA en un directorio compartido")
+    parser.add_argument("cola", help="Directorio de la cola (en el sistema de archivos compartido)")
+    parser.add_argument("--reclamar", action="store_true",
+                        help="Devolver a la cola los arrendamientos vencidos")
+    parser.add_argument("--ttl", type=float, default=TTL, help="Segundos sin latido para vencer")
+    args = parser.parse_args()
+    if args.reclamar:
+        reclamar_vencidos(args.cola, args.ttl)
+    for estado, n in resumen(args.cola).items():
+        print(f"{estado:12s} {n}")
@@ -0,0 +1,134 @@
+# ensanchamiento.py
+import numpy as np
+
+_LN2 = np.log(2.0)
+
+# Máximo de elementos (picos × puntos) evaluados a la vez; acota la memoria
+MAX_ELEMENTOS = 4_000_000
+
+# FWHM por defecto: equivale a la gaussiana de sigma = 15 cm-1 usada históricamente
+FWHM_DEFECTO = 2.0 * np.sqrt(2.0 * _LN2) * 15.0
+
+# Ventana por defecto (en múltiplos del FWHM) para el modo disperso
+VENTANA = {"gauss": 3.0, "lorentz": 50.0, "voigt": 50.0}
+
+
+def sigma_a_fwhm(sigma):
+    """Convierte la desviación estándar de una gaussiana en su FWHM."""
+    return 2.0 * np.sqrt(2.0 * _LN2) * np.asarray(sigma, dtype=np.float64)
+
+
+def _es_escalar(v):
+    return np.isscalar(v) or getattr(v, "ndim", None) == 0
+
+
+def _perfil(d, fwhm, forma, eta):
+    """Perfil de altura 1 evaluado a la distancia `d` del centro (modifica `d`)."""
+    r2 = np.square(np.divide(d, fwhm, out=d), out=d)
+    if forma == "gauss":
+        return np.exp(np.multiply(r2, -4.0 * _LN2, out=r2), out=r2)
+    if forma == "lorentz":
+        return np.reciprocal(np.multiply(r2, 4.0, out=r2) + 1.0)
+    if forma == "voigt":
+        # Pseudo-Voigt: mezcla lineal de Lorentziana (eta) y gaussiana (1 - eta)
+        return eta / (1.0 + 4.0 * r2) + (1.0 - eta) * np.exp(-4.0 * _LN2 * r2)
+    raise ValueError(f"Forma de línea desconocida: {forma!r} (use gauss, lorentz o voigt)")
+
+
+def _rellenar(filas, n_picos, valor):
+    """Apila filas de distinta longitud en una matriz (n_espectros, n_picos)."""
+    m = np.full((len(filas), n_picos), valor, dtype=np.float64)
+    for i, fila in enumerate(filas):
+        fila = np.asarray(fila, dtype=np.float64)
+        m[i, :fila.size] = fila
+    return m
+
+
+def _denso(x, c, h, w, forma, eta, max_elementos):
+    """Evalúa todos los picos sobre la rejilla por bloques de puntos."""
+    n_esp, n_picos = c.shape
+    y = np.zeros((n_esp, x.size))
+    paso = max(1, max_elementos // max(1, n_esp * n_picos))
+    for i in range(0, x.size, paso):
+        xs = x[i:i + paso]
+        p = _perfil(xs[None, None, :] - c[:, :, None], w[:, :, None], forma, eta)
+        y[:, i:i + paso] = np.einsum("ep,epx->ex", h, p)
+    return y
+
+
+def _disperso(x, c, h, w, forma, eta, ventana, max_elementos):
+    """Evalúa cada pico sólo dentro de ±ventana·FWHM, acumulando con bincount."""
+    n_esp, n_picos = c.shape
+    esp = np.repeat(np.arange(n_esp), n_picos)
+    c, h, w = c.ravel(), h.ravel(), w.ravel()
+    activos = h != 0
+    esp, c, h, w = esp[activos], c[activos], h[activos], w[activos]
+
+    lo = np.searchsorted(x, c - ventana * w, side="left")
+    hi = np.searchsorted(x, c + ventana * w, side="right")
+    n = hi - lo
+    fin = np.cumsum(n)
+
+    y = np.zeros(n_esp * x.size)
+    inicio_pico = 0
+    while inicio_pico < c.size:
+        # Tomar tantos picos como quepan en max_elementos puntos de ventana
+        base = fin[inicio_pico - 1] if inicio_pico else 0
+        fin_pico = max(inicio_pico + 1, np.searchsorted(fin, base + max_elementos, side="right"))
+        sel = slice(inicio_pico, fin_pico)
+        n_sel = n[sel]
+        pico = np.repeat(np.arange(inicio_pico, fin_pico), n_sel)
+        offs = np.arange(pico.size) - np.repeat(np.cumsum(n_sel) - n_sel, n_sel)
+        idx = lo[pico] + offs
+        vals = h[pico] * _perfil(x[idx] - c[pico], w[pico], forma, eta)
+        y += np.bincount(esp[pico] * x.size + idx, weights=vals, minlength=y.size)
+        inicio_pico = fin_pico
+    return y.reshape(n_esp, x.size)
+
+
+def ensanchar_lote(lista_freqs, lista_intens, x, fwhm=FWHM_DEFECTO, forma="gauss", eta=0.5,
+                   ventana=None, normalizar=False, max_elementos=MAX_ELEMENTOS):
+    """Ensancha muchos espectros de picos a la vez sobre una rejilla común.
+
+    Args:
+        lista_freqs: Secuencia de arrays de frecuencias (uno por espectro, de longitud libre)
+        lista_intens: Secuencia de arrays de intensidades, alineada con lista_freqs
+        x: Rejilla creciente donde evaluar los espectros
+        fwhm: Ancho a media altura; escalar o un array por espectro/pico
+        forma: "gauss", "lorentz" o "voigt" (pseudo-Voigt)
+        eta: Fracción lorentziana del pseudo-Voigt
+        ventana: None evalúa todos los picos en toda la rejilla; un número
+            (o "auto") evalúa cada pico sólo en ±ventana·FWHM
+        normalizar: Escalar cada espectro a máximo 1
+        max_elementos: Límite de elementos evaluados por bloque (memoria)
+
+    Devuelve un array (n_espectros, len(x)).
+    """
+    x = np.asarray(x, dtype=np.float64)
+    n_picos = max((np.size(f) for f in lista_freqs), default=0)
+    c = _rellenar(lista_freqs, n_picos, 0.0)
+    h = _rellenar(lista_intens, n_picos, 0.0)
+    if _es_escalar(fwhm):
+        w = np.full_like(c, float(fwhm))
+    else:
+        w = _rellenar(fwhm, n_picos, 1.0)
+
+    if ventana is None:
+        y = _denso(x, c, h, w, forma, eta, max_elementos)
+    else:
+        if ventana == "auto":
+            ventana = VENTANA[forma]
+        y = _disperso(x, c, h, w, forma, eta, ventana, max_elementos)
+
+    if normalizar:
+        maximos = y.max(axis=1, keepdims=True)
+        np.divide(y, maximos, out=y, where=maximos > 0)
+    return y
+
+
+def ensanchar(freqs, intens, x, fwhm=FWHM_DEFECTO, forma="gauss", eta=0.5, ventana=None,
+              normalizar=False, max_elementos=MAX_ELEMENTOS):
+    """Ensancha un único espectro; ver ensanchar_lote. Devuelve un array 1-D."""
+    anchos = fwhm if _es_escalar(fwhm) else [fwhm]
+    return ensanchar_lote([freqs], [intens], x, anchos, forma, eta, ventana,
+                          normalizar, max_elementos)[0]
@@ -0,0 +1,197 @@
+# entradas_orca.py
+import os
+import re
+import math
+import itertools
+
+# Palabras clave y bloques adicionales de cada tipo de cálculo
+PRESETS = {
+    "opt": {"palabras": "B3LYP def2-SVP Opt TightSCF", "bloques": ""},
+    "freq": {"palabras": "B3LYP def2-SVP Freq TightSCF", "bloques": ""},
+    "optfreq": {"palabras": "B3LYP def2-SVP Opt Freq TightSCF", "bloques": ""},
+    # Raman: las actividades necesitan la polarizabilidad en cada geometría desplazada
+    "raman": {"palabras": "B3LYP def2-SVP Opt NumFreq TightSCF",
+              "bloques": "%elprop\n  Polar 1\nend\n"},
+    "nmr": {"palabras": "B3LYP def2-TZVP NMR TightSCF", "bloques": ""},
+}
+
+# Funciones de base por átomo según la fila de la tabla periódica (aproximado)
+FUNCIONES_BASE = {
+    "def2-SVP": (5, 14, 18, 32),
+    "def2-TZVP": (6, 31, 37, 45),
+}
+
+# Número atómico de los elementos más comunes (para electrones y fila)
+NUMERO_ATOMICO = {
+    "H": 1, "He": 2, "Li": 3, "Be": 4, "B": 5, "C": 6, "N": 7, "O": 8, "F": 9, "Ne": 10,
+    "Na": 11, "Mg": 12, "Al": 13, "Si": 14, "P": 15, "S": 16, "Cl": 17, "Ar": 18,
+    "K": 19, "Ca": 20, "Fe": 26, "Cu": 29, "Zn": 30, "Br": 35, "I": 53,
+}
+
+# Modelo de recursos
+BASES_POR_NUCLEO = 60       # por debajo de esto un núcleo más apenas acelera
+MAXCORE_MIN_MB = 500
+MAXCORE_MAX_MB = 8000
+FRACCION_RAM = 0.75         # ORCA puede superar %maxcore; se deja margen
+# Cuántas matrices N×N (float64) se estiman por núcleo según el tipo de cálculo
+MATRICES_POR_JOB = {"opt": 20, "freq": 60, "optfreq": 60, "raman": 60, "nmr": 40}
+
+
+def _fila(z):
+    return 0 if z <= 2 else 1 if z <= 10 else 2 if z <= 18 else 3
+
+
+def elementos_xyz(xyz_file):
+    """Elementos y líneas de coordenadas de un .xyz (sólo el primer frame si hay varios)."""
+    with open(xyz_file) as f:
+        n = int(f.readline().split()[0])
+        f.readline()
+        coords = [l for l in itertools.islice(f, n) if l.strip()]
+    elementos = [re.sub(r"\d+$", "", l.split()[0]).capitalize() for l in coords]
+    return elementos, "".join(coords)
+
+
+def contar_funciones_base(elementos, base="def2-SVP"):
+    """Estimación del número de funciones de base de la molécula."""
+    por_fila = FUNCIONES_BASE.get(base, FUNCIONES_BASE["def2-SVP"])
+    return sum(por_fila[_fila(NUMERO_ATOMICO.get(e, 36))] for e in elementos)
+
+
+def recursos_host():
+    """Núcleos disponibles para este proceso y RAM disponible (MB) del host."""
+    try:
+        nucleos = len(os.sched_getaffinity(0))
+    except AttributeError:
+        nucleos = os.cpu_count() or 1
+    ram_mb = None
+    try:
+        with open("/proc/meminfo") as f:
+            for linea in f:
+                if linea.startswith("MemAvailable:"):
+                    ram_mb = int(linea.split()[1]) // 1024
+                    break
+    except OSError:
+        pass
+    if ram_mb is None:
+        ram_mb = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_AVPHYS_PAGES") // 1024**2
+    return nucleos, ram_mb
+
+
+def dimensionar(n_bases, job="optfreq", nucleos=None, ram_mb=None):
+    """Elige (nprocs, maxcore en MB) para un cálculo de n_bases funciones de base.
+
+    Las moléculas pequeñas usan pocos núcleos (no escalan); las grandes usan
+    todos los disponibles salvo que la memoria estimada por núcleo no quepa en
+    la RAM libre, en cuyo caso se reducen los procesos.
+    """
+    host_nucleos, host_ram = recursos_host()
+    nucleos = max(1, nucleos or host_nucleos)
+    ram_mb = ram_mb or host_ram
+
+    nprocs = max(1, min(nucleos, math.ceil(n_bases / BASES_POR_NUCLEO)))
+    necesaria = 8 * n_bases**2 * MATRICES_POR_JOB.get(job, 60) / 1024**2
+    maxcore = int(min(max(necesaria, MAXCORE_MIN_MB), MAXCORE_MAX_MB))
+
+    presupuesto = FRACCION_RAM * ram_mb
+    if nprocs * maxcore > presupuesto:
+        # Primero menos procesos con la memoria necesaria; si ni así cabe, menos memoria
+        nprocs = max(1, min(nprocs, int(presupuesto // maxcore)))
+        maxcore = max(1, min(maxcore, int(presupuesto // nprocs)))
+    return nprocs, maxcore
+
+
+def comprobar_multiplicidad(elementos, carga, multiplicidad):
+    """Lanza ValueError si la multiplicidad no es compatible con el número de electrones."""
+    electrones = sum(NUMERO_ATOMICO.get(e, 0) for e in elementos) - carga
+    if multiplicidad < 1 or (electrones + multiplicidad) % 2 == 0:
+        raise ValueError(
+            f"Multiplicidad {multiplicidad} imposible con {electrones} electrones (carga {carga})"
+        )
+
+
+def construir_inp(elementos, coords, job="optfreq", carga=0, multiplicidad=1,
+                  nprocs=None, maxcore=None, nucleos=None, ram_mb=None, moinp=None,
+                  optimizada=False):
+    """Texto del .inp de ORCA para un preset; nprocs/maxcore se dimensionan si no se dan.
+
+    Con `moinp` (ruta a un .gbw) la función de onda inicial se lee de ese
+    archivo (MORead) en lugar de partir de cero. Con optimizada=True la
+    geometría ya viene optimizada y se quita Opt de las palabras clave.
+    """
+    if job not in PRESETS:
+        raise ValueError(f"Tipo de cálculo desconocido: {job} (opciones: {', '.join(PRESETS)})")
+    comprobar_multiplicidad(elementos, carga, multiplicidad)
+    preset = PRESETS[job]
+    base = preset["palabras"].split()[1]
+    auto_nprocs, auto_maxcore = dimensionar(contar_funciones_base(elementos, base), job, nucleos, ram_mb)
+    if nprocs and not maxcore:
+        # Procesos fijados a mano: la memoria por proceso tiene que caber igualmente
+        ram_mb = ram_mb or recursos_host()[1]
+        auto_maxcore = max(1, min(auto_maxcore, int(FRACCION_RAM * ram_mb // nprocs)))
+    nprocs = nprocs or auto_nprocs
+    maxcore = maxcore or auto_maxcore
+
+    palabras = preset["palabras"].split()
+    if optimizada:
+        palabras = [p for p in palabras if p.lower() != "opt"]
+    guess = ""
+    if moinp:
+        palabras.append("MORead")
+        guess = f'%moinp "{moinp}"\n'
+
+    pal = f"%pal nprocs {nprocs} end\n" if nprocs > 1 else ""
+    if not coords.endswith("\n"):
+        coords += "\n"
+    return (f"! {' '.join(palabras)}\n{pal}%maxcore {maxcore}\n{guess}{preset['bloques']}\n"
+            f"* xyz {carga} {multiplicidad}\n{coords}*\n")
+
+
+_pal_re = re.compile(r"%pal\s+nprocs\s+(\d+)", re.IGNORECASE)
+_maxcore_re = re.compile(r"^%maxcore\s+(\d+)", re.IGNORECASE | re.MULTILINE)
+
+
+def leer_recursos(inpfile):
+    """nprocs y maxcore (MB) escritos en un .inp."""
+    with open(inpfile) as f:
+        texto = f.read()
+    pal = _pal_re.search(texto)
+    maxcore = _maxcore_re.search(texto)
+    return {"nprocs": int(pal.group(1)) if pal else 1,
+            "maxcore_mb": int(maxcore.group(1)) if maxcore else None}
+
+
+def tipo_calculo(palabras):
+    """Tipo de cálculo (opt, freq, optfreq, raman, nmr o sp) según las palabras clave de un .inp."""
+    p = {x.lower() for x in palabras}
+    if "nmr" in p:
+        return "nmr"
+    if "numfreq" in p:
+        return "raman"
+    if "freq" in p:
+        return "optfreq" if "opt" in p else "freq"
+    return "opt" if "opt" in p else "sp"
+
+
+def caracteristicas(elementos, job="optfreq", carga=0, base=None):
+    """Descriptores de tamaño de un cálculo: átomos, electrones y funciones de base."""
+    base = base or PRESETS.get(job, PRESETS["optfreq"])["palabras"].split()[1]
+    return {"job": job, "atomos": len(elementos),
+            "electrones": sum(NUMERO_ATOMICO.get(e, 0) for e in elementos) - carga,
+            "bases": contar_funciones_base(elementos, base)}
+
+
+_geometria_re = re.compile(r"^\*\s*xyz\s+(-?\d+)\s+\d+\s*\n(.*?)^\*", re.IGNORECASE | re.MULTILINE | re.DOTALL)
+
+
+def leer_caracteristicas(inpfile):
+    """caracteristicas() y nprocs de un .inp ya escrito (tipo, base y geometría incluidos)."""
+    with open(inpfile) as f:
+        texto = f.read()
+    palabras = [p for linea in texto.splitlines() if linea.startswith("!") for p in linea[1:].split()]
+    base = next((p for p in palabras if p in FUNCIONES_BASE), None)
+    geometria = _geometria_re.search(texto)
+    carga, coords = (int(geometria.group(1)), geometria.group(2)) if geometria else (0, "")
+    elementos = [re.sub(r"\d+$", "", l.split()[0]).capitalize() for l in coords.splitlines() if l.strip()]
+    pal = _pal_re.search(texto)
+    return {**caracteristicas(elementos, tipo_calculo(palabras), carga, base),
+            "nprocs": int(pal.group(1)) if pal else 1}
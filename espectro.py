@@ -0,0 +1,110 @@
+# espectro.py
+"""Contenedor común para espectros de picos (IR, Raman y NMR).
+
+Un Espectro guarda arrays de NumPy alineados: posición de cada pico
+(número de onda o desplazamiento químico), intensidad, índice del modo
+normal (o del átomo, en NMR) y, para NMR, el elemento. Se crea sin copiar
+los arrays de OrcaResult y se pasa tal cual al ensanchado, los gráficos,
+el CSV y el reporte PDF.
+
+A diferencia de un dict {frecuencia: intensidad}, los modos degenerados
+(misma frecuencia) se conservan como picos distintos.
+"""
+import numpy as np
+
+# Corrección de intensidades Raman
+LASER_NM = 532.0          # longitud de onda del láser de excitación (nm)
+TEMPERATURA = 298.15      # K
+C2 = 1.438776877          # segunda constante de radiación hc/k (cm·K)
+
+UNIDADES = {"ir": "cm-1", "raman": "cm-1", "nmr": "ppm"}
+COLUMNAS = {
+    "ir": ("Frecuencia (cm-1)", "Intensidad", "Modo"),
+    "raman": ("Frecuencia (cm-1)", "Intensidad", "Modo"),
+    "nmr": ("Desplazamiento (ppm)", "Intensidad", "Átomo"),
+}
+
+
+class Espectro:
+    """Picos de un espectro como arrays de NumPy paralelos.
+
+    `x` (float64), `intensidad` (float64), `modo` (int64; átomo en NMR),
+    `elemento` (sólo NMR, o None) y `meta` (dict libre: origen, magnitud...).
+    Los arrays recibidos no se copian si ya tienen el tipo adecuado.
+    """
+    __slots__ = ("tipo", "x", "intensidad", "modo", "elemento", "meta")
+
+    def __init__(self, tipo, x, intensidad=None, modo=None, elemento=None, **meta):
+        self.tipo = tipo
+        self.x = np.asarray(x, dtype=np.float64)
+        self.intensidad = (np.ones_like(self.x) if intensidad is None
+                           else np.asarray(intensidad, dtype=np.float64))
+        if self.intensidad.shape != self.x.shape:
+            raise ValueError(f"Espectro {tipo}: {self.x.size} posiciones y {self.intensidad.size} intensidades")
+        # Resultados antiguos (caché, sidecars) no traen el índice de modo
+        modo = None if modo is None else np.asarray(modo, dtype=np.int64)
+        self.modo = modo if modo is not None and modo.shape == self.x.shape else np.arange(self.x.size)
+        self.elemento = None if elemento is None else np.asarray(elemento, dtype="<U2")
+        self.meta = meta
+
+    def __len__(self):
+        return self.x.size
+
+    def __repr__(self):
+        return f"Espectro({self.tipo!r}, {len(self)} picos)"
+
+    @property
+    def unidad(self):
+        return UNIDADES.get(self.tipo, "")
+
+    def _con(self, intensidad=None, mascara=None, **meta):
+        """Espectro derivado que comparte los arrays que no cambian."""
+        elemento = self.elemento
+        if mascara is None:
+            x, modo = self.x, self.modo
+        else:
+            x, modo = self.x[mascara], self.modo[mascara]
+            elemento = None if elemento is None else elemento[mascara]
+        intensidad = self.intensidad if intensidad is None else intensidad
+        if mascara is not None and intensidad.shape != x.shape:
+            intensidad = intensidad[mascara]
+        return Espectro(self.tipo, x, intensidad, modo, elemento, **{**self.meta, **meta})
+
+    def normalizado(self):
+        """Mismo espectro con la intensidad máxima igual a 1."""
+        maximo = self.intensidad.max() if self.intensidad.size else 0.0
+        if maximo <= 0:
+            return self
+        return self._con(self.intensidad / maximo)
+
+    def seleccion(self, mascara):
+        """Sólo los picos donde `mascara` es True."""
+        return self._con(mascara=np.asarray(mascara, dtype=bool))
+
+    def corregir_raman(self, laser_nm=LASER_NM, temperatura=TEMPERATURA):
+        """Intensidades Raman a partir de las actividades de ORCA.
+
+        I_i ∝ (ν0 − ν_i)^4 · S_i / (ν_i · (1 − exp(−c2·ν_i / T))), con ν0 el
+        número de onda del láser. Los modos de frecuencia nula o por encima
+        del láser quedan con intensidad 0. Devuelve un espectro nuevo con el
+        máximo normalizado a 1.
+        """
+        if self.tipo != "raman":
+            raise ValueError(f"corregir_raman sólo se aplica a espectros Raman, no a {self.tipo!r}")
+        nu0 = 1e7 / laser_nm
+        nu = self.x
+        validos = (nu > 0) & (nu < nu0)
+        nu_v = np.where(validos, nu, 1.0)
+        # -expm1(-x) = 1 - exp(-x) sin pérdida de precisión para frecuencias bajas
+        bose = -np.expm1(-C2 * nu_v / temperatura)
+        intensidad = np.where(validos, (nu0 - nu_v) ** 4 * self.intensidad / (nu_v * bose), 0.0)
+        return self._con(intensidad, magnitud="intensidad", laser_nm=laser_nm,
+                         temperatura=temperatura).normalizado()
+
+    def columnas(self):
+        """Columnas {nombre: array} para exportar (p. ej. a un DataFrame)."""
+        pos, inten, modo = COLUMNAS.get(self.tipo, COLUMNAS["ir"])
+        columnas = {pos: self.x, inten: self.intensidad, modo: self.modo}
+        if self.elemento is not None:
+            columnas["Elemento"] = self.elemento
+        return columnas
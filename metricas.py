@@ -0,0 +1,99 @@
+# metricas.py
+import os
+import json
+import time
+import cProfile
+import tracemalloc
+from contextlib import contextmanager
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Directorio de las métricas por trabajo (se puede sobrescribir por entorno)
+METRICAS_DIR = os.environ.get("ORCA_METRICAS_DIR", os.path.join(PROJECT_DIR, "results", "metricas"))
+
+
+def tamanos(*rutas):
+    """Tamaño en bytes de cada archivo existente, por nombre."""
+    return {os.path.basename(r): os.path.getsize(r) for r in rutas if r and os.path.exists(r)}
+
+
+def leer_io(pid):
+    """Bytes leídos y escritos en disco por un proceso (/proc/<pid>/io), o {} si no está disponible."""
+    try:
+        with open(f"/proc/{pid}/io") as f:
+            campos = dict(linea.split(":", 1) for linea in f if ":" in linea)
+    except OSError:
+        return {}
+    return {"io_leido_bytes": int(campos.get("read_bytes", 0)),
+            "io_escrito_bytes": int(campos.get("write_bytes", 0))}
+
+
+def recursos_hijo(rusage):
+    """Campos de interés del rusage de un proceso hijo terminado (os.wait4)."""
+    return {
+        "cpu_usuario_s": rusage.ru_utime,
+        "cpu_sistema_s": rusage.ru_stime,
+        "rss_max_mb": rusage.ru_maxrss / 1024,  # Linux da ru_maxrss en KB
+        "bloques_leidos": rusage.ru_inblock,
+        "bloques_escritos": rusage.ru_oublock,
+    }
+
+
+class Metricas:
+    """Registro de métricas de un trabajo: una línea JSON por etapa.
+
+    Cada etapa anota su tiempo de pared; con `perfil` se guarda además un
+    .prof de cProfile por etapa en ese directorio y con `memoria=True` el
+    pico de memoria de Python (tracemalloc). Las líneas se añaden a
+    METRICAS_DIR/<trabajo>.jsonl, de modo que varios procesos de un mismo
+    trabajo (modo lote) pueden escribir en el mismo archivo. Los campos de
+    `contexto` (p. ej. el paso de una cadena de cálculos) se añaden a cada línea.
+    """
+
+    def __init__(self, trabajo, perfil=None, memoria=False, directorio=None):
+        self.trabajo = trabajo
+        self.perfil = perfil
+        self.memoria = memoria
+        self.archivo = os.path.join(directorio or METRICAS_DIR, f"{trabajo}.jsonl")
+        self.contexto = {}
+
+    def registrar(self, etapa, **campos):
+        """Añade una línea con los campos de una etapa."""
+        registro = {"trabajo": self.trabajo, "etapa": etapa, "pid": os.getpid(),
+                    "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"), **self.contexto, **campos}
+        os.makedirs(os.path.dirname(self.archivo) or ".", exist_ok=True)
+        with open(self.archivo, "a") as f:
+            f.write(json.dumps(registro) + "\n")
+        return registro
+
+    @contextmanager
+    def etapa(self, nombre, **campos):
+        """Mide el bloque. Lo que se añada al dict devuelto se guarda con la etapa."""
+        extra = dict(campos)
+        perfilador = cProfile.Profile() if self.perfil else None
+        medir_memoria = self.memoria and not tracemalloc.is_tracing()
+        if medir_memoria:
+            tracemalloc.start()
+        if perfilador:
+            perfilador.enable()
+        t0 = time.perf_counter()
+        error = None
+        try:
+            yield extra
+        except BaseException as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            extra["tiempo_s"] = time.perf_counter() - t0
+            if perfilador:
+                perfilador.disable()
+                os.makedirs(self.perfil, exist_ok=True)
+                prof = os.path.join(self.perfil, f"{self.trabajo}_{nombre}.prof")
+                perfilador.dump_stats(prof)
+                extra["perfil"] = prof
+            if medir_memoria:
+                extra["pico_python_mb"] = tracemalloc.get_traced_memory()[1] / 1024**2
+                tracemalloc.stop()
+            if error:
+                extra["error"] = error
+            self.registrar(nombre, **extra)
@@ -0,0 +1,254 @@
+# modelo_costes.py
+"""Modelo de coste de los cálculos ORCA y planificador «el más corto primero».
+
+Cada ejecución real de ORCA (no las recuperadas de la caché) añade una línea
+a HISTORIAL con sus descriptores (tipo de cálculo, átomos, electrones,
+funciones de base, nprocs), su tiempo de pared y su RSS máximo. ModeloCostes
+parte de una estimación a priori (coste ∝ bases³ por tipo de cálculo) y
+ajusta sobre el historial una corrección log-lineal con regularización
+ridge, de modo que con pocas observaciones sigue prediciendo algo razonable.
+
+El planificador ordena los trabajos pendientes por tiempo estimado menos un
+descuento por la espera (SJF con envejecimiento: un trabajo grande no espera
+indefinidamente) y los empaqueta en los núcleos y la RAM libres. Si el
+primero no cabe, sólo se adelantan trabajos que terminarán antes de que
+queden núcleos para él (backfilling), de modo que no se le retrasa.
+
+    python modelo_costes.py data/*.xyz --job optfreq --cores 16
+"""
+import os
+import math
+import json
+import argparse
+from dataclasses import dataclass
+import numpy as np
+import entradas_orca
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Configuración (se puede sobrescribir por entorno)
+HISTORIAL = os.environ.get("ORCA_COSTES", os.path.join(PROJECT_DIR, "results", "costes.jsonl"))
+ENVEJECIMIENTO = float(os.environ.get("ORCA_ENVEJECIMIENTO", 1.0))  # segundos de coste por segundo de espera
+
+# Estimación a priori, en «SCF equivalentes» por tipo de cálculo (el ajuste la corrige)
+SCF_EQUIVALENTES = {"sp": 1, "opt": 8, "freq": 6, "optfreq": 14, "raman": 40, "nmr": 4}
+SEGUNDOS_SCF_100 = 5.0     # un SCF B3LYP de 100 funciones de base en un núcleo
+ARRANQUE_S = 2.0           # arranque de ORCA y escritura de archivos
+ESCALADO_PAL = 0.8         # tiempo ∝ nprocs^-0.8
+MEMORIA_BASE_MB = 150      # RSS de un proceso ORCA vacío
+RIDGE = 1.0                # regularización hacia la estimación a priori
+TIPOS = tuple(SCF_EQUIVALENTES)
+
+
+def _a_priori(c):
+    """(tiempo_s, RSS por proceso en MB) esperados sin historial."""
+    bases = max(c["bases"], 1)
+    tiempo = (SEGUNDOS_SCF_100 * (bases / 100) ** 3 * SCF_EQUIVALENTES.get(c["job"], 14)
+              / max(c.get("nprocs", 1), 1) ** ESCALADO_PAL + ARRANQUE_S)
+    memoria = MEMORIA_BASE_MB + 8 * bases**2 * entradas_orca.MATRICES_POR_JOB.get(c["job"], 60) / 1024**2
+    return tiempo, memoria
+
+
+def _fila(c):
+    """Vector de características de la corrección log-lineal (un término propio por tipo)."""
+    x = [math.log(max(c["bases"], 1) / 100), math.log(max(c["atomos"], 1)),
+         math.log(max(c["electrones"], 1)), math.log(max(c.get("nprocs", 1), 1))]
+    return x + [float(c["job"] == t) for t in TIPOS]
+
+
+def registrar(carac, tiempo_s, rss_max_mb=None, historial=None):
+    """Añade una ejecución real de ORCA al historial."""
+    ruta = historial or HISTORIAL
+    os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+    with open(ruta, "a") as f:
+        f.write(json.dumps({**carac, "tiempo_s": tiempo_s, "rss_max_mb": rss_max_mb}) + "\n")
+
+
+def leer_historial(historial=None):
+    """Observaciones válidas del historial (las líneas corruptas se ignoran)."""
+    observaciones = []
+    try:
+        with open(historial or HISTORIAL) as f:
+            for linea in f:
+                try:
+                    o = json.loads(linea)
+                    if o["tiempo_s"] > 0 and o["bases"] > 0:
+                        observaciones.append(o)
+                except (ValueError, KeyError, TypeError):
+                    continue
+    except FileNotFoundError:
+        pass
+    return observaciones
+
+
+def _ridge(filas, y, ridge):
+    X = np.asarray(filas, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    pesos = np.linalg.solve(X.T @ X + ridge * np.eye(X.shape[1]), X.T @ y)
+    return pesos, float(np.sqrt(np.mean((X @ pesos - y) ** 2)))
+
+
+class ModeloCostes:
+    """Predice tiempo de pared y memoria de un cálculo a partir de sus descriptores.
+
+    log(observado) = log(a priori) + x·w, con `w` ajustado por ridge sobre el
+    historial; sin observaciones, w = 0 y se usa la estimación a priori.
+    `error_tiempo` es el factor multiplicativo típico del error de ajuste.
+    """
+
+    def __init__(self, pesos_tiempo=None, pesos_memoria=None, n=0, error_tiempo=1.0):
+        self.pesos_tiempo = pesos_tiempo
+        self.pesos_memoria = pesos_memoria
+        self.n = n
+        self.error_tiempo = error_tiempo
+
+    @classmethod
+    def ajustar(cls, observaciones, ridge=RIDGE):
+        observaciones = [o for o in observaciones if o.get("job") in TIPOS]
+        if not observaciones:
+            return cls()
+        filas = [_fila(o) for o in observaciones]
+        priori = [_a_priori(o) for o in observaciones]
+        pesos_t, rms = _ridge(filas, [math.log(o["tiempo_s"] / p[0]) for o, p in zip(observaciones, priori)],
+                              ridge)
+        con_rss = [i for i, o in enumerate(observaciones) if o.get("rss_max_mb")]
+        pesos_m = None
+        if con_rss:
+            pesos_m, _ = _ridge([filas[i] for i in con_rss],
+                                [math.log(observaciones[i]["rss_max_mb"] / priori[i][1]) for i in con_rss],
+                                ridge)
+        return cls(pesos_t, pesos_m, len(observaciones), math.exp(rms))
+
+    def predecir(self, carac):
+        """(tiempo de pared en s, memoria total en MB) de un cálculo."""
+        tiempo, memoria = _a_priori(carac)
+        x = np.asarray(_fila(carac))
+        if self.pesos_tiempo is not None:
+            tiempo *= math.exp(float(x @ self.pesos_tiempo))
+        if self.pesos_memoria is not None:
+            memoria *= math.exp(float(x @ self.pesos_memoria))
+        return tiempo, memoria * max(carac.get("nprocs", 1), 1)
+
+
+_modelos = {}
+
+
+def modelo(historial=None):
+    """Modelo ajustado al historial; se reajusta sólo si el archivo cambió."""
+    ruta = historial or HISTORIAL
+    try:
+        st = os.stat(ruta)
+        firma = (st.st_mtime_ns, st.st_size)
+    except FileNotFoundError:
+        firma = None
+    if ruta not in _modelos or _modelos[ruta][0] != firma:
+        _modelos[ruta] = (firma, ModeloCostes.ajustar(leer_historial(ruta)))
+    return _modelos[ruta][1]
+
+
+# --------- Planificador ---------
+@dataclass
+class Tarea:
+    """Un trabajo a planificar: recursos que pide, duración estimada y hora de llegada."""
+    clave: object
+    nucleos: int = 1
+    tiempo_s: float = 0.0
+    memoria_mb: float = 0.0
+    llegada: float = 0.0
+
+
+def estimar_xyz(xyz_file, job="optfreq", nucleos=None, carga=0, pasos=None, nprocs=None, historial=None):
+    """Tarea para un .xyz: nprocs como los elegiría generar_inp y coste según el modelo.
+
+    Con `pasos` (cadena de cálculos) el tiempo es la suma de los pasos y los
+    núcleos y la memoria, los del paso más exigente.
+    """
+    elementos, _ = entradas_orca.elementos_xyz(xyz_file)
+    m = modelo(historial)
+    tarea = Tarea(xyz_file)
+    for paso in pasos or (job,):
+        c = entradas_orca.caracteristicas(elementos, paso, carga)
+        c["nprocs"] = nprocs or entradas_orca.dimensionar(c["bases"], paso, nucleos)[0]
+        tiempo, memoria = m.predecir(c)
+        tarea.tiempo_s += tiempo
+        tarea.nucleos = max(tarea.nucleos, c["nprocs"])
+        tarea.memoria_mb = max(tarea.memoria_mb, memoria)
+    return tarea
+
+
+def estimar_trabajo(molfile, opciones=(), nucleos=None):
+    """Tarea de un trabajo de run_orca.py con esas opciones, o None si la molécula no se puede leer."""
+    from run_orca import opciones_pipeline, pasos_cadena
+    kw = opciones_pipeline(opciones)
+    if kw["desde_salida"]:
+        return Tarea(molfile)   # sin ORCA
+    try:
+        return estimar_xyz(molfile, kw["job"], kw["nucleos"] or nucleos, kw["carga"],
+                           pasos_cadena(kw["cadena"]) if kw["cadena"] else None, kw["nprocs"])
+    except (ValueError, IndexError, OSError):
+        return None
+
+
+def prioridad(tarea, ahora, envejecimiento=ENVEJECIMIENTO):
+    """Menor es antes: tiempo estimado menos `envejecimiento` por segundo esperado."""
+    return tarea.tiempo_s - envejecimiento * (ahora - tarea.llegada)
+
+
+def _hora_libre(nucleos, libres, en_curso, ahora):
+    """Fin estimado del trabajo en curso tras el cual habrá `nucleos` libres."""
+    for fin, n in sorted(en_curso):
+        if libres >= nucleos:
+            break
+        libres += n
+        ahora = max(ahora, fin)
+    return ahora if libres >= nucleos else math.inf
+
+
+def planificar(pendientes, nucleos_libres, ram_libre_mb=None, en_curso=(), ahora=0.0,
+               envejecimiento=ENVEJECIMIENTO, maximo=None):
+    """Tareas de `pendientes` a lanzar ya, en orden.
+
+    `en_curso` son pares (Tarea, hora de inicio) de lo que ya se ejecuta.
+    Se recorren los pendientes por prioridad() y se lanza cada uno que quepa
+    en los núcleos (y la RAM, si se da) libres. Al primero que no cabe se le
+    reserva la hora a la que quedarán núcleos para él, y a partir de ahí sólo
+    se adelantan trabajos que terminan antes. Si no hay nada en curso, el
+    primero se lanza aunque pida más de lo que hay (si no, nunca correría).
+    """
+    libres, ram = nucleos_libres, ram_libre_mb
+    fines = [(inicio + t.tiempo_s, t.nucleos) for t, inicio in en_curso]
+    reserva = math.inf
+    elegidas = []
+    for t in sorted(pendientes, key=lambda t: prioridad(t, ahora, envejecimiento)):
+        if maximo is not None and len(elegidas) >= maximo:
+            break
+        cabe = t.nucleos <= libres and (ram is None or t.memoria_mb <= ram)
+        if not cabe and not fines and not elegidas:
+            cabe = True
+        if cabe and ahora + t.tiempo_s <= reserva:
+            elegidas.append(t)
+            libres -= t.nucleos
+            ram = None if ram is None else ram - t.memoria_mb
+            fines.append((ahora + t.tiempo_s, t.nucleos))
+        elif not cabe and reserva == math.inf:
+            reserva = _hora_libre(t.nucleos, libres, fines, ahora)
+    return elegidas
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Coste estimado de cálculos ORCA y orden de ejecución")
+    parser.add_argument("moleculas", nargs="*", help="Archivos .xyz")
+    parser.add_argument("--job", default="optfreq", choices=sorted(entradas_orca.PRESETS))
+    parser.add_argument("--cores", type=int, default=None, help="Núcleos disponibles (por defecto, los del host)")
+    parser.add_argument("--historial", default=None, help=f"Historial de ejecuciones (por defecto {HISTORIAL})")
+    args = parser.parse_args()
+    m = modelo(args.historial)
+    if m.n:
+        print(f"📊 Modelo ajustado con {m.n} ejecuciones (error típico ×{m.error_tiempo:.2f})")
+    else:
+        print("⚠️ Historial vacío: se usa la estimación a priori")
+    tareas = sorted((estimar_xyz(mol, args.job, args.cores, historial=args.historial)
+                     for mol in args.moleculas), key=lambda t: t.tiempo_s)
+    for t in tareas:
+        print(f"{os.path.basename(t.clave):30s} {t.tiempo_s:10.1f} s  {t.nucleos:3d} núcleos  "
+              f"{t.memoria_mb:8.0f} MB")
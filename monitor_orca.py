@@ -0,0 +1,210 @@
+# monitor_orca.py
+import re
+import json
+from dataclasses import dataclass
+
+_float_re = r"(-?\d+\.\d+(?:[EeDd][\+\-]?\d+)?)"
+
+# Patrones de progreso en la salida de ORCA
+_scf_inicio_re = re.compile(r"SCF ITERATIONS|ITER\s+Energy\s+Delta-E")
+_scf_iter_re = re.compile(rf"^\s*(\d+)\s+{_float_re}\s+{_float_re}\s")
+_scf_fin_re = re.compile(r"TOTAL SCF ENERGY|FINAL SINGLE POINT ENERGY|NORMAL MODES")
+_scf_ok_re = re.compile(r"SCF CONVERGED AFTER\s+(\d+)\s+CYCLES", re.IGNORECASE)
+_scf_mal_re = re.compile(r"SCF NOT CONVERGED", re.IGNORECASE)
+_opt_ciclo_re = re.compile(r"GEOMETRY OPTIMIZATION CYCLE\s+(\d+)", re.IGNORECASE)
+_opt_ok_re = re.compile(r"THE OPTIMIZATION HAS CONVERGED", re.IGNORECASE)
+_gradiente_re = re.compile(rf"^\s*(RMS|MAX) gradient\s+{_float_re}", re.IGNORECASE)
+_energia_re = re.compile(rf"FINAL SINGLE POINT ENERGY\s+{_float_re}", re.IGNORECASE)
+_desplazada_re = re.compile(r"displaced geometry\s+(\d+)\s+\(of\s+(\d+)\)", re.IGNORECASE)
+_freq_re = re.compile(r"VIBRATIONAL FREQUENCIES")
+_fin_re = re.compile(r"ORCA TERMINATED NORMALLY")
+
+# Prefijo de las líneas de evento que run_orca.py escribe en su stdout
+PREFIJO_EVENTO = "@@evento "
+
+
+def _f(x):
+    return float(x.replace("D", "E").replace("d", "E"))
+
+
+class SeguidorSalida:
+    """Lee incrementalmente un .out mientras ORCA escribe y lo convierte en eventos.
+
+    Cada evento es un dict con la clave "tipo": scf_iter, scf_convergido,
+    scf_no_convergido, opt_ciclo, gradiente, opt_convergida, energia,
+    freq_progreso, frecuencias o terminado.
+    """
+
+    def __init__(self, outfile):
+        self.outfile = outfile
+        self.offset = 0
+        self.resto = b""
+        self.en_scf = False
+
+    def leer(self):
+        """Devuelve los eventos de las líneas completas escritas desde la última llamada."""
+        try:
+            with open(self.outfile, "rb") as f:
+                f.seek(self.offset)
+                datos = f.read()
+        except FileNotFoundError:
+            return []
+        self.offset += len(datos)
+        lineas = (self.resto + datos).split(b"\n")
+        self.resto = lineas.pop()
+        eventos = []
+        for linea in lineas:
+            evento = self._analizar(linea.decode("utf-8", "replace"))
+            if evento:
+                eventos.append(evento)
+        return eventos
+
+    def _analizar(self, linea):
+        if _scf_inicio_re.search(linea):
+            self.en_scf = True
+            return None
+        if self.en_scf and _scf_fin_re.search(linea):
+            self.en_scf = False
+        if self.en_scf:
+            m = _scf_iter_re.match(linea)
+            if m:
+                return {"tipo": "scf_iter", "iter": int(m.group(1)),
+                        "energia": _f(m.group(2)), "delta": _f(m.group(3))}
+        m = _scf_ok_re.search(linea)
+        if m:
+            self.en_scf = False
+            return {"tipo": "scf_convergido", "ciclos": int(m.group(1))}
+        if _scf_mal_re.search(linea):
+            self.en_scf = False
+            return {"tipo": "scf_no_convergido"}
+        m = _opt_ciclo_re.search(linea)
+        if m:
+            return {"tipo": "opt_ciclo", "ciclo": int(m.group(1))}
+        m = _gradiente_re.match(linea)
+        if m:
+            return {"tipo": "gradiente", "medida": m.group(1).upper(), "valor": _f(m.group(2))}
+        if _opt_ok_re.search(linea):
+            return {"tipo": "opt_convergida"}
+        m = _energia_re.search(linea)
+        if m:
+            return {"tipo": "energia", "energia": _f(m.group(1))}
+        m = _desplazada_re.search(linea)
+        if m:
+            return {"tipo": "freq_progreso", "actual": int(m.group(1)), "total": int(m.group(2))}
+        if _freq_re.search(linea):
+            return {"tipo": "frecuencias"}
+        if _fin_re.search(linea):
+            return {"tipo": "terminado"}
+        return None
+
+
+@dataclass
+class ReglasAborto:
+    """Criterios para abortar cálculos que no van a converger (None desactiva una regla)."""
+    max_iter_scf: int = 500
+    # Divergencia SCF: |ΔE| crece este factor respecto al mínimo visto en el ciclo SCF actual
+    factor_divergencia_scf: float = 1e3
+    iter_minimas_scf: int = 30
+    max_ciclos_opt: int = 200
+    # Oscilación: la energía sube y baja alternadamente en tantos ciclos seguidos, con
+    # saltos mayores que la tolerancia (Eh) y sin alcanzar un mínimo nuevo en ese tramo
+    ciclos_oscilacion_opt: int = 8
+    tolerancia_oscilacion_opt: float = 1e-5
+    abortar_scf_no_convergido: bool = True
+
+
+class VigilanteAborto:
+    """Aplica ReglasAborto a la secuencia de eventos de un cálculo."""
+
+    def __init__(self, reglas):
+        self.reglas = reglas
+        self.min_delta = None
+        self.energias_opt = []
+        self.en_opt = False
+
+    def evaluar(self, evento):
+        """Devuelve el motivo para abortar, o None si el cálculo debe seguir."""
+        r = self.reglas
+        tipo = evento["tipo"]
+        if tipo == "scf_iter":
+            it, delta = evento["iter"], abs(evento["delta"])
+            if it <= 1:
+                self.min_delta = None
+            if r.max_iter_scf and it > r.max_iter_scf:
+                return f"SCF sin converger tras {it} iteraciones"
+            if delta > 0:
+                self.min_delta = delta if self.min_delta is None else min(self.min_delta, delta)
+            if (r.factor_divergencia_scf and it >= r.iter_minimas_scf and self.min_delta
+                    and delta > r.factor_divergencia_scf * self.min_delta):
+                return f"SCF divergente (|ΔE| = {delta:.2e} en la iteración {it})"
+        elif tipo == "scf_no_convergido" and r.abortar_scf_no_convergido:
+            return "SCF no convergido"
+        elif tipo in ("opt_convergida", "freq_progreso", "frecuencias"):
+            # Las energías de las geometrías desplazadas no son ciclos de optimización
+            self.en_opt = False
+        elif tipo == "opt_ciclo":
+            self.en_opt = True
+            if r.max_ciclos_opt and evento["ciclo"] > r.max_ciclos_opt:
+                return f"Optimización sin converger tras {r.max_ciclos_opt} ciclos"
+        elif tipo == "energia" and self.en_opt:
+            self.energias_opt.append(evento["energia"])
+            n = r.ciclos_oscilacion_opt
+            if n and len(self.energias_opt) > n + 1:
+                difs = [b - a for a, b in zip(self.energias_opt[-n - 1:], self.energias_opt[-n:])]
+                # Cerca de la convergencia ORCA alterna ~1e-7 Eh: eso no es oscilar
+                tol = r.tolerancia_oscilacion_opt or 0.0
+                nuevo_minimo = min(self.energias_opt[-n:]) < min(self.energias_opt[:-n])
+                if (not nuevo_minimo and all(abs(d) > tol for d in difs)
+                        and all(d1 * d2 < 0 for d1, d2 in zip(difs, difs[1:]))):
+                    return f"Optimización oscilante en los últimos {n} ciclos"
+        return None
+
+
+REGLAS_DEFECTO = ReglasAborto()
+
+
+class EstimadorProgreso:
+    """Convierte eventos en un porcentaje de avance monótono y un mensaje legible."""
+
+    def __init__(self):
+        self.progreso = 10
+        self.mensaje = "Iniciando cálculos ORCA..."
+
+    def actualizar(self, evento):
+        tipo = evento["tipo"]
+        p = self.progreso
+        if tipo == "scf_iter":
+            self.mensaje = f"SCF iteración {evento['iter']}: E = {evento['energia']:.8f} Eh"
+        elif tipo == "scf_convergido":
+            self.mensaje = f"SCF convergido en {evento['ciclos']} ciclos"
+            p = max(p, 15)
+        elif tipo == "opt_ciclo":
+            k = evento["ciclo"]
+            # Número de ciclos desconocido: avance asintótico hacia el 60 %
+            p = 10 + 50 * k / (k + 5)
+            self.mensaje = f"Optimización: ciclo {k}"
+        elif tipo == "gradiente":
+            self.mensaje = f"Gradiente {evento['medida']}: {evento['valor']:.2e}"
+        elif tipo == "opt_convergida":
+            p, self.mensaje = 60, "Optimización convergida"
+        elif tipo == "freq_progreso":
+            p = 60 + 30 * evento["actual"] / max(evento["total"], 1)
+            self.mensaje = f"Frecuencias: geometría {evento['actual']} de {evento['total']}"
+        elif tipo == "frecuencias":
+            p, self.mensaje = 90, "Frecuencias calculadas"
+        elif tipo == "terminado":
+            p, self.mensaje = 95, "ORCA terminado, procesando resultados..."
+        self.progreso = int(max(self.progreso, min(p, 99)))
+        return self.progreso, self.mensaje
+
+
+def formatear_evento(evento):
+    """Línea de texto con el evento, para transmitirlo por stdout."""
+    return PREFIJO_EVENTO + json.dumps(evento)
+
+
+def leer_evento(linea):
+    """Devuelve el evento de una línea escrita con formatear_evento, o None."""
+    if linea.startswith(PREFIJO_EVENTO):
+        return json.loads(linea[len(PREFIJO_EVENTO):])
+    return None
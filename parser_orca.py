@@ -1,159 +1,331 @@
 # parser_orca.py
+import os
 import re
+import mmap
+import json
+import hashlib
+import argparse
+import tempfile
+import dataclasses
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
 import numpy as np
+from ensanchamiento import ensanchar, sigma_a_fwhm
+from espectro import Espectro
+import almacen_salidas
 
 # --------- Utilidades ---------
 _float_re = r"(-?\d+(?:\.\d+)?(?:[EeDd][\+\-]?\d+)?)"
+_float_rb = _float_re.encode()
+
+# Archivos por encima de este tamaño se leen con mmap en lugar de cargarlos en memoria
+MMAP_UMBRAL = 8 * 1024 * 1024
 
 def _to_float(x: str) -> float:
     # Convierte notación Fortran D/E a float
     return float(x.replace("D", "E").replace("d", "E"))
 
-# --------- IR (frecuencias + intensidades) ---------
-def parse_ir(outfile):
-    """Versión con debug"""
-    with open(outfile, "r") as f:
-        lines = f.readlines()
+def _to_floats(valores) -> np.ndarray:
+    # Convierte una lista de bytes/str con notación Fortran a un array float64
+    return np.array(
+        [_to_float(v.decode() if isinstance(v, bytes) else v) for v in valores],
+        dtype=np.float64,
+    )
 
-    freqs = []
-    intens = []
-    
-    print(f"🔍 Analizando archivo: {outfile}")
-    
-    # Buscar sección IR SPECTRUM
-    in_ir = False
-    for i, line in enumerate(lines):
-        if "IR SPECTRUM" in line.upper():
-            print(f"✅ Encontrado IR SPECTRUM en línea {i+1}")
-            in_ir = True
-            # Mostrar algunas líneas siguientes para debug
-            for j in range(i, min(i+10, len(lines))):
-                print(f"Línea {j+1}: {lines[j].strip()}")
-            continue
-            
-        if in_ir:
-            # Buscar líneas de datos
-            m = re.match(rf"\s*\d+:\s+{_float_re}\s+{_float_re}", line)
-            if m:
-                print(f"📊 Línea de datos: {line.strip()}")
-                fcm, inten = _to_float(m.group(1)), _to_float(m.group(2))
-                freqs.append(fcm)
-                intens.append(inten)
-
-    if freqs:
-        return freqs, intens
-
-    # 2) VIBRATIONAL FREQUENCIES (solo frecuencias → intensidades simuladas)
-    in_vib = False
-    for line in lines:
-        if "VIBRATIONAL FREQUENCIES" in line.upper():
-            in_vib = True
-            continue
-        if in_vib:
-            if "NORMAL MODES" in line.upper():
+# --------- Índice de secciones ---------
+# Cabeceras conocidas de ORCA → nombre interno de la sección
+SECCIONES = {
+    "IR SPECTRUM": "ir",
+    "RAMAN SPECTRUM": "raman",
+    "RAMAN ACTIVITIES": "raman_act",
+    "CHEMICAL SHIFTS": "nmr",
+    "CHEMICAL SHIELDING SUMMARY": "nmr_resumen",
+    "VIBRATIONAL FREQUENCIES": "vib",
+    "NORMAL MODES": "normal_modes",
+    "THERMOCHEMISTRY": "thermo",
+    "CARTESIAN COORDINATES (ANGSTROEM)": "coordenadas",   # la última: la geometría final
+}
+
+# Energías, en orden de prioridad creciente (la última con coincidencias gana)
+_ENERGIAS = [
+    ("e_final", rb"FINAL\s+SINGLE\s+POINT\s+ENERGY\s+" + _float_rb),
+    ("e_total", rb"Total\s+Energy\s*[:=]\s*" + _float_rb),
+    ("e_scf", rb"SCF\s+total\s+energy\s*[:=]\s*" + _float_rb),
+    ("e_total_scf", rb"TOTAL\s+SCF\s+ENERGY\s*[:=]?\s*" + _float_rb),
+]
+
+_energia_res = {nombre: re.compile(patron, re.IGNORECASE) for nombre, patron in _ENERGIAS}
+
+# Una sola expresión que localiza cabeceras y energías en una pasada
+_escaneo_re = re.compile(
+    b"|".join(
+        [rb"(?P<%s>%s)" % (nombre.encode(), re.escape(cab.encode()))
+         for cab, nombre in SECCIONES.items()]
+        + [rb"(?P<%s>%s)" % (nombre.encode(), patron) for nombre, patron in _ENERGIAS]
+    ),
+    flags=re.IGNORECASE,
+)
+
+# Literales que anclan la búsqueda: se localizan con find (a velocidad de C) y el
+# regex completo sólo se evalúa en las líneas que los contienen
+_ANCLAS = [cab.encode() for cab in SECCIONES] + [b"ENERGY", b"Energy", b"energy"]
+
+_ir_re = re.compile(rb"^[ \t]*(\d+):[ \t]+" + _float_rb + rb"[ \t]+" + _float_rb, re.M)
+_raman_re = re.compile(rb"^[ \t]*(\d+):?[ \t]+" + _float_rb + rb"[ \t]+" + _float_rb, re.M)
+_vib_re = re.compile(rb"^[ \t]*\d+:[ \t]+" + _float_rb + rb"[ \t]+cm\*\*-1", re.M)
+_nmr_re = re.compile(
+    rb"^[ \t]*(\d+)[ \t]+([A-Za-z]{1,2})[ \t]+" + _float_rb + rb"[ \t]+ppm", re.M
+)
+# Tabla de ORCA 5/6: núcleo, elemento, apantallamiento isotrópico y anisotropía
+_nmr_resumen_re = re.compile(
+    rb"^[ \t]*(\d+)[ \t]+([A-Za-z]{1,2})[ \t]+" + _float_rb + rb"[ \t]+" + _float_rb + rb"[ \t]*\r?$", re.M
+)
+
+
+@dataclass
+class OrcaResult:
+    """Resultados de una salida de ORCA leída en una sola pasada.
+
+    `secciones` guarda el offset en bytes de la última aparición de cada
+    cabecera conocida (ver SECCIONES).
+    """
+    outfile: str
+    secciones: dict = field(default_factory=dict)
+    energia: float = None
+    ir_freqs: np.ndarray = field(default_factory=lambda: np.empty(0))
+    ir_intens: np.ndarray = field(default_factory=lambda: np.empty(0))
+    ir_modos: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.int64))
+    vib_freqs: np.ndarray = field(default_factory=lambda: np.empty(0))
+    raman_freqs: np.ndarray = field(default_factory=lambda: np.empty(0))
+    raman_intens: np.ndarray = field(default_factory=lambda: np.empty(0))
+    raman_modos: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.int64))
+    nmr_index: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.int64))
+    nmr_elem: np.ndarray = field(default_factory=lambda: np.empty(0, dtype="<U2"))
+    nmr_shift: np.ndarray = field(default_factory=lambda: np.empty(0))
+    # "apantallamiento" (CHEMICAL SHIELDING SUMMARY) o "desplazamiento" (CHEMICAL SHIFTS antiguo)
+    nmr_magnitud: str = "apantallamiento"
+
+    def espectro(self, tipo="ir"):
+        """Espectro ("ir", "raman" o "nmr") sobre los arrays del resultado, sin copiarlos.
+
+        IR sale de IR SPECTRUM o, si falta, de VIBRATIONAL FREQUENCIES con
+        intensidad simulada 1.0. Raman guarda las actividades de ORCA (ver
+        Espectro.corregir_raman); NMR, el apantallamiento isotrópico de cada
+        núcleo con intensidad 1 (rmn.py lo convierte en desplazamientos) o,
+        en salidas antiguas, el desplazamiento que ya da ORCA (ver nmr_magnitud).
+        """
+        if tipo == "ir":
+            if self.ir_freqs.size:
+                return Espectro("ir", self.ir_freqs, self.ir_intens, self.ir_modos, origen=self.outfile)
+            # asigna intensidad simulada para graficar
+            return Espectro("ir", self.vib_freqs, None, origen=self.outfile, simulado=True)
+        if tipo == "raman":
+            return Espectro("raman", self.raman_freqs, self.raman_intens, self.raman_modos,
+                            origen=self.outfile, magnitud="actividad")
+        if tipo == "nmr":
+            return Espectro("nmr", self.nmr_shift, None, self.nmr_index, self.nmr_elem, origen=self.outfile,
+                            magnitud=self.nmr_magnitud)
+        raise ValueError(f"Tipo de espectro desconocido: {tipo}")
+
+    def espectro_ir(self):
+        """Espectro IR (ver espectro)."""
+        return self.espectro("ir")
+
+
+def _leer_buffer(f):
+    """Devuelve el contenido del archivo abierto: mmap si es grande, bytes si no."""
+    size = os.fstat(f.fileno()).st_size
+    if size >= MMAP_UMBRAL:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return f.read()
+
+
+@contextmanager
+def _abrir(outfile):
+    """Contenido de la salida (plana o comprimida) como buffer: mmap si es grande, bytes si no."""
+    ruta = almacen_salidas.resolver(outfile)
+    if almacen_salidas.comprimida(ruta):
+        buf = almacen_salidas.descomprimir(ruta, MMAP_UMBRAL)
+    else:
+        with open(ruta, "rb") as f:
+            buf = _leer_buffer(f)
+    try:
+        yield buf
+    finally:
+        if isinstance(buf, mmap.mmap):
+            buf.close()
+
+
+@contextmanager
+def _seccion(outfile, resultado, nombre):
+    """(buffer, offset) para leer la sección `nombre` de la salida.
+
+    Una salida plana se abre entera (mmap, sin copia) y el offset es el del
+    índice; de una comprimida sólo se descomprime el tramo desde la sección
+    hasta la siguiente cabecera conocida, y el offset es 0.
+    """
+    inicio = resultado.secciones[nombre]
+    if not almacen_salidas.comprimida(almacen_salidas.resolver(outfile)):
+        with _abrir(outfile) as buf:
+            yield buf, inicio
+        return
+    fin = min((o for o in resultado.secciones.values() if o > inicio), default=None)
+    yield almacen_salidas.leer_rango(outfile, inicio, fin), 0
+
+
+def _bloque(buf, secciones, nombre, limites):
+    """Devuelve los bytes de la sección `nombre` hasta la siguiente cabecera conocida."""
+    inicio = secciones.get(nombre)
+    if inicio is None:
+        return None
+    fin = next((o for o in limites if o > inicio), len(buf))
+    # Saltar la propia línea de cabecera
+    salto = buf.find(b"\n", inicio, fin)
+    return buf[salto + 1 if salto != -1 else fin:fin]
+
+
+def _bloque_hasta_vacia(bloque, patron):
+    """Coincidencias de `patron` hasta la primera línea vacía tras los datos."""
+    matches = []
+    for m in patron.finditer(bloque):
+        if matches:
+            previo = matches[-1].end()
+            if re.search(rb"\n[ \t]*\r?\n", bloque[previo:m.start() + 1]):
                 break
-            m = re.search(rf"\s*\d+:\s+{_float_re}\s+cm\*\*-1", line)
-            if m:
-                freqs.append(_to_float(m.group(1)))
-                intens.append(1.0)  # asigna intensidad simulada para graficar
+        matches.append(m)
+    return matches
+
+
+def _escanear(buf):
+    """Coincidencias de _escaneo_re en orden, evaluando sólo las líneas con un ancla."""
+    encontrados = {}
+    n = len(buf)
+    for ancla in _ANCLAS:
+        pos = buf.find(ancla)
+        while pos != -1:
+            ini = buf.rfind(b"\n", 0, pos) + 1
+            fin = buf.find(b"\n", pos)
+            fin = n if fin == -1 else fin
+            # Margen tras la línea: algunas energías continúan en la línea siguiente
+            for m in _escaneo_re.finditer(buf, ini, min(n, fin + 256)):
+                if m.start() > fin:
+                    break
+                encontrados[m.start()] = m
+            pos = buf.find(ancla, fin)
+    return [encontrados[k] for k in sorted(encontrados)]
+
+
+def parse_orca(outfile) -> OrcaResult:
+    """Lee un .out de ORCA (plano o comprimido) una sola vez y extrae todas las secciones conocidas."""
+    with _abrir(outfile) as buf:
+        return _parse_buffer(almacen_salidas.ruta_logica(outfile), buf)
+
+
+def _parse_buffer(outfile, buf) -> OrcaResult:
+    res = OrcaResult(outfile=outfile)
+
+    # 1) Índice: offsets de cabeceras y última energía de cada tipo
+    energias = {}
+    limites = []
+    for m in _escanear(buf):
+        tipo = m.lastgroup
+        if tipo.startswith("e_"):
+            energias[tipo] = m.group(tipo)
+        else:
+            res.secciones[tipo] = m.start()
+            limites.append(m.start())
+
+    for nombre, _ in reversed(_ENERGIAS):
+        if nombre in energias:
+            valor = _energia_res[nombre].match(energias[nombre]).group(1)
+            res.energia = _to_float(valor.decode())
+            break
+
+    # 2) Cada sección se analiza sólo dentro de su rango de bytes
+    bloque = _bloque(buf, res.secciones, "ir", limites)
+    if bloque:
+        filas = _ir_re.findall(bloque)
+        if filas:
+            modos, fr, it = zip(*filas)
+            res.ir_freqs, res.ir_intens = _to_floats(fr), _to_floats(it)
+            res.ir_modos = np.array(modos, dtype=np.int64)
 
-    return freqs, intens
+    bloque = _bloque(buf, res.secciones, "vib", limites)
+    if bloque:
+        res.vib_freqs = _to_floats(_vib_re.findall(bloque))
 
-def process_ir_data(freqs, intensities, start=400, end=4000, points=1000, sigma=15.0):
+    for nombre in ("raman", "raman_act"):
+        bloque = _bloque(buf, res.secciones, nombre, limites)
+        if bloque:
+            matches = _bloque_hasta_vacia(bloque, _raman_re)
+            if matches:
+                res.raman_modos = np.array([int(m.group(1)) for m in matches], dtype=np.int64)
+                res.raman_freqs = _to_floats([m.group(2) for m in matches])
+                res.raman_intens = _to_floats([m.group(3) for m in matches])
+                break
+
+    for seccion, patron in (("nmr_resumen", _nmr_resumen_re), ("nmr", _nmr_re)):
+        bloque = _bloque(buf, res.secciones, seccion, limites)
+        matches = _bloque_hasta_vacia(bloque, patron) if bloque else None
+        if matches:
+            res.nmr_index = np.array([int(m.group(1)) for m in matches], dtype=np.int64)
+            res.nmr_elem = np.array([m.group(2).decode() for m in matches], dtype="<U2")
+            res.nmr_shift = _to_floats([m.group(3) for m in matches])
+            res.nmr_magnitud = "apantallamiento" if seccion == "nmr_resumen" else "desplazamiento"
+            break
+
+    return res
+
+
+# --------- IR (frecuencias + intensidades) ---------
+def parse_ir(outfile):
+    """
+    Devuelve el Espectro IR de la sección IR SPECTRUM.
+    Si no existe, usa VIBRATIONAL FREQUENCIES con intensidad simulada 1.0.
+    """
+    return leer_resultado(outfile).espectro("ir")
+
+def process_ir_data(freqs, intensities, start=400, end=4000, points=1000, sigma=15.0,
+                    forma="gauss", fwhm=None, ventana=None):
     """Procesa datos para generar un espectro IR suavizado.
     
     Args:
-        freqs: Lista de frecuencias
-        intensities: Lista de intensidades
+        freqs: Frecuencias (array o lista)
+        intensities: Intensidades (array o lista)
         start, end: Rango de frecuencias (cm-1)
         points: Número de puntos para el espectro
         sigma: Ancho de los picos gaussianos
+        forma: Forma de línea ("gauss", "lorentz" o "voigt")
+        fwhm: Ancho a media altura (escalar o uno por pico); si es None se deriva de sigma
+        ventana: Truncar cada pico a ±ventana·FWHM (None = rejilla completa)
     """
     x = np.linspace(start, end, points)
-    y = np.zeros_like(x)
-    
-    # Normalizar intensidades
-    max_intensity = max(intensities)
-    if max_intensity > 0:
-        intensities = [i/max_intensity for i in intensities]
-    
-    # Generar curva suavizada
-    for freq, inten in zip(freqs, intensities):
-        y += inten * np.exp(-(x - freq)**2 / (2 * sigma**2))
+    # Picos con intensidades normalizadas (los arrays de entrada no se copian)
+    picos = Espectro("ir", freqs, intensities).normalizado()
     
-    # Normalizar resultado final
-    if np.max(y) > 0:
-        y = y / np.max(y)
+    # Generar curva suavizada (todos los picos a la vez) y normalizar resultado final
+    if fwhm is None:
+        fwhm = sigma_a_fwhm(sigma)
+    y = ensanchar(picos.x, picos.intensidad, x, fwhm, forma, ventana=ventana, normalizar=True)
     
-    return x, y, list(zip(freqs, intensities))
+    return x, y, picos
 
 # --------- Raman ---------
 def parse_raman(outfile):
     """
-    Devuelve dict {freq_cm-1: intensidad}.
+    Devuelve el Espectro Raman (RAMAN SPECTRUM o, si falta, RAMAN ACTIVITIES).
+    Los modos degenerados se conservan como picos distintos.
     """
-    with open(outfile, "r") as f:
-        lines = f.readlines()
-
-    data = {}
-    in_raman = False
-    for line in lines:
-        if "RAMAN SPECTRUM" in line.upper():
-            in_raman = True
-            continue
-        if in_raman:
-            if line.strip() == "" or "IR SPECTRUM" in line.upper():
-                break
-            m = re.match(rf"\s*\d+\s+{_float_re}\s+{_float_re}", line)
-            if m:
-                freq = _to_float(m.group(1))
-                inten = _to_float(m.group(2))
-                data[freq] = inten
-
-    if data:
-        return data
-
-    # fallback: "RAMAN ACTIVITIES"
-    in_act = False
-    for line in lines:
-        if "RAMAN ACTIVITIES" in line.upper():
-            in_act = True
-            continue
-        if in_act:
-            if line.strip() == "":
-                break
-            m = re.match(rf"\s*\d+\s+{_float_re}\s+{_float_re}", line)
-            if m:
-                freq = _to_float(m.group(1))
-                act = _to_float(m.group(2))
-                data[freq] = act
-    return data
+    return leer_resultado(outfile).espectro("raman")
 
 # --------- NMR ---------
 def parse_nmr(outfile):
     """
-    Devuelve lista [(atom_index, element, shift_ppm), ...].
+    Devuelve el Espectro NMR: apantallamientos isotrópicos (ppm), índice del átomo en `modo` y
+    `elemento`. Los desplazamientos químicos se obtienen con rmn.desplazamientos.
     """
-    with open(outfile, "r") as f:
-        lines = f.readlines()
-
-    shifts = []
-    in_block = False
-    for line in lines:
-        if "CHEMICAL SHIFTS" in line.upper():
-            in_block = True
-            continue
-        if in_block:
-            if line.strip() == "":
-                if shifts:
-                    break
-            m = re.match(rf"\s*(\d+)\s+([A-Za-z]{{1,2}})\s+{_float_re}\s+ppm", line)
-            if m:
-                idx = int(m.group(1))
-                elem = m.group(2)
-                shift = _to_float(m.group(3))
-                shifts.append((idx, elem, shift))
-    return shifts
+    return leer_resultado(outfile).espectro("nmr")
 
 # --------- Energía ---------
 def parse_energy_total(outfile):
@@ -165,17 +337,291 @@ def parse_energy_total(outfile):
     - TOTAL SCF ENERGY
     Devuelve float o None.
     """
-    with open(outfile, "r") as f:
-        text = f.read()
+    return leer_resultado(outfile).energia
+
+# --------- Geometría ---------
+_cartesianas_re = re.compile(
+    rb"^[ \t]*([A-Z][a-z]?)[ \t]+" + _float_rb + rb"[ \t]+" + _float_rb + rb"[ \t]+" + _float_rb, re.M
+)
+
+
+def geometria_final(outfile):
+    """
+    Última geometría de "CARTESIAN COORDINATES (ANGSTROEM)" (la optimizada si hubo Opt).
+    Devuelve (elementos, coords Nx3) o None si la salida no tiene coordenadas.
+
+    El offset de la sección sale del índice del resultado, de modo que sólo
+    se lee ese tramo (en una salida comprimida, sólo sus tramas).
+    """
+    inicio = leer_resultado(outfile).secciones.get("coordenadas")
+    if inicio is None:
+        return None
+    filas = _bloque_hasta_vacia(almacen_salidas.leer_rango(outfile, inicio, inicio + 200_000),
+                                _cartesianas_re)
+    if not filas:
+        return None
+    elementos = [m.group(1).decode() for m in filas]
+    coords = np.array([[_to_float(v.decode()) for v in m.groups()[1:4]] for m in filas]).reshape(-1, 3)
+    return elementos, coords
+
+
+# --------- Modos normales ---------
+# Matrices de modos de más de este tamaño se escriben en un .npy mapeado en disco
+MODOS_MEMMAP_UMBRAL = 64 * 1024 * 1024
+
+# Línea de cabecera de un bloque de columnas: sólo índices de modo
+_cabecera_modos_re = re.compile(rb"^[ \t]*\d+(?:[ \t]+\d+)*[ \t]*\r?$", re.M)
+# Fin de la primera tabla: otra cabecera o una línea vacía
+_corte_modos_re = re.compile(rb"^(?:[ \t]*\d+(?:[ \t]+\d+)*)?[ \t]*\r?$", re.M)
+
+
+def ruta_modos(outfile):
+    """Ruta del .npy con la matriz de modos normales, junto al .out."""
+    return almacen_salidas.ruta_logica(outfile) + ".modos.npy"
+
+
+def _filas(buf, ini, n):
+    """Bytes de las `n` líneas que empiezan en el offset `ini`."""
+    # ORCA escribe todas las filas de un bloque con el mismo ancho: se cortan de una vez
+    ancho = buf.find(b"\n", ini) + 1 - ini
+    datos = buf[ini:ini + n * ancho] if ancho > 0 else b""
+    if datos.count(b"\n") != n or not datos.endswith(b"\n"):
+        fin = ini
+        for _ in range(n):
+            fin = buf.find(b"\n", fin) + 1 or len(buf)
+        datos = buf[ini:fin]
+    return datos
+
+
+def _llenar_modos(buf, inicio, modos, outfile):
+    """Copia en `modos` (3N × 3N) los bloques de columnas de NORMAL MODES desde `inicio`."""
+    n = modos.shape[0]
+    pos = inicio
+    for c0 in range(0, n, 6):
+        cab = _cabecera_modos_re.search(buf, pos)
+        if cab is None:
+            raise ValueError(f"{outfile}: faltan columnas de NORMAL MODES desde el modo {c0}")
+        k = min(len(cab.group().split()), n - c0)
+        datos = _filas(buf, cab.end() + 1, n)
+        # Todo el bloque (índice de fila + k columnas) se convierte en C de una vez
+        try:
+            valores = np.fromstring(datos, sep=" ")
+        except ValueError:
+            valores = None
+        if valores is None or valores.size != n * (k + 1):
+            raise ValueError(f"{outfile}: bloque de NORMAL MODES incompleto en el modo {c0}")
+        modos[:, c0:c0 + k] = valores.reshape(n, k + 1)[:, 1:]
+        pos = cab.end() + 1 + len(datos)
+
+
+def parse_normal_modes(outfile, memmap=None, destino=None):
+    """
+    Matriz de modos normales (3N × 3N, float32) del bloque NORMAL MODES.
+    La columna k es el desplazamiento cartesiano (x1, y1, z1, x2, ...) del
+    modo k, numerado como en ORCA.
+
+    La matriz se reserva de antemano y cada bloque de 6 columnas se convierte
+    de una vez con numpy. Si ocupa más de MODOS_MEMMAP_UMBRAL (o memmap=True)
+    se escribe en un .npy mapeado en disco (`destino`, por defecto
+    ruta_modos) que se reutiliza mientras sea más reciente que el .out.
+    En una salida comprimida sólo se descomprime el tramo de NORMAL MODES.
+    Devuelve None si la salida no tiene modos normales.
+    """
+    res = leer_resultado(outfile)
+    inicio = res.secciones.get("normal_modes")
+    if inicio is None:
+        return None
+    destino = destino or ruta_modos(outfile)
+    n = res.vib_freqs.size
+
+    if memmap is not False and os.path.exists(destino) \
+            and os.path.getmtime(destino) >= os.path.getmtime(almacen_salidas.resolver(outfile)):
+        modos = np.load(destino, mmap_mode="r")
+        if modos.ndim == 2 and modos.shape[0] == modos.shape[1] and (not n or modos.shape[0] == n):
+            return modos
+
+    with _seccion(outfile, res, "normal_modes") as (buf, inicio):
+        if not n:
+            # Sin VIBRATIONAL FREQUENCIES: 3N son las filas de la primera tabla
+            cab = _cabecera_modos_re.search(buf, inicio)
+            if cab is None:
+                return None
+            corte = _corte_modos_re.search(buf, cab.end() + 1)
+            n = buf[cab.end() + 1:corte.start() if corte else len(buf)].count(b"\n")
+        if memmap is None:
+            memmap = n * n * 4 > MODOS_MEMMAP_UMBRAL
+        if not memmap:
+            modos = np.empty((n, n), dtype=np.float32)
+            _llenar_modos(buf, inicio, modos, outfile)
+            return modos
+        # Temporal + rename, como los sidecars
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(destino) or ".", prefix=".modos-")
+        os.close(fd)
+        try:
+            modos = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float32, shape=(n, n))
+            _llenar_modos(buf, inicio, modos, outfile)
+            modos.flush()
+            del modos
+            os.replace(tmp, destino)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+    return np.load(destino, mmap_mode="r")
+
+
+# --------- Sidecars (.out.npz) ---------
+# Subir si cambia lo que extrae el parser: invalida todos los sidecars existentes
+VERSION_SIDECAR = 5
+
+
+def ruta_sidecar(outfile):
+    """Ruta del sidecar con el resultado parseado, junto al .out (también si está comprimido)."""
+    return almacen_salidas.ruta_logica(outfile) + ".npz"
+
+
+def _sha256(ruta):
+    with open(ruta, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def guardar_npz(destino, resultado, meta=None):
+    """Escribe un OrcaResult como .npz (ruta o archivo abierto) con metadatos JSON opcionales."""
+    arrays = {
+        f.name: getattr(resultado, f.name)
+        for f in dataclasses.fields(resultado)
+        if isinstance(getattr(resultado, f.name), np.ndarray)
+    }
+    np.savez(
+        destino,
+        outfile=np.array(resultado.outfile),
+        energia=np.array(np.nan if resultado.energia is None else resultado.energia),
+        nmr_magnitud=np.array(resultado.nmr_magnitud),
+        _secc_nombres=np.array(list(resultado.secciones), dtype=str),
+        _secc_offsets=np.array(list(resultado.secciones.values()), dtype=np.int64),
+        _meta=np.array(json.dumps(meta or {})),
+        **arrays,
+    )
+
+
+def cargar_npz(ruta):
+    """Lee un .npz escrito con guardar_npz. Devuelve (OrcaResult, metadatos)."""
+    with np.load(ruta, allow_pickle=False) as datos:
+        campos = {k: datos[k] for k in datos.files}
+    meta = json.loads(str(campos.pop("_meta", "{}")))
+    secciones = dict(zip(campos.pop("_secc_nombres").tolist(),
+                         campos.pop("_secc_offsets").tolist()))
+    energia = float(campos.pop("energia"))
+    resultado = OrcaResult(
+        outfile=str(campos.pop("outfile")),
+        secciones=secciones,
+        energia=None if np.isnan(energia) else energia,
+        nmr_magnitud=str(campos.pop("nmr_magnitud")),
+        **campos,
+    )
+    return resultado, meta
+
+
+def escribir_sidecar(outfile, resultado, st=None, sha256=None):
+    """Guarda el resultado junto al .out con el tamaño, mtime y hash del archivo de la salida.
+
+    Si la salida está comprimida, son los del archivo comprimido.
+    """
+    fisico = almacen_salidas.resolver(outfile)
+    st = st or os.stat(fisico)
+    meta = {"version": VERSION_SIDECAR, "tamano": st.st_size, "mtime_ns": st.st_mtime_ns,
+            "sha256": sha256 or _sha256(fisico)}
+    ruta = ruta_sidecar(outfile)
+    # Temporal + rename: un lector nunca ve un sidecar a medias
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(ruta) or ".", prefix=".sidecar-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            guardar_npz(f, resultado, meta)
+        os.replace(tmp, ruta)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return ruta
+
+
+def _sidecar_vigente(outfile, st):
+    """OrcaResult del sidecar si corresponde a la salida actual, o None."""
+    try:
+        resultado, meta = cargar_npz(ruta_sidecar(outfile))
+    except (OSError, ValueError, KeyError):
+        return None
+    if meta.get("version") != VERSION_SIDECAR or meta.get("tamano") != st.st_size:
+        return None
+    if meta.get("mtime_ns") != st.st_mtime_ns:
+        # Misma longitud y otra fecha (copia, touch): decide el contenido
+        sha = _sha256(almacen_salidas.resolver(outfile))
+        if meta.get("sha256") != sha:
+            return None
+        try:
+            escribir_sidecar(outfile, resultado, st, sha)
+        except OSError:
+            pass  # directorio de sólo lectura: el sidecar sigue valiendo por su hash
+    resultado.outfile = outfile
+    return resultado
+
+
+def leer_resultado(outfile, usar_sidecar=True):
+    """OrcaResult de un .out: desde su sidecar si está vigente, si no lo parsea y lo guarda.
+
+    `outfile` es la ruta lógica .out; si sólo existe comprimida, se usa esa.
+    """
+    outfile = almacen_salidas.ruta_logica(outfile)
+    if not usar_sidecar:
+        return parse_orca(outfile)
+    # stat y hash antes de parsear: si ORCA sigue escribiendo, el sidecar queda obsoleto
+    fisico = almacen_salidas.resolver(outfile)
+    st = os.stat(fisico)
+    resultado = _sidecar_vigente(outfile, st)
+    if resultado is not None:
+        return resultado
+    sha = _sha256(fisico)
+    resultado = parse_orca(outfile)
+    try:
+        escribir_sidecar(outfile, resultado, st, sha)
+    except OSError:
+        pass  # directorio de sólo lectura: se devuelve el resultado sin sidecar
+    return resultado
+
+
+def _reconstruir(outfile, forzar=False):
+    try:
+        st = os.stat(almacen_salidas.resolver(outfile))
+        if not forzar and _sidecar_vigente(outfile, st) is not None:
+            return outfile, "vigente"
+        escribir_sidecar(outfile, parse_orca(outfile), st)
+        return outfile, "nuevo"
+    except Exception as e:
+        return outfile, f"error: {e}"
+
+
+def reconstruir_sidecars(raiz="runs", procesos=None, forzar=False):
+    """Crea o actualiza en paralelo los sidecars de todos los .out (planos o comprimidos) bajo `raiz`."""
+    salidas = sorted({
+        os.path.join(d, almacen_salidas.salida_de(nombre))
+        for d, _, archivos in os.walk(raiz)
+        for nombre in archivos if almacen_salidas.salida_de(nombre)
+    })
+    estados = {}
+    with ProcessPoolExecutor(max_workers=procesos) as pool:
+        for outfile, estado in pool.map(_reconstruir, salidas, [forzar] * len(salidas), chunksize=8):
+            estados[outfile] = estado
+            if estado.startswith("error"):
+                print(f"❌ {outfile}: {estado}")
+    nuevos = sum(e == "nuevo" for e in estados.values())
+    vigentes = sum(e == "vigente" for e in estados.values())
+    print(f"✅ {len(salidas)} salidas: {nuevos} sidecars nuevos, {vigentes} ya vigentes, "
+          f"{len(salidas) - nuevos - vigentes} con errores")
+    return estados
 
-    candidates = []
-    for m in re.finditer(rf"FINAL SINGLE POINT ENERGY\s+{_float_re}", text, flags=re.IGNORECASE):
-        candidates.append(_to_float(m.group(1)))
-    for m in re.finditer(rf"Total Energy\s*[:=]\s*{_float_re}", text, flags=re.IGNORECASE):
-        candidates.append(_to_float(m.group(1)))
-    for m in re.finditer(rf"SCF\s+total\s+energy\s*[:=]\s*{_float_re}", text, flags=re.IGNORECASE):
-        candidates.append(_to_float(m.group(1)))
-    for m in re.finditer(rf"TOTAL\s+SCF\s+ENERGY\s*[:=]?\s*{_float_re}", text, flags=re.IGNORECASE):
-        candidates.append(_to_float(m.group(1)))
 
-    return candidates[-1] if candidates else None
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sidecars con los resultados parseados de ORCA")
+    parser.add_argument("raiz", nargs="?", default="runs", help="Directorio con salidas .out")
+    parser.add_argument("--procesos", type=int, default=None, help="Procesos en paralelo")
+    parser.add_argument("--forzar", action="store_true", help="Reescribir también los vigentes")
+    args = parser.parse_args()
+    reconstruir_sidecars(args.raiz, args.procesos, args.forzar)
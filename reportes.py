@@ -0,0 +1,321 @@
+# reportes.py
+import os
+import argparse
+import numpy as np
+from reportlab import rl_config
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+from parser_orca import leer_resultado, geometria_final, process_ir_data
+import rmn
+import almacen_salidas
+from visualize import leer_xyz, vista_plana, COLORES_CPK, COLOR_DEFECTO, RADIOS_COVALENTES, RADIO_DEFECTO
+
+ANCHO, ALTO = A4
+MARGEN = 50
+FILA = 12              # alto de una fila de la tabla de frecuencias (pt)
+PICOS_ETIQUETADOS = 8
+PUNTOS_CURVA = 600     # vértices del trazado del espectro (~1 por punto tipográfico)
+
+# Flujos binarios comprimidos: PDFs más pequeños y sin la codificación ASCII85 en Python puro
+rl_config.useA85 = 0
+
+
+def _titulo(c, texto, y=ALTO - MARGEN):
+    c.setFont("Helvetica-Bold", 14)
+    c.drawString(MARGEN, y, texto)
+
+
+def dibujar_espectro(c, x, y, ancho, alto, espectro, inicio=400, fin=4000, puntos=PUNTOS_CURVA):
+    """Dibuja el Espectro IR ensanchado como trazado vectorial en el rectángulo (x, y, ancho, alto).
+
+    El eje de número de onda va de `fin` a `inicio` (convención IR); los picos
+    más intensos se etiquetan.
+    """
+    xs, ys, picos = process_ir_data(espectro.x, espectro.intensidad, inicio, fin, puntos)
+    picos = picos.seleccion((picos.x >= inicio) & (picos.x <= fin))
+    ymax = max(float(ys.max()) if ys.size else 0.0, 1e-12) * 1.1
+
+    def px(nu):
+        return x + (fin - nu) / (fin - inicio) * ancho
+
+    def py(v):
+        return y + v / ymax * alto
+
+    # Ejes y marcas
+    c.setLineWidth(0.6)
+    c.setStrokeColorRGB(0, 0, 0)
+    c.rect(x, y, ancho, alto)
+    c.setFont("Helvetica", 7)
+    for nu in range(int(np.ceil(inicio / 500) * 500), fin + 1, 500):
+        c.line(px(nu), y, px(nu), y - 3)
+        c.drawCentredString(px(nu), y - 11, str(nu))
+    c.setFont("Helvetica", 8)
+    c.drawCentredString(x + ancho / 2, y - 22, "Número de onda (cm-1)")
+    c.saveState()
+    c.translate(x - 10, y + alto / 2)
+    c.rotate(90)
+    c.drawCentredString(0, 0, "Intensidad (normalizada)")
+    c.restoreState()
+
+    # Picos discretos
+    c.setStrokeColorRGB(0.75, 0.75, 0.75)
+    c.setLineWidth(0.4)
+    for nu, inten in zip(picos.x.tolist(), picos.intensidad.tolist()):
+        c.line(px(nu), y, px(nu), py(inten))
+
+    # Curva ensanchada
+    trazo = c.beginPath()
+    trazo.moveTo(px(xs[0]), py(ys[0]))
+    for nu, v in zip(xs[1:].tolist(), ys[1:].tolist()):
+        trazo.lineTo(px(nu), py(v))
+    c.setStrokeColorRGB(0.1, 0.3, 0.7)
+    c.setLineWidth(0.9)
+    c.drawPath(trazo, stroke=1, fill=0)
+
+    # Etiquetas de los picos principales, a la altura de la curva
+    c.setFillColorRGB(0.2, 0.2, 0.2)
+    c.setFont("Helvetica", 6)
+    for nu in picos.x[np.argsort(-picos.intensidad, kind="stable")[:PICOS_ETIQUETADOS]].tolist():
+        v = float(np.interp(nu, xs, ys))
+        c.drawCentredString(px(nu), min(py(v) + 3, y + alto - 7), f"{nu:.0f}")
+    c.setFillColorRGB(0, 0, 0)
+    c.setStrokeColorRGB(0, 0, 0)
+
+
+def dibujar_molecula(c, x, y, tam, elementos, coords):
+    """Dibuja la molécula (bolas y varillas en proyección plana) en el cuadrado (x, y, tam)."""
+    pos, enlaces = vista_plana(elementos, coords)
+    radios = np.array([0.35 * RADIOS_COVALENTES.get(e, RADIO_DEFECTO) + 0.12 for e in elementos])
+    extension = max(float(np.abs(pos[:, :2]).max() + radios.max()), 1e-6) if len(pos) else 1.0
+    escala = 0.48 * tam / extension
+    cx, cy = x + tam / 2, y + tam / 2
+
+    c.setStrokeColorRGB(0.45, 0.45, 0.45)
+    c.setLineWidth(max(0.5, 0.12 * escala))
+    for i, j in enlaces:
+        c.line(cx + pos[i, 0] * escala, cy + pos[i, 1] * escala,
+               cx + pos[j, 0] * escala, cy + pos[j, 1] * escala)
+    c.setLineWidth(0.4)
+    c.setStrokeColorRGB(0.2, 0.2, 0.2)
+    # De atrás hacia delante para que los átomos cercanos tapen a los lejanos
+    for k in np.argsort(pos[:, 2]):
+        c.setFillColorRGB(*COLORES_CPK.get(elementos[k], COLOR_DEFECTO))
+        c.circle(cx + pos[k, 0] * escala, cy + pos[k, 1] * escala, radios[k] * escala, stroke=1, fill=1)
+    c.setFillColorRGB(0, 0, 0)
+    c.setStrokeColorRGB(0, 0, 0)
+
+
+def _tabla(c, filas, x, y_sup, y_inf, columnas):
+    """Dibuja filas (frecuencia, intensidad) en columnas; devuelve cuántas cupieron."""
+    por_columna = int((y_sup - y_inf) // FILA) - 1
+    ancho = (ANCHO - MARGEN - x) / columnas
+    n = 0
+    for col in range(columnas):
+        bloque = filas[n:n + por_columna]
+        if not bloque:
+            break
+        x0 = x + col * ancho
+        c.setFont("Helvetica-Bold", 8)
+        c.drawString(x0, y_sup, "Modo")
+        c.drawRightString(x0 + 85, y_sup, "cm-1")
+        c.drawRightString(x0 + 140, y_sup, "Intensidad")
+        c.setFont("Helvetica", 8)
+        for i, (modo, frec, inten) in enumerate(bloque, 1):
+            yy = y_sup - i * FILA
+            c.drawString(x0, yy, str(modo))
+            c.drawRightString(x0 + 85, yy, f"{frec:.2f}")
+            c.drawRightString(x0 + 140, yy, f"{inten:.4g}")
+        n += len(bloque)
+    return n
+
+
+def paginas_molecula(c, nombre, energia, espectro, elementos=None, coords=None):
+    """Dibuja el reporte de una molécula a partir de la página actual de `c`.
+
+    Primera página: energía, espectro vectorial, molécula y el comienzo de la
+    tabla de frecuencias; la tabla completa continúa en páginas siguientes.
+    """
+    _titulo(c, f"Reporte ORCA: {nombre}")
+    c.setFont("Helvetica", 11)
+    c.drawString(MARGEN, ALTO - MARGEN - 22,
+                 f"Energía total: {energia:.6f} Eh" if energia else "Energía no encontrada")
+    c.drawString(MARGEN, ALTO - MARGEN - 38, f"Número de frecuencias vibracionales: {len(espectro)}")
+
+    alto_espectro = 250
+    y_espectro = ALTO - MARGEN - 70 - alto_espectro
+    if len(espectro):
+        dibujar_espectro(c, MARGEN + 15, y_espectro, ANCHO - 2 * MARGEN - 15, alto_espectro, espectro)
+
+    y_sup = y_espectro - 50
+    x_tabla = MARGEN
+    if elementos:
+        tam = 220
+        dibujar_molecula(c, MARGEN, y_sup - tam, tam, elementos, coords)
+        x_tabla = MARGEN + tam + 20
+
+    filas = list(zip(espectro.modo.tolist(), espectro.x.tolist(), espectro.intensidad.tolist()))
+    n = _tabla(c, filas, x_tabla, y_sup, MARGEN, 1 if elementos else 3)
+    while n < len(filas):
+        c.showPage()
+        _titulo(c, f"{nombre}: frecuencias (continuación)")
+        n += _tabla(c, filas[n:], MARGEN, ALTO - MARGEN - 30, MARGEN, 3)
+    c.showPage()
+
+
+def dibujar_rmn(c, x, y, ancho, alto, xs, ys, picos, titulo):
+    """Dibuja un espectro RMN ensanchado (eje de ppm decreciente) con sus picos etiquetados."""
+    margen = 0.05 * float(picos.x.max() - picos.x.min()) + 0.5
+    inicio, fin = float(picos.x.min()) - margen, float(picos.x.max()) + margen
+    dentro = (xs >= inicio) & (xs <= fin)
+    xs, ys = xs[dentro], ys[dentro]
+    # Se diezma la curva al ancho del trazado conservando el máximo de cada tramo (picos finos)
+    tramos = max(1, xs.size // PUNTOS_CURVA)
+    if tramos > 1:
+        n = xs.size // tramos * tramos
+        xs = xs[:n].reshape(-1, tramos).mean(axis=1)
+        ys = ys[:n].reshape(-1, tramos).max(axis=1)
+    ymax = max(float(ys.max()) if ys.size else 0.0, 1e-12) * 1.15
+
+    def px(d):
+        return x + (fin - d) / (fin - inicio) * ancho
+
+    def py(v):
+        return y + v / ymax * alto
+
+    c.setLineWidth(0.6)
+    c.rect(x, y, ancho, alto)
+    c.setFont("Helvetica", 7)
+    for d in np.linspace(inicio, fin, 6).tolist():
+        c.line(px(d), y, px(d), y - 3)
+        c.drawCentredString(px(d), y - 11, f"{d:.1f}")
+    c.setFont("Helvetica", 8)
+    c.drawCentredString(x + ancho / 2, y - 22, "Desplazamiento químico (ppm)")
+    c.setFont("Helvetica-Bold", 10)
+    c.drawString(x, y + alto + 6, titulo)
+
+    if xs.size > 1:
+        trazo = c.beginPath()
+        trazo.moveTo(px(xs[0]), py(ys[0]))
+        for d, v in zip(xs[1:].tolist(), ys[1:].tolist()):
+            trazo.lineTo(px(d), py(v))
+        c.setStrokeColorRGB(0.1, 0.5, 0.2)
+        c.setLineWidth(0.9)
+        c.drawPath(trazo, stroke=1, fill=0)
+    c.setFillColorRGB(0.2, 0.2, 0.2)
+    c.setFont("Helvetica", 6)
+    for d in picos.x.tolist():
+        c.drawCentredString(px(d), y + alto - 8, f"{d:.2f}")
+    c.setFillColorRGB(0, 0, 0)
+    c.setStrokeColorRGB(0, 0, 0)
+
+
+def paginas_rmn(c, nombre, espectro, curvas):
+    """Una página por núcleo: espectro RMN y tabla de desplazamientos (δ, núcleos, átomo)."""
+    for nucleo, (xs, ys) in curvas.items():
+        picos = espectro.seleccion(espectro.elemento == nucleo)
+        if not len(picos):
+            continue
+        isotopo = rmn.ISOTOPOS.get(nucleo, nucleo)
+        _titulo(c, f"{nombre}: RMN {isotopo}")
+        c.setFont("Helvetica", 9)
+        c.drawString(MARGEN, ALTO - MARGEN - 18, f"Nivel de teoría: {espectro.meta.get('nivel', '?')}")
+        alto = 250
+        y_espectro = ALTO - MARGEN - 60 - alto
+        dibujar_rmn(c, MARGEN + 15, y_espectro, ANCHO - 2 * MARGEN - 15, alto, xs, ys, picos,
+                    f"Espectro {isotopo}")
+        filas = [(modo + 1, d, n) for modo, d, n in
+                 zip(picos.modo.tolist(), picos.x.tolist(), picos.intensidad.tolist())]
+        y_sup = y_espectro - 50
+        _cabecera_rmn(c, y_sup)
+        fila = 0
+        for atomo, d, n in filas:
+            fila += 1
+            yy = y_sup - fila * FILA
+            if yy < MARGEN:
+                # Tabla larga: sigue en una página nueva con su cabecera
+                c.showPage()
+                y_sup, fila = ALTO - MARGEN, 1
+                _cabecera_rmn(c, y_sup)
+                yy = y_sup - FILA
+            c.drawString(MARGEN, yy, f"{nucleo}{atomo}")
+            c.drawRightString(MARGEN + 85, yy, f"{d:.2f}")
+            c.drawRightString(MARGEN + 140, yy, f"{n:.0f}")
+        c.showPage()
+
+
+def _cabecera_rmn(c, y):
+    """Cabecera de la tabla de desplazamientos RMN."""
+    c.setFont("Helvetica-Bold", 8)
+    for col, cab in ((0, "Átomo"), (85, "δ (ppm)"), (140, "Núcleos")):
+        (c.drawString if col == 0 else c.drawRightString)(MARGEN + col, y, cab)
+    c.setFont("Helvetica", 8)
+
+
+def _geometria(outfile=None, xyz_file=None):
+    """Geometría para el dibujo: la final del .out o, si no hay, la del .xyz."""
+    geometria = geometria_final(outfile) if outfile else None
+    if geometria is None and xyz_file and os.path.exists(xyz_file):
+        geometria = leer_xyz(xyz_file)
+    return geometria or (None, None)
+
+
+def reporte_pdf(pdf_file, nombre, energia, espectro, xyz_file=None, outfile=None, nmr=None):
+    """PDF vectorial de una molécula con su Espectro IR. Devuelve la ruta.
+
+    Con `nmr` = (Espectro de desplazamientos, curvas de rmn.espectros_lote
+    para esta molécula) se añade una página por núcleo.
+    """
+    os.makedirs(os.path.dirname(pdf_file) or ".", exist_ok=True)
+    c = canvas.Canvas(pdf_file, pagesize=A4, pageCompression=1)
+    paginas_molecula(c, nombre, energia, espectro, *_geometria(outfile, xyz_file))
+    if nmr is not None:
+        paginas_rmn(c, nombre, *nmr)
+    c.save()
+    return pdf_file
+
+
+def reporte_lote(pdf_file, entradas):
+    """PDF con el reporte de muchas moléculas (con sus páginas de RMN si las tienen).
+
+    `entradas` es un iterable de (nombre, outfile) o (nombre, outfile, xyz_file);
+    cada salida se lee (desde su sidecar si existe) y se dibuja justo antes de
+    su página, de modo que en memoria sólo hay una molécula a la vez.
+    Devuelve (ruta, número de moléculas).
+    """
+    os.makedirs(os.path.dirname(pdf_file) or ".", exist_ok=True)
+    c = canvas.Canvas(pdf_file, pagesize=A4, pageCompression=1)
+    n = 0
+    for nombre, outfile, *xyz in entradas:
+        try:
+            resultado = leer_resultado(outfile)
+        except OSError as e:
+            print(f"⚠️ {nombre}: {e}")
+            continue
+        paginas_molecula(c, nombre, resultado.energia, resultado.espectro("ir"),
+                         *_geometria(outfile, xyz[0] if xyz else None))
+        if resultado.nmr_shift.size:
+            # Sólo con referencias ya calculadas: el reporte no lanza ORCA
+            espectro_rmn = rmn.procesar(outfile, resultado, xyz[0] if xyz else None, calcular=False)
+            if espectro_rmn is not None and len(espectro_rmn):
+                curvas = {k: (x, y[0]) for k, (x, y) in rmn.espectros_lote([espectro_rmn]).items()}
+                paginas_rmn(c, nombre, espectro_rmn, curvas)
+        n += 1
+    c.save()
+    print(f"✅ Reporte de {n} moléculas generado: {pdf_file}")
+    return pdf_file, n
+
+
+def salidas_en(raiz):
+    """(nombre, outfile) de cada .out (plano o comprimido) bajo `raiz`, en orden, sin listarlos todos de antemano."""
+    for d, subdirs, archivos in os.walk(raiz):
+        subdirs.sort()
+        for nombre in sorted({almacen_salidas.salida_de(a) for a in archivos} - {None}):
+            yield os.path.splitext(nombre)[0], os.path.join(d, nombre)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reporte PDF vectorial de muchas salidas de ORCA")
+    parser.add_argument("raiz", nargs="?", default="runs", help="Directorio con salidas .out")
+    parser.add_argument("--salida", default="results/reportes/reporte_lote.pdf", help="PDF de salida")
+    args = parser.parse_args()
+    reporte_lote(args.salida, salidas_en(args.raiz))
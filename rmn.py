@@ -0,0 +1,353 @@
+# rmn.py
+"""Espectros de RMN a partir de los apantallamientos isotrópicos de ORCA.
+
+ORCA da el apantallamiento absoluto σ de cada núcleo; el desplazamiento
+químico es δ = σ_ref − σ + δ_ref, con σ_ref el apantallamiento del
+compuesto de referencia (TMS para ¹H, ¹³C y ²⁹Si...) calculado con el mismo
+método y base. Las referencias se calculan una sola vez por nivel de teoría
+(un Opt NMR del compuesto de referencia) y se guardan en REFERENCIAS_NMR.
+
+Los núcleos equivalentes (metilos, anillos simétricos...) se agrupan por la
+topología de la molécula y los espectros ensanchados de muchas moléculas y
+núcleos se calculan en una sola llamada a ensanchamiento.ensanchar_lote.
+
+    python rmn.py                                  # tabla de referencias
+    python rmn.py --nivel B3LYP/def2-TZVP --fijar H 31.88
+    python rmn.py runs/*/3_nmr/*.out --csv         # desplazamientos de varias salidas
+"""
+import os
+import re
+import json
+import argparse
+import numpy as np
+import cache_orca
+import almacen_salidas
+import entradas_orca
+from espectro import Espectro
+from ensanchamiento import ensanchar_lote
+
+# Tabla de apantallamientos de referencia por nivel de teoría (se puede sobrescribir por entorno)
+REFERENCIAS_NMR = os.environ.get("ORCA_NMR_REFERENCIAS",
+                                 os.path.join(cache_orca.CACHE_DIR, "referencias_nmr.json"))
+
+# Compuesto de referencia de cada núcleo y su desplazamiento en la escala habitual (ppm)
+PATRONES = {
+    "H": ("tms", 0.0), "C": ("tms", 0.0), "Si": ("tms", 0.0),
+    "N": ("nitrometano", 0.0), "F": ("cfcl3", 0.0),
+    "P": ("ph3", -266.1),   # PH3 gas frente a H3PO4 85 %
+}
+
+# Geometrías de partida de los compuestos de referencia (se optimizan al calcularlos)
+COMPUESTOS = {
+    "tms": """Si    0.0000    0.0000    0.0000
+C     1.0825    1.0825    1.0825
+H     1.3029    0.5810    2.0249
+H     0.5810    2.0249    1.3029
+H     2.0249    1.3029    0.5810
+C     1.0825   -1.0825   -1.0825
+H     1.3029   -0.5810   -2.0249
+H     0.5810   -2.0249   -1.3029
+H     2.0249   -1.3029   -0.5810
+C    -1.0825    1.0825   -1.0825
+H    -1.3029    2.0249   -0.5810
+H    -2.0249    0.5810   -1.3029
+H    -0.5810    1.3029   -2.0249
+C    -1.0825   -1.0825    1.0825
+H    -1.3029   -2.0249    0.5810
+H    -2.0249   -0.5810    1.3029
+H    -0.5810   -1.3029    2.0249
+""",
+    "nitrometano": """C     0.0000    0.0000    0.0000
+N     0.0000    0.0000    1.4900
+O     1.0822    0.0000    2.0533
+O    -1.0822    0.0000    2.0533
+H     0.0000   -1.0396   -0.3278
+H    -0.9003    0.5198   -0.3278
+H     0.9003    0.5198   -0.3278
+""",
+    "cfcl3": """C     0.0000    0.0000    0.0000
+F     0.7679    0.7679    0.7679
+Cl    1.0161   -1.0161   -1.0161
+Cl   -1.0161    1.0161   -1.0161
+Cl   -1.0161   -1.0161    1.0161
+""",
+    "ph3": """P     0.0000    0.0000    0.0000
+H     0.0000   -1.1943   -0.7682
+H    -1.0343    0.5971   -0.7682
+H     1.0343    0.5971   -0.7682
+""",
+}
+
+# Ventana (ppm) y FWHM lorentziano (ppm) de cada núcleo en los espectros simulados
+VENTANAS = {"H": (-1.0, 13.0), "C": (-10.0, 230.0), "N": (-400.0, 100.0), "F": (-250.0, 50.0),
+            "P": (-200.0, 250.0), "Si": (-150.0, 50.0)}
+FWHM = {"H": 0.02, "C": 0.5, "N": 1.0, "F": 1.0, "P": 1.0, "Si": 0.5}
+NUCLEOS = ("H", "C")
+PUNTOS = 8192          # puntos de la rejilla común (en unidades reducidas) de ensanchar_lote
+ISOTOPOS = {"H": "1H", "C": "13C", "N": "15N", "F": "19F", "P": "31P", "Si": "29Si"}
+
+_palabras_re = re.compile(r"^\s*(?:\|\s*\d+>\s*)?!(.*)$", re.M)
+
+
+def nivel(palabras):
+    """Nivel de teoría "método/base" a partir de las palabras clave de ORCA."""
+    palabras = [p for p in palabras if p.upper() not in ("OPT", "NMR", "TIGHTSCF", "MOREAD")]
+    base = next((p for p in palabras if p in entradas_orca.FUNCIONES_BASE),
+                palabras[1] if len(palabras) > 1 else "")
+    metodo = next((p for p in palabras if p != base), "")
+    return f"{metodo}/{base}"
+
+
+def nivel_de_archivo(ruta, limite=200_000):
+    """Nivel de teoría de un .inp o de la copia de la entrada al principio de un .out (o None)."""
+    texto = almacen_salidas.leer_rango(ruta, 0, limite).decode(errors="replace")
+    palabras = [p for m in _palabras_re.finditer(texto) for p in m.group(1).split()]
+    return nivel(palabras) if palabras else None
+
+
+# --------- Referencias ---------
+_tabla = {}
+
+
+def cargar_referencias(ruta=None):
+    """Tabla {nivel: {elemento: {"sigma", "compuesto", "origen"}}} (vacía si no existe)."""
+    ruta = ruta or REFERENCIAS_NMR
+    try:
+        mtime = os.stat(ruta).st_mtime_ns
+    except FileNotFoundError:
+        return {}
+    if ruta not in _tabla or _tabla[ruta][0] != mtime:
+        with open(ruta) as f:
+            _tabla[ruta] = (mtime, json.load(f))
+    return _tabla[ruta][1]
+
+
+def _guardar_referencia(nivel_teoria, elemento, sigma, compuesto, origen, ruta=None):
+    ruta = ruta or REFERENCIAS_NMR
+    tabla = dict(cargar_referencias(ruta))
+    tabla.setdefault(nivel_teoria, {})[elemento] = {"sigma": sigma, "compuesto": compuesto,
+                                                    "origen": origen}
+    os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+    tmp = f"{ruta}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(tabla, f, indent=1, sort_keys=True)
+    os.replace(tmp, ruta)
+
+
+def fijar_referencia(nivel_teoria, elemento, sigma, ruta=None):
+    """Fija a mano el apantallamiento de referencia de un elemento (p. ej. de la bibliografía)."""
+    compuesto = PATRONES.get(elemento, ("manual", 0.0))[0]
+    _guardar_referencia(nivel_teoria, elemento, float(sigma), compuesto, "manual", ruta)
+
+
+def calcular_referencias(nivel_teoria, elementos, directorio=None, ruta=None):
+    """Calcula con ORCA (Opt NMR, con caché) los compuestos de referencia de `elementos`.
+
+    Un mismo compuesto (TMS para H, C y Si) se calcula una sola vez.
+    Devuelve los elementos cuya referencia se añadió a la tabla.
+    """
+    from run_orca import ejecutar_orca, obtener_resultado
+    metodo, base = nivel_teoria.split("/", 1)
+    directorio = directorio or os.path.join(cache_orca.CACHE_DIR, "referencias_nmr")
+    por_compuesto = {}
+    for e in elementos:
+        if e in PATRONES:
+            por_compuesto.setdefault(PATRONES[e][0], []).append(e)
+    calculados = []
+    for compuesto, de_este in por_compuesto.items():
+        coords = COMPUESTOS[compuesto]
+        simbolos = [l.split()[0] for l in coords.splitlines() if l.strip()]
+        nprocs, maxcore = entradas_orca.dimensionar(entradas_orca.contar_funciones_base(simbolos, base), "nmr")
+        carpeta = os.path.join(directorio, nivel_teoria.replace("/", "_"))
+        os.makedirs(carpeta, exist_ok=True)
+        inpfile = os.path.join(carpeta, f"{compuesto}.inp")
+        pal = f"%pal nprocs {nprocs} end\n" if nprocs > 1 else ""
+        with open(inpfile, "w") as f:
+            f.write(f"! {metodo} {base} Opt NMR TightSCF\n{pal}%maxcore {maxcore}\n\n* xyz 0 1\n{coords}*\n")
+        print(f"▶️ Referencia RMN: {compuesto} con {nivel_teoria}")
+        outfile = ejecutar_orca(inpfile, carpeta, reglas=None)
+        resultado = obtener_resultado(inpfile, outfile)
+        if resultado.nmr_magnitud != "apantallamiento":
+            # Una tabla de desplazamientos no sirve como σ_ref
+            print(f"⚠️ {outfile} no tiene apantallamientos (CHEMICAL SHIELDING SUMMARY)")
+            de_este = []
+        for e in de_este:
+            sigmas = resultado.nmr_shift[resultado.nmr_elem == e]
+            if sigmas.size:
+                _guardar_referencia(nivel_teoria, e, float(sigmas.mean()), compuesto, "calculado", ruta)
+                calculados.append(e)
+        almacen_salidas.archivar_trabajo(carpeta)
+    return calculados
+
+
+def referencias(nivel_teoria, elementos, calcular=True, ruta=None):
+    """{elemento: (σ_ref, δ_ref)} para `elementos`; calcula con ORCA las que falten si `calcular`."""
+    elementos = set(elementos)
+    tabla = cargar_referencias(ruta).get(nivel_teoria, {})
+    faltan = sorted(e for e in elementos - set(tabla) if e in PATRONES)
+    if faltan and calcular:
+        try:
+            calcular_referencias(nivel_teoria, faltan, ruta=ruta)
+        except (RuntimeError, OSError) as e:
+            print(f"⚠️ No se pudieron calcular las referencias RMN ({', '.join(faltan)}): {e}")
+        tabla = cargar_referencias(ruta).get(nivel_teoria, {})
+    return {e: (tabla[e]["sigma"], PATRONES.get(e, (None, 0.0))[1]) for e in elementos if e in tabla}
+
+
+# --------- Núcleos equivalentes ---------
+def clases_equivalentes(elementos, coords):
+    """Clase de equivalencia topológica de cada átomo (array de enteros).
+
+    Refinamiento iterativo de etiquetas (Weisfeiler-Lehman) sobre el grafo
+    de enlaces: dos átomos quedan en la misma clase si tienen el mismo
+    elemento y entornos de enlaces indistinguibles, como los H de un metilo
+    o los de un benceno. Los protones diastereotópicos no se distinguen.
+    """
+    from visualize import detectar_enlaces
+    coords = np.asarray(coords, dtype=np.float64)
+    n = len(elementos)
+    vecinos = [[] for _ in range(n)]
+    for i, j in detectar_enlaces(elementos, coords).tolist():
+        vecinos[i].append(j)
+        vecinos[j].append(i)
+    _, clases = np.unique(np.asarray(elementos), return_inverse=True)
+    for _ in range(n):
+        firmas = [(clases[i], tuple(sorted(clases[j] for j in vecinos[i]))) for i in range(n)]
+        indice = {f: k for k, f in enumerate(sorted(set(firmas)))}
+        nuevas = np.array([indice[f] for f in firmas])
+        if len(indice) == len(set(clases.tolist())):
+            break
+        clases = nuevas
+    return clases
+
+
+def desplazamientos(apantallamiento, refs, clases=None):
+    """Espectro de desplazamientos químicos (ppm) a partir del Espectro de apantallamientos.
+
+    Los núcleos sin referencia en `refs` ({elemento: (σ_ref, δ_ref)}) se
+    descartan. Si el Espectro ya son desplazamientos (tabla CHEMICAL SHIFTS de
+    salidas antiguas) se usan tal cual y `refs` se ignora. Con `clases` (clases_equivalentes) cada grupo de núcleos
+    equivalentes da un pico en su δ medio con intensidad igual al número de
+    núcleos; `modo` es el primer átomo del grupo.
+    """
+    if apantallamiento.meta.get("magnitud") == "desplazamiento":
+        sel, delta = apantallamiento, apantallamiento.x
+    else:
+        e = apantallamiento.elemento
+        con_ref = np.isin(e, list(refs)) if e is not None else np.zeros(len(apantallamiento), bool)
+        sel = apantallamiento.seleccion(con_ref)
+        sigma_ref = np.array([refs[x][0] for x in sel.elemento.tolist()])
+        delta_ref = np.array([refs[x][1] for x in sel.elemento.tolist()])
+        delta = sigma_ref - sel.x + delta_ref
+    meta = {**sel.meta, "magnitud": "desplazamiento"}
+    if clases is None or not len(sel):
+        return Espectro("nmr", delta, sel.intensidad, sel.modo, sel.elemento, **meta)
+    grupos, inverso = np.unique(np.asarray(clases)[sel.modo], return_inverse=True)
+    n = np.bincount(inverso, minlength=grupos.size).astype(np.float64)
+    media = np.bincount(inverso, weights=delta, minlength=grupos.size) / n
+    primero = np.full(grupos.size, np.iinfo(np.int64).max)
+    np.minimum.at(primero, inverso, sel.modo)
+    elemento = np.empty(grupos.size, dtype="<U2")
+    elemento[inverso] = sel.elemento
+    orden = np.argsort(primero, kind="stable")
+    return Espectro("nmr", media[orden], n[orden], primero[orden], elemento[orden],
+                    **meta, agrupado=True)
+
+
+# --------- Espectros ensanchados ---------
+def espectros_lote(espectros, nucleos=NUCLEOS, fwhm=None, puntos=PUNTOS):
+    """Espectros lorentzianos de muchas moléculas y núcleos en una sola llamada vectorizada.
+
+    Cada par (molécula, núcleo) es una fila de ensanchar_lote sobre una
+    rejilla reducida común [0, 1] que se traslada a la ventana en ppm del
+    núcleo (VENTANAS), con su FWHM en las mismas unidades reducidas.
+    Devuelve {núcleo: (x en ppm, matriz (n_moléculas, puntos))}.
+    """
+    fwhm = {**FWHM, **(fwhm or {})}
+    u = np.linspace(0.0, 1.0, puntos)
+    centros, alturas, anchos = [], [], []
+    for nucleo in nucleos:
+        lo, hi = VENTANAS[nucleo]
+        for esp in espectros:
+            picos = esp.seleccion(esp.elemento == nucleo if esp.elemento is not None
+                                  else np.zeros(len(esp), dtype=bool))
+            centros.append((picos.x - lo) / (hi - lo))
+            alturas.append(picos.intensidad)
+            anchos.append(np.full(len(picos), fwhm[nucleo] / (hi - lo)))
+    y = ensanchar_lote(centros, alturas, u, anchos, forma="lorentz", ventana="auto")
+    curvas = {}
+    for k, nucleo in enumerate(nucleos):
+        lo, hi = VENTANAS[nucleo]
+        curvas[nucleo] = (lo + u * (hi - lo), y[k * len(espectros):(k + 1) * len(espectros)])
+    return curvas
+
+
+def procesar(outfile, resultado=None, xyz_file=None, calcular=True):
+    """Espectro de desplazamientos agrupados de una salida de ORCA, o None si no tiene RMN.
+
+    El nivel de teoría sale de la copia de la entrada en el .out (o del
+    preset nmr); la geometría, de la salida o del .xyz.
+    """
+    from parser_orca import leer_resultado, geometria_final
+    resultado = resultado or leer_resultado(outfile)
+    apantallamiento = resultado.espectro("nmr")
+    if not len(apantallamiento):
+        return None
+    nivel_teoria = (nivel_de_archivo(outfile)
+                    or nivel(entradas_orca.PRESETS["nmr"]["palabras"].split()))
+    refs = {}
+    if apantallamiento.meta["magnitud"] == "apantallamiento":
+        refs = referencias(nivel_teoria, set(apantallamiento.elemento.tolist()), calcular)
+        sin_ref = sorted(e for e in set(apantallamiento.elemento.tolist()) - set(refs) if e in PATRONES)
+        if sin_ref:
+            print(f"⚠️ Sin referencia RMN para {', '.join(sin_ref)} con {nivel_teoria}: se omiten")
+    geometria = geometria_final(outfile)
+    if geometria is None and xyz_file:
+        from visualize import leer_xyz
+        geometria = leer_xyz(xyz_file)
+    clases = None
+    if geometria is not None and len(geometria[0]) > int(apantallamiento.modo.max()):
+        clases = clases_equivalentes(*geometria)
+    espectro = desplazamientos(apantallamiento, refs, clases)
+    espectro.meta["nivel"] = nivel_teoria
+    return espectro
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Desplazamientos químicos y referencias de RMN")
+    parser.add_argument("salidas", nargs="*", help="Salidas .out de ORCA con apantallamientos")
+    parser.add_argument("--nivel", default=nivel(entradas_orca.PRESETS["nmr"]["palabras"].split()),
+                        help="Nivel de teoría método/base para --fijar y --calcular")
+    parser.add_argument("--fijar", nargs=2, metavar=("ELEMENTO", "SIGMA"),
+                        help="Fijar a mano el apantallamiento de referencia de un elemento")
+    parser.add_argument("--calcular", nargs="+", metavar="ELEMENTO",
+                        help="Calcular con ORCA las referencias de estos elementos")
+    parser.add_argument("--csv", action="store_true",
+                        help="Exportar _NMR.csv y los espectros de cada salida a results/espectros")
+    args = parser.parse_args()
+
+    if args.fijar:
+        fijar_referencia(args.nivel, args.fijar[0].capitalize(), float(args.fijar[1]))
+    if args.calcular:
+        calcular_referencias(args.nivel, [e.capitalize() for e in args.calcular])
+    if args.salidas:
+        espectros = {}
+        for outfile in args.salidas:
+            espectro = procesar(outfile, calcular=False)
+            if espectro is None or not len(espectro):
+                print(f"⚠️ {outfile}: sin desplazamientos")
+                continue
+            espectros[outfile] = espectro
+            for d, n, e in zip(espectro.x.tolist(), espectro.intensidad.tolist(), espectro.elemento.tolist()):
+                print(f"{os.path.basename(outfile):30s} {e:2s} {d:9.2f} ppm  ×{n:.0f}")
+        if args.csv and espectros:
+            from spectra import export_csv, plot_nmr
+            nombres = [os.path.splitext(os.path.basename(o))[0] + ".xyz" for o in espectros]
+            curvas = espectros_lote(list(espectros.values()))
+            for i, (molfile, espectro) in enumerate(zip(nombres, espectros.values())):
+                export_csv(molfile, espectro)
+                plot_nmr(molfile, espectro, {n: (x, y[i]) for n, (x, y) in curvas.items()})
+    else:
+        for nivel_teoria, elementos in sorted(cargar_referencias().items()):
+            for e, ref in sorted(elementos.items()):
+                print(f"{nivel_teoria:24s} {e:2s} σ = {ref['sigma']:9.3f} ppm  ({ref['compuesto']}, {ref['origen']})")
@@ -1,112 +1,695 @@
 import os
+import sys
+import glob
+import itertools
+import time
+import shutil
+import signal
 import argparse
 import subprocess
-from parser_orca import parse_ir, parse_energy_total
-from spectra import plot_ir_spectrum, export_csv, plot_ir_variants
-from visualize import save_molecule_html
-from reportlab.pdfgen import canvas
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from parser_orca import leer_resultado, geometria_final
+import cache_orca
+import almacen_salidas
+import entradas_orca
+import modelo_costes
+import trayectorias
+import espectro
+import cola_compartida
+from monitor_orca import SeguidorSalida, VigilanteAborto, REGLAS_DEFECTO, formatear_evento
+from metricas import Metricas, tamanos, leer_io, recursos_hijo
+# matplotlib, pandas, reportlab, py3Dmol y pyarrow se importan dentro de la etapa
+# que los usa: un cálculo sin --pdf/--csv/--view no paga su importación
 #esta es la rama raman jaja
-# Ruta del ejecutable de ORCA
-ORCA_BIN = "/home/alexander/Imágenes/orca_6_1_0_linux_x86-64_shared_openmpi418/orca"
+# Ruta del ejecutable de ORCA (se puede sobrescribir con la variable de entorno ORCA_BIN)
+ORCA_BIN = os.environ.get(
+    "ORCA_BIN", "/home/alexander/Imágenes/orca_6_1_0_linux_x86-64_shared_openmpi418/orca"
+)
 
 
-def generar_inp(xyz_file, job="optfreq", output_dir="inputs"):
-    """Genera un archivo .inp de ORCA a partir de un .xyz."""
-    with open(xyz_file) as f:
-        lines = f.readlines()
-    coords = "".join(lines[2:])
+def generar_inp(xyz_file, job="optfreq", output_dir="inputs", nprocs=None, carga=0,
+                multiplicidad=1, maxcore=None, nucleos=None, ram_mb=None, moinp=None,
+                optimizada=False, nombre=None):
+    """Genera un archivo .inp de ORCA a partir de un .xyz.
 
-    inp_text = f"""! B3LYP def2-SVP Opt Freq TightSCF
-
-* xyz 0 1
-{coords}*
-"""
+    `job` elige el preset de palabras clave (opt, freq, optfreq, raman, nmr).
+    Si no se fijan nprocs/maxcore, se dimensionan según el número de funciones
+    de base y los `nucleos`/`ram_mb` disponibles (por defecto, los del host).
+    `moinp` y `optimizada` se usan al encadenar cálculos (ver ejecutar_cadena);
+    `nombre` fija el nombre del .inp (por defecto, el del .xyz).
+    """
+    elementos, coords = entradas_orca.elementos_xyz(xyz_file)
+    inp_text = entradas_orca.construir_inp(elementos, coords, job, carga, multiplicidad,
+                                           nprocs, maxcore, nucleos, ram_mb, moinp, optimizada)
     os.makedirs(output_dir, exist_ok=True)
-    inpfile = os.path.join(output_dir, os.path.basename(xyz_file).replace(".xyz", ".inp"))
+    nombre = nombre or os.path.splitext(os.path.basename(xyz_file))[0]
+    inpfile = os.path.join(output_dir, f"{nombre}.inp")
     with open(inpfile, "w") as f:
         f.write(inp_text)
     return inpfile
 
 
-def ejecutar_orca(inpfile, intermediates_dir="outputs"):
-    """Ejecuta ORCA con un .inp y guarda la salida en outputs/."""
+def _detener(proc, espera=10):
+    """Termina ORCA y todos sus procesos hijos (MPI)."""
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+        proc.wait(timeout=espera)
+    except subprocess.TimeoutExpired:
+        os.killpg(proc.pid, signal.SIGKILL)
+        proc.wait()
+    except ProcessLookupError:
+        pass
+
+
+def _recoger(proc):
+    """Como proc.poll(), pero devuelve el rusage del hijo al recogerlo (None si sigue vivo)."""
+    pid, estado, rusage = os.wait4(proc.pid, os.WNOHANG)
+    if pid == 0:
+        return None
+    proc.returncode = os.waitstatus_to_exitcode(estado)
+    return rusage
+
+
+def ejecutar_orca(inpfile, intermediates_dir="outputs", usar_cache=True,
+                  al_evento=None, reglas=REGLAS_DEFECTO, intervalo=0.5, metricas=None):
+    """Ejecuta ORCA con un .inp y guarda la salida en outputs/.
+
+    Si una entrada equivalente ya se calculó con la misma versión de ORCA,
+    la salida se copia desde la caché sin volver a ejecutar ORCA.
+
+    Mientras ORCA corre, la salida se lee incrementalmente: cada evento
+    (iteración SCF, ciclo de optimización, gradiente, progreso de
+    frecuencias...) se pasa a `al_evento`, y si algún criterio de `reglas`
+    indica que el cálculo no va a converger, ORCA se detiene y se lanza
+    RuntimeError. reglas=None desactiva el aborto anticipado.
+
+    Con `metricas` (Metricas) se registra la etapa "orca": tiempo de pared,
+    CPU y RSS máximo del proceso ORCA (rusage), su E/S en disco, el
+    tamaño de la salida y los descriptores del cálculo. Las ejecuciones
+    completas se añaden además al historial de modelo_costes.py.
+
+    ORCA se ejecuta en la carpeta del .inp, de modo que sus archivos
+    auxiliares (.gbw, .xyz, .hess...) quedan junto a la entrada.
+    """
     os.makedirs(intermediates_dir, exist_ok=True)
     outfile = os.path.join(intermediates_dir, os.path.basename(inpfile).replace(".inp", ".out"))
+
+    clave = cache_orca.clave_entrada(inpfile, ORCA_BIN) if usar_cache else None
+    t0 = time.perf_counter()
+    if clave and cache_orca.recuperar_salida(clave, outfile):
+        print(f"♻️ Salida recuperada de la caché: {outfile}")
+        if metricas:
+            metricas.registrar("orca", tiempo_s=time.perf_counter() - t0, cache=True,
+                               tamanos=tamanos(almacen_salidas.resolver(outfile)))
+        return outfile
+
+    seguidor = SeguidorSalida(outfile)
+    vigilante = VigilanteAborto(reglas) if reglas else None
+    motivo = None
+    rusage, io = None, {}
+    ciclos_scf = 0
     with open(outfile, "w") as f:
-        subprocess.run([ORCA_BIN, inpfile], stdout=f, stderr=subprocess.STDOUT)
+        proc = subprocess.Popen([ORCA_BIN, os.path.basename(inpfile)], stdout=f,
+                                stderr=subprocess.STDOUT, start_new_session=True,
+                                cwd=os.path.dirname(os.path.abspath(inpfile)))
+        try:
+            while motivo is None:
+                # /proc/<pid>/io desaparece al recoger el proceso: se guarda la última lectura
+                io = leer_io(proc.pid) or io
+                rusage = _recoger(proc)
+                termino = rusage is not None
+                for evento in seguidor.leer():
+                    if evento["tipo"] == "scf_convergido":
+                        ciclos_scf += evento["ciclos"]
+                    if al_evento:
+                        al_evento(evento)
+                    motivo = vigilante.evaluar(evento) if vigilante else None
+                    if motivo:
+                        break
+                if termino:
+                    break
+                time.sleep(intervalo)
+        except BaseException:
+            # Ctrl-C o SIGTERM (p. ej. un worker de la cola que pierde su arrendamiento):
+            # ORCA está en su propia sesión y no recibe la señal, hay que detenerlo
+            _detener(proc)
+            raise
+    tiempo_s = time.perf_counter() - t0
+    recursos = recursos_hijo(rusage) if rusage else {}
+    carac = entradas_orca.leer_caracteristicas(inpfile)
+    if metricas:
+        metricas.registrar("orca", tiempo_s=tiempo_s, cache=False, codigo=proc.returncode,
+                           abortado=motivo, ciclos_scf=ciclos_scf, **carac, **recursos, **io,
+                           tamanos=tamanos(outfile))
+    if not motivo and proc.returncode == 0:
+        # Sólo las ejecuciones completas alimentan el modelo de costes
+        modelo_costes.registrar(carac, tiempo_s, recursos.get("rss_max_mb"))
+    if motivo:
+        _detener(proc)
+        raise RuntimeError(f"Cálculo abortado: {motivo} (ver {outfile})")
+    if proc.returncode != 0:
+        raise RuntimeError(f"ORCA terminó con código {proc.returncode} (ver {outfile})")
+    if clave:
+        cache_orca.guardar(clave, outfile=outfile)
     return outfile
 
 
-def generar_reporte_pdf(molfile, energia, freqs, intensidades, png_file=None, mol_png=None):
-    """Genera un PDF con energía, frecuencias IR, espectro y molécula 3D."""
-    os.makedirs("results/reportes", exist_ok=True)
+def obtener_resultado(inpfile, outfile, usar_cache=True):
+    """Devuelve el OrcaResult de `outfile`, desde la caché o su sidecar si ya se había parseado."""
+    if not usar_cache:
+        return leer_resultado(outfile)
+    clave = cache_orca.clave_entrada(inpfile, ORCA_BIN)
+    resultado = cache_orca.cargar_resultado(clave)
+    if resultado is None:
+        resultado = leer_resultado(outfile)
+        cache_orca.guardar(clave, resultado=resultado)
+    return resultado
+
+
+def generar_reporte_pdf(molfile, energia, espectro_ir, outfile=None, nmr=None):
+    """Genera un PDF vectorial con energía, espectro IR, molécula y todas las frecuencias.
+
+    `nmr` = (Espectro de desplazamientos, curvas por núcleo) añade las páginas de RMN.
+    """
+    import reportes
     pdf_file = os.path.join(
         "results/reportes", os.path.basename(molfile).replace(".xyz", "_IR.pdf")
     )
+    reportes.reporte_pdf(pdf_file, os.path.basename(molfile), energia, espectro_ir,
+                         xyz_file=molfile, outfile=outfile, nmr=nmr)
+    print(f"✅ Reporte generado: {pdf_file}")
+    return pdf_file
+
+
+def registrar_en_base(molfile, inpfile, outfile, resultado):
+    """Añade el cálculo terminado a la base columnar de espectros."""
+    try:
+        import base_espectros
+        metodo, base = base_espectros.metodo_y_base(inpfile)
+        base_espectros.agregar_resultado(
+            os.path.splitext(os.path.basename(molfile))[0], resultado, metodo, base,
+            cache_orca.clave_entrada(inpfile, ORCA_BIN), base_espectros.tiempo_orca(outfile),
+        )
+    except Exception as e:
+        # La base es un índice auxiliar: un fallo aquí no invalida el cálculo
+        print(f"⚠️ No se pudo registrar {molfile} en la base de espectros: {e}")
+
+
+def procesar_resultados(molfile, outfile, pdf=False, csv=False, view=False, resultado=None,
+                        metricas=None, laser_nm=espectro.LASER_NM, temperatura=espectro.TEMPERATURA):
+    """Parsea la salida de ORCA y genera espectros, CSV, vista 3D y PDF.
+
+    Si la salida tiene actividades Raman, con `csv` se exporta también el
+    espectro Raman corregido para el láser (`laser_nm`) y la `temperatura`.
+    Si tiene apantallamientos RMN, se convierten a desplazamientos con las
+    referencias del mismo nivel de teoría (rmn.py) y se exportan y grafican.
+    Cada etapa se registra en `metricas` (por defecto, las del trabajo de la molécula).
+    """
+    metricas = metricas or Metricas(os.path.splitext(os.path.basename(molfile))[0])
+    # Una sola lectura del .out para IR y energía (salvo que ya venga parseado o tenga sidecar)
+    if resultado is None:
+        with metricas.etapa("parse") as m:
+            resultado = leer_resultado(outfile)
+            m["tamanos"] = tamanos(outfile)
+    ir = resultado.espectro("ir")
+    energia = resultado.energia
+
+    print(f"✅ Energía total: {energia if energia else 'No encontrada'}")
+    print(f"✅ Se encontraron {len(ir)} frecuencias vibracionales")
+
+    if csv:
+        from spectra import plot_ir_variants, export_csv
+        with metricas.etapa("graficos") as m:
+            # En serie: el post-procesado ya corre dentro del pool de post_workers
+            m["tamanos"] = tamanos(*plot_ir_variants(molfile, ir, procesos=1))
+        with metricas.etapa("csv") as m:
+            archivos = [export_csv(molfile, ir)]
+            raman = resultado.espectro("raman")
+            if len(raman):
+                archivos.append(export_csv(molfile, raman.corregir_raman(laser_nm, temperatura)))
+            m["tamanos"] = tamanos(*archivos)
+    nmr = None
+    if (csv or pdf) and len(resultado.espectro("nmr")):
+        import rmn
+        with metricas.etapa("nmr") as m:
+            desplazamientos = rmn.procesar(outfile, resultado, molfile)
+            if desplazamientos is not None and len(desplazamientos):
+                curvas = {n: (x, y[0]) for n, (x, y) in rmn.espectros_lote([desplazamientos]).items()}
+                nmr = (desplazamientos, curvas)
+                if csv:
+                    from spectra import plot_nmr, export_csv
+                    m["tamanos"] = tamanos(export_csv(molfile, desplazamientos),
+                                           *plot_nmr(molfile, desplazamientos, curvas))
+    if view:
+        from visualize import save_molecule_html
+        with metricas.etapa("vista_3d") as m:
+            html_file, mol_png = save_molecule_html(molfile)
+            m["tamanos"] = tamanos(html_file, mol_png)
+
+    if pdf:
+        with metricas.etapa("pdf") as m:
+            m["tamanos"] = tamanos(
+                generar_reporte_pdf(molfile, energia, ir, outfile, nmr)
+            )
+
+    return energia
+
+
+def _calcular(molfile, job, base_dir, usar_cache, metricas, al_evento=None,
+              reglas=REGLAS_DEFECTO, **opciones_inp):
+    """Etapas de cálculo de una molécula: .inp, ORCA, parse y registro en la base."""
+    with metricas.etapa("generar_inp") as m:
+        inpfile = generar_inp(molfile, job, os.path.join(base_dir, "inputs"), **opciones_inp)
+        m.update(entradas_orca.leer_recursos(inpfile), tamanos=tamanos(inpfile))
+    # Un acierto de caché ya se registró en la base cuando se calculó
+    desde_cache = usar_cache and cache_orca.en_cache(cache_orca.clave_entrada(inpfile, ORCA_BIN))
+    outfile = ejecutar_orca(inpfile, os.path.join(base_dir, "outputs"), usar_cache,
+                            al_evento, reglas, metricas=metricas)
+    with metricas.etapa("parse"):
+        resultado = obtener_resultado(inpfile, outfile, usar_cache)
+    if not desde_cache:
+        with metricas.etapa("registro_base"):
+            registrar_en_base(molfile, inpfile, outfile, resultado)
+    archivar_trabajo(base_dir, metricas)
+    return outfile, resultado
+
+
+def archivar_trabajo(base_dir, metricas):
+    """Comprime las salidas terminadas del trabajo y poda sus temporales (ver almacen_salidas).
+
+    Se hace tras el parse: el post-procesado lee el sidecar y, de la salida
+    comprimida, sólo los tramos que necesita.
+    """
+    with metricas.etapa("archivo") as m:
+        comprimidas, borrados = almacen_salidas.archivar_trabajo(base_dir)
+        m.update(tamanos=tamanos(*(c for c, _, _ in comprimidas)), borrados=len(borrados),
+                 liberados_bytes=sum(t for _, t in borrados))
+
+
+# Cadenas de cálculos dependientes: cada paso parte del anterior
+CADENAS = {
+    "ir": ("opt", "freq"),
+    "raman": ("opt", "freq", "raman"),
+    "nmr": ("opt", "freq", "nmr"),
+}
+
+
+def ejecutar_cadena(molfile, pasos, outdir="runs", usar_cache=True, al_evento=None,
+                    reglas=REGLAS_DEFECTO, metricas=None, **opciones_inp):
+    """Ejecuta cálculos dependientes (p. ej. opt → freq → nmr) sobre una molécula.
+
+    Cada paso se ejecuta en <outdir>/<molécula>/<n>_<paso>/ y parte de la
+    geometría final del paso anterior y de su función de onda (.gbw, leída
+    con MORead), de modo que el SCF no empieza desde cero. Los .gbw y .xyz
+    de cada paso se conservan en su carpeta.
+
+    Devuelve [(paso, outfile, resultado), ...].
+    """
+    jobname = os.path.splitext(os.path.basename(molfile))[0]
+    metricas = metricas or Metricas(jobname)
+    xyz, gbw, optimizada = molfile, None, False
+    salidas = []
+    for n, paso in enumerate(pasos, 1):
+        carpeta = os.path.join(outdir, jobname, f"{n}_{paso}")
+        os.makedirs(carpeta, exist_ok=True)
+        metricas.contexto["paso"] = paso
+        moinp = None
+        if gbw and os.path.exists(gbw):
+            # ORCA no admite que %moinp sea el .gbw que va a escribir el propio cálculo
+            moinp = "guess.gbw"
+            shutil.copy2(gbw, os.path.join(carpeta, moinp))
+
+        with metricas.etapa("generar_inp", moread=bool(moinp)) as m:
+            inpfile = generar_inp(xyz, paso, carpeta, moinp=moinp, optimizada=optimizada,
+                                  nombre=jobname, **opciones_inp)
+            m.update(entradas_orca.leer_recursos(inpfile), tamanos=tamanos(inpfile))
+        desde_cache = usar_cache and cache_orca.en_cache(cache_orca.clave_entrada(inpfile, ORCA_BIN))
+        outfile = ejecutar_orca(inpfile, carpeta, usar_cache, al_evento, reglas, metricas=metricas)
+        with metricas.etapa("parse"):
+            resultado = obtener_resultado(inpfile, outfile, usar_cache)
+        if not desde_cache:
+            with metricas.etapa("registro_base"):
+                registrar_en_base(molfile, inpfile, outfile, resultado)
+        salidas.append((paso, outfile, resultado))
+        print(f"✅ Paso {n}/{len(pasos)} ({paso}) terminado: {outfile}")
 
-    c = canvas.Canvas(pdf_file)
-    c.setFont("Helvetica-Bold", 14)
-    c.drawString(100, 800, f"Reporte ORCA: {os.path.basename(molfile)}")
+        # Artefactos para el siguiente paso
+        gbw = os.path.join(carpeta, f"{jobname}.gbw")
+        if not optimizada and "opt" in entradas_orca.PRESETS[paso]["palabras"].lower().split():
+            xyz = os.path.join(carpeta, f"{jobname}.xyz")
+            if not os.path.exists(xyz):
+                # Salida recuperada de la caché: la geometría se lee del .out
+                geometria = geometria_final(outfile)
+                if geometria is None:
+                    raise RuntimeError(f"No se encontró la geometría optimizada en {outfile}")
+                xyz = os.path.join(carpeta, "geometria_final.xyz")
+                _escribir_xyz(xyz, *geometria)
+            optimizada = True
+        # El .gbw de este paso se conserva (es el último); el del anterior ya no hace falta
+        archivar_trabajo(os.path.join(outdir, jobname), metricas)
+    metricas.contexto.pop("paso", None)
+    return salidas
 
-    c.setFont("Helvetica", 12)
-    if energia:
-        c.drawString(100, 770, f"Energía total: {energia:.6f} Eh")
+
+def pasos_cadena(cadena):
+    """Pasos de una cadena: el nombre de una predefinida (CADENAS) o una lista de presets."""
+    pasos = CADENAS[cadena[0]] if len(cadena) == 1 and cadena[0] in CADENAS else tuple(cadena)
+    desconocidos = [p for p in pasos if p not in entradas_orca.PRESETS]
+    if desconocidos:
+        raise ValueError(f"Pasos desconocidos: {', '.join(desconocidos)}")
+    return pasos
+
+
+def run_pipeline(molfile, job="optfreq", outdir="runs", pdf=False, csv=False, view=False,
+                 modos=None, cadena=None, desde_salida=None, usar_cache=True, al_evento=None,
+                 reglas=REGLAS_DEFECTO, perfil=None, memoria=False, laser_nm=espectro.LASER_NM,
+                 temperatura=espectro.TEMPERATURA, **opciones_inp):
+    """Cálculo y post-procesado completos de una molécula en el proceso actual.
+
+    Es lo que hace `python run_orca.py --mol ...`, sin pagar el arranque del
+    intérprete: cálculo (o cadena de cálculos, o `desde_salida` sin ORCA),
+    espectros/CSV, vista 3D, PDF y, con `modos` (lista de índices; vacía =
+    todos), animaciones de modos normales. Las rutas relativas (results/,
+    `outdir`) son relativas al directorio actual. `opciones_inp` se pasa a
+    generar_inp (nprocs, carga, multiplicidad, maxcore, nucleos).
+
+    Devuelve {"energia", "outfile", "resultado", "metricas"} (ruta del .jsonl).
+    """
+    jobname = os.path.splitext(os.path.basename(molfile))[0]
+    metricas = Metricas(jobname, perfil, memoria)
+    t0 = time.perf_counter()
+    if desde_salida:
+        outfile, resultado = desde_salida, None
+    elif cadena:
+        salidas = ejecutar_cadena(molfile, pasos_cadena(cadena), outdir, usar_cache, al_evento,
+                                  reglas, metricas, **opciones_inp)
+        # Los espectros salen del último paso con frecuencias
+        _, outfile, resultado = next(
+            (s for s in reversed(salidas) if len(s[2].espectro("ir"))), salidas[-1]
+        )
     else:
-        c.drawString(100, 770, "⚠️ Energía no encontrada")
+        outfile, resultado = _calcular(molfile, job, os.path.join(outdir, jobname), usar_cache,
+                                       metricas, al_evento, reglas, **opciones_inp)
 
-    c.drawString(100, 750, f"Número de frecuencias vibracionales: {len(freqs)}")
+    energia = procesar_resultados(molfile, outfile, pdf, csv, view, resultado, metricas,
+                                  laser_nm, temperatura)
+    if modos is not None:
+        import vibraciones
+        with metricas.etapa("modos") as m:
+            m["modos"] = len(vibraciones.exportar_modos(outfile, list(modos) or None, xyz_file=molfile))
+    metricas.registrar("total", tiempo_s=time.perf_counter() - t0)
+    return {"energia": energia, "outfile": outfile, "resultado": resultado,
+            "metricas": metricas.archivo}
 
-    # Listar primeras frecuencias
-    for i, (frec, inten) in enumerate(zip(freqs[:10], intensidades[:10])):
-        c.drawString(120, 730 - i * 20, f"{frec:.2f} cm-1 (Intensidad: {inten:.2f})")
 
-    # 🔹 Insertar espectro IR
-    if png_file and os.path.exists(png_file):
-        c.drawImage(png_file, 100, 400, width=400, height=300)
+def _escribir_xyz(xyz_file, elementos, coords):
+    with open(xyz_file, "w") as f:
+        f.write(f"{len(elementos)}\nGeometría final de ORCA\n")
+        for e, (x, y, z) in zip(elementos, coords):
+            f.write(f"{e:2s} {x:12.6f} {y:12.6f} {z:12.6f}\n")
 
-    # 🔹 Insertar molécula 3D (captura PNG generada en visualize.py)
-    if mol_png and os.path.exists(mol_png):
-        c.drawImage(mol_png, 100, 100, width=300, height=250)
 
-    c.save()
-    print(f"✅ Reporte generado: {pdf_file}")
-    return pdf_file
+def _tarea_orca(molfile, job, outdir, nucleos, ram_mb, usar_cache=True, perfil=None, memoria=False,
+                carga=0, multiplicidad=1):
+    """Genera el .inp, ejecuta ORCA y parsea la salida (se ejecuta en un proceso hijo)."""
+    jobname = os.path.splitext(os.path.basename(molfile))[0]
+    metricas = Metricas(jobname, perfil, memoria)
+    return _calcular(molfile, job, os.path.join(outdir, jobname), usar_cache, metricas,
+                     nucleos=nucleos, ram_mb=ram_mb, carga=carga, multiplicidad=multiplicidad)
 
 
-if __name__ == "__main__":
+def _tarea_post(molfile, outfile, pdf, csv, view, resultado, perfil=None, memoria=False):
+    """Post-procesado de una molécula del lote (se ejecuta en un proceso hijo)."""
+    metricas = Metricas(os.path.splitext(os.path.basename(molfile))[0], perfil, memoria)
+    return procesar_resultados(molfile, outfile, pdf, csv, view, resultado, metricas)
+
+
+def _opciones_cola(args):
+    """Opciones de la línea de comandos que se reenvían a los trabajos encolados."""
+    opciones = ["--" + n.replace("_", "-") for n in ("pdf", "csv", "view", "no_cache", "sin_aborto")
+                if getattr(args, n)]
+    for n in ("carga", "multiplicidad", "nprocs", "maxcore", "laser", "temperatura"):
+        valor = getattr(args, n)
+        if valor is not None:
+            opciones += [f"--{n}", str(valor)]
+    if args.cadena:
+        opciones += ["--cadena", *args.cadena]
+    if args.modos is not None:
+        opciones += ["--modos", *map(str, args.modos)]
+    return opciones
+
+
+def listar_moleculas(patron):
+    """Devuelve los .xyz de un directorio o de un patrón glob, ordenados."""
+    if os.path.isdir(patron):
+        patron = os.path.join(patron, "*.xyz")
+    return sorted(glob.glob(patron))
+
+
+def _estimar_lote(molfile, job, cores, carga):
+    """Tarea de planificación de una molécula del lote (sin estimación si no se puede leer)."""
+    try:
+        tarea = modelo_costes.estimar_xyz(molfile, job, cores, carga)
+    except (ValueError, IndexError, OSError):
+        # El error se verá (y se anotará) al generar su .inp
+        tarea = modelo_costes.Tarea(molfile)
+    tarea.llegada = time.time()
+    return tarea
+
+
+def ejecutar_lote(molfiles, job="optfreq", outdir="runs", cores=None, jobs=None,
+                  post_workers=1, pdf=False, csv=False, view=False, usar_cache=True,
+                  perfil=None, memoria=False, carga=0, multiplicidad=1):
+    """Ejecuta ORCA y el post-procesado para muchas moléculas en paralelo.
+
+    Hasta `jobs` cálculos ORCA comparten el presupuesto de `cores` y de RAM
+    libre. Cada molécula pide los núcleos que aprovecha según su tamaño y
+    el planificador de modelo_costes.py lanza primero las de menor tiempo
+    estimado que quepan en lo que queda libre, de modo que una molécula
+    grande no retrasa a todas las pequeñas. El post-procesado de
+    cada molécula se lanza en otro pool en cuanto termina su cálculo, de modo
+    que se solapa con los cálculos restantes. Un fallo no detiene el lote.
+
+    Las métricas de cada molécula se escriben en results/metricas/<molécula>.jsonl;
+    `perfil` y `memoria` activan cProfile y tracemalloc en las etapas de Python.
+
+    `molfiles` puede ser cualquier iterable (por ejemplo, un generador de
+    frames de una trayectoria): de un iterable sin longitud sólo se leen
+    2×jobs moléculas por delante, y el orden se decide dentro de esa ventana.
+
+    Devuelve (energías por molécula, errores por molécula).
+    """
+    host_nucleos, ram_mb = entradas_orca.recursos_host()
+    cores = cores or host_nucleos
+    total = len(molfiles) if hasattr(molfiles, "__len__") else None
+    jobs = max(1, min(jobs or cores, cores, total or cores))
+    print(f"🚀 Lote de {total if total is not None else '?'} moléculas: hasta {jobs} cálculos "
+          f"simultáneos con {cores} núcleos y {ram_mb} MB, los más cortos primero")
+
+    energias, errores = {}, {}
+    entrantes = iter(molfiles)
+    ventana = total or 2 * jobs
+    pendientes = []
+    with ProcessPoolExecutor(max_workers=jobs) as orca_pool, \
+            ProcessPoolExecutor(max_workers=post_workers) as post_pool:
+        calculos, post = {}, {}
+
+        def enviar():
+            for mol in itertools.islice(entrantes, max(0, ventana - len(pendientes) - len(calculos))):
+                pendientes.append(_estimar_lote(mol, job, cores, carga))
+            en_curso = list(calculos.values())
+            libres = cores - sum(t.nucleos for t, _ in en_curso)
+            ram_libre = ram_mb - sum(t.memoria_mb for t, _ in en_curso)
+            for tarea in modelo_costes.planificar(pendientes, libres, ram_libre, en_curso, time.time(),
+                                                  maximo=jobs - len(calculos)):
+                pendientes.remove(tarea)
+                calculos[orca_pool.submit(_tarea_orca, tarea.clave, job, outdir, tarea.nucleos,
+                                          ram_mb * tarea.nucleos // cores, usar_cache, perfil, memoria,
+                                          carga, multiplicidad)] = (tarea, time.time())
+
+        def recoger_post(futuros):
+            for fut in futuros:
+                mol = post.pop(fut)
+                try:
+                    energias[mol] = fut.result()
+                except Exception as e:
+                    print(f"❌ {mol} (post-procesado): {e}")
+                    errores[mol] = str(e)
+
+        enviar()
+        while calculos:
+            hechos, _ = wait(calculos, return_when=FIRST_COMPLETED)
+            for fut in hechos:
+                mol = calculos.pop(fut)[0].clave
+                try:
+                    outfile, resultado = fut.result()
+                except Exception as e:
+                    print(f"❌ {mol}: {e}")
+                    errores[mol] = str(e)
+                    continue
+                print(f"✅ ORCA terminado: {mol}")
+                post[post_pool.submit(
+                    _tarea_post, mol, outfile, pdf, csv, view, resultado, perfil, memoria
+                )] = mol
+            recoger_post([f for f in post if f.done()])
+            enviar()
+
+        recoger_post(wait(post).done)
+
+    print(f"✅ Lote terminado: {len(energias)} correctos, {len(errores)} con errores")
+    return energias, errores
+
+
+def crear_parser():
+    """Parser de la línea de comandos (también lo usan opciones_pipeline y el worker caliente)."""
     parser = argparse.ArgumentParser()
-    parser.add_argument("--mol", required=True, help="Archivo .xyz de entrada")
+    entrada = parser.add_mutually_exclusive_group(required=True)
+    entrada.add_argument("--mol", help="Archivo .xyz de entrada")
+    entrada.add_argument("--batch", help="Directorio o patrón glob con varios .xyz")
+    entrada.add_argument("--trayectoria", help=".xyz multi-frame (confórmeros o dinámica)")
+    entrada.add_argument("--worker", metavar="COLA", default=None,
+                         help="Ejecutar trabajos de una cola compartida (ver cola_compartida.py)")
+    parser.add_argument("--encolar", metavar="COLA", default=None,
+                        help="Añadir --mol/--batch/--trayectoria a una cola compartida en vez de calcular")
+    parser.add_argument("--ttl", type=float, default=cola_compartida.TTL,
+                        help="Worker: segundos sin latido tras los que un trabajo vuelve a la cola")
+    parser.add_argument("--hasta-vaciar", action="store_true",
+                        help="Worker: terminar cuando la cola quede vacía")
+    parser.add_argument("--paso", type=int, default=1, help="Tomar uno de cada N frames")
+    parser.add_argument("--fraccion", type=float, default=None,
+                        help="Submuestreo aleatorio: fracción de frames a calcular")
+    parser.add_argument("--inicio", type=int, default=0, help="Primer frame")
+    parser.add_argument("--fin", type=int, default=None, help="Frame final (sin incluir)")
+    parser.add_argument("--max-frames", type=int, default=None, help="Máximo de frames a calcular")
     parser.add_argument("--pdf", action="store_true", help="Generar reporte PDF")
     parser.add_argument("--csv", action="store_true", help="Exportar espectro a CSV")
     parser.add_argument("--view", action="store_true", help="Generar visualización 3D")
-    parser.add_argument("--job", default="optfreq", help="Tipo de cálculo ORCA")
+    parser.add_argument("--laser", type=float, default=espectro.LASER_NM,
+                        help="Longitud de onda del láser Raman en nm (corrección de intensidades)")
+    parser.add_argument("--temperatura", type=float, default=espectro.TEMPERATURA,
+                        help="Temperatura (K) para las intensidades Raman")
+    parser.add_argument("--modos", nargs="*", type=int, metavar="K", default=None,
+                        help="Exportar animaciones de modos normales (todos si no se indican)")
+    parser.add_argument("--reporte-lote", metavar="PDF", default=None,
+                        help="En modo lote, un único PDF con todas las moléculas calculadas")
+    parser.add_argument("--job", default="optfreq", choices=list(entradas_orca.PRESETS),
+                        help="Tipo de cálculo ORCA")
+    parser.add_argument("--cadena", nargs="+", metavar="PASO",
+                        help="Cálculos encadenados (p. ej. opt freq nmr) o una cadena "
+                             f"predefinida ({', '.join(CADENAS)})")
+    parser.add_argument("--carga", type=int, default=0, help="Carga total de la molécula")
+    parser.add_argument("--multiplicidad", type=int, default=1, help="Multiplicidad de espín")
+    parser.add_argument("--nprocs", type=int, default=None,
+                        help="Procesos de ORCA (por defecto, según el tamaño de la molécula)")
+    parser.add_argument("--maxcore", type=int, default=None,
+                        help="Memoria por proceso en MB (por defecto, según tamaño y RAM libre)")
     parser.add_argument("--outdir", default="runs", help="Directorio base para resultados")
-    args = parser.parse_args()
+    parser.add_argument("--desde-salida", metavar="OUT", default=None,
+                        help="Regenerar espectros, CSV, vista 3D y PDF desde un .out existente "
+                             "sin ejecutar ORCA")
+    parser.add_argument("--cores", type=int, default=None,
+                        help="Núcleos totales para el lote o el worker (por defecto, todos)")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="Cálculos ORCA simultáneos en modo lote o worker")
+    parser.add_argument("--post-workers", type=int, default=1,
+                        help="Procesos para el post-procesado en modo lote")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Ejecutar ORCA aunque el cálculo ya esté en la caché")
+    parser.add_argument("--eventos", action="store_true",
+                        help="Emitir en stdout los eventos de progreso de ORCA (JSON)")
+    parser.add_argument("--sin-aborto", action="store_true",
+                        help="No abortar cálculos que parecen no converger")
+    parser.add_argument("--perfil", metavar="DIR", default=None,
+                        help="Guardar un perfil cProfile (.prof) por etapa de Python en DIR")
+    parser.add_argument("--memoria", action="store_true",
+                        help="Medir el pico de memoria de Python por etapa (tracemalloc)")
+    return parser
 
-    molfile = args.mol
-    jobname = os.path.splitext(os.path.basename(molfile))[0]
 
-    # Crear carpetas organizadas
-    base_dir = os.path.join(args.outdir, jobname)
-    inputs_dir = os.path.join(base_dir, "inputs")
-    outputs_dir = os.path.join(base_dir, "outputs")
+def _kwargs_pipeline(args):
+    """Argumentos de run_pipeline a partir de la línea de comandos ya analizada."""
+    return dict(
+        job=args.job, outdir=args.outdir, pdf=args.pdf, csv=args.csv, view=args.view,
+        modos=args.modos, cadena=args.cadena, desde_salida=args.desde_salida,
+        usar_cache=not args.no_cache, reglas=None if args.sin_aborto else REGLAS_DEFECTO,
+        perfil=args.perfil, memoria=args.memoria, laser_nm=args.laser, temperatura=args.temperatura,
+        nprocs=args.nprocs, carga=args.carga, multiplicidad=args.multiplicidad,
+        maxcore=args.maxcore, nucleos=args.cores,
+    )
 
-    inpfile = generar_inp(molfile, args.job, inputs_dir)
-    outfile = ejecutar_orca(inpfile, outputs_dir)
 
-    freqs, intensidades = parse_ir(outfile)
-    energia = parse_energy_total(outfile)
+def opciones_pipeline(opciones):
+    """kwargs de run_pipeline equivalentes a opciones de run_orca.py (p. ej. ["--pdf", "--csv"])."""
+    return _kwargs_pipeline(crear_parser().parse_args(["--mol", "-", *opciones]))
 
-    print(f"✅ Energía total: {energia if energia else 'No encontrada'}")
-    print(f"✅ Se encontraron {len(freqs)} frecuencias vibracionales")
 
-    png_files = plot_ir_variants(molfile, freqs, intensidades) if args.csv or args.pdf else None
-    png_file = png_files[2] if png_files else None  # Usar el espectro etiquetado para el PDF
+if __name__ == "__main__":
+    parser = crear_parser()
+    args = parser.parse_args()
+    # SIGTERM como Ctrl-C: deja que los finally detengan ORCA y suelten recursos
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(143))
+
+    if args.worker:
+        cola_compartida.trabajar(args.worker, args.outdir, args.jobs or 1, args.cores, args.ttl,
+                                 hasta_vaciar=args.hasta_vaciar)
+        raise SystemExit(0)
+
+    if args.encolar:
+        if args.mol:
+            molfiles = [args.mol]
+        elif args.batch:
+            molfiles = listar_moleculas(args.batch)
+        else:
+            nombre = os.path.splitext(os.path.basename(args.trayectoria))[0]
+            # Los frames se escriben junto a la cola para que todos los hosts los vean
+            molfiles = trayectorias.escribir_frames(
+                trayectorias.leer_frames(args.trayectoria, args.paso, args.inicio, args.fin,
+                                         args.fraccion, maximo=args.max_frames),
+                os.path.join(args.encolar, "moleculas", f"{nombre}_frames"), nombre)
+        opciones = _opciones_cola(args)
+        n = sum(1 for m in molfiles if cola_compartida.encolar(args.encolar, m, args.job, opciones, args.cores))
+        print(f"✅ {n} trabajos añadidos a la cola {args.encolar}: {cola_compartida.resumen(args.encolar)}")
+        raise SystemExit(0)
+
+    if args.batch:
+        molfiles = listar_moleculas(args.batch)
+        if not molfiles:
+            parser.error(f"No se encontraron archivos .xyz en {args.batch}")
+        energias, errores = ejecutar_lote(
+            molfiles, args.job, args.outdir, args.cores, args.jobs,
+            args.post_workers, args.pdf, args.csv, args.view, not args.no_cache,
+            args.perfil, args.memoria, args.carga, args.multiplicidad,
+        )
+        if args.reporte_lote:
+            import reportes
+            nombres = (os.path.splitext(os.path.basename(m))[0] for m in sorted(energias))
+            reportes.reporte_lote(args.reporte_lote, (
+                (n, os.path.join(args.outdir, n, "outputs", f"{n}.out"))
+                for n in nombres
+            ))
+        raise SystemExit(1 if errores else 0)
 
-    csv_file = export_csv(molfile, freqs, intensidades) if args.csv else None
-    html_file, mol_png = save_molecule_html(molfile) if args.view else (None, None)
+    if args.trayectoria:
+        nombre = os.path.splitext(os.path.basename(args.trayectoria))[0]
+        frames = trayectorias.leer_frames(args.trayectoria, args.paso, args.inicio, args.fin,
+                                          args.fraccion, maximo=args.max_frames)
+        energias, errores = ejecutar_lote(
+            trayectorias.escribir_frames(frames, os.path.join(args.outdir, f"{nombre}_frames"), nombre),
+            args.job, args.outdir, args.cores, args.jobs, args.post_workers, args.pdf, args.csv,
+            args.view, not args.no_cache, args.perfil, args.memoria, args.carga, args.multiplicidad,
+        )
+        trayectorias.agregar_por_frame(energias, errores,
+                                       os.path.join("results", "espectros", f"{nombre}_frames.csv"))
+        raise SystemExit(1 if errores else 0)
 
-    if args.pdf:
-        generar_reporte_pdf(molfile, energia, freqs, intensidades, png_file, mol_png)
+    al_evento = (lambda ev: print(formatear_evento(ev), flush=True)) if args.eventos else None
+    if args.cadena:
+        try:
+            pasos_cadena(args.cadena)
+        except ValueError as e:
+            parser.error(str(e))
+    salida = run_pipeline(args.mol, al_evento=al_evento, **_kwargs_pipeline(args))
 
-    print(f"✅ Resultados guardados en {base_dir} y results/")
+    jobname = os.path.splitext(os.path.basename(args.mol))[0]
+    print(f"✅ Resultados guardados en {os.path.join(args.outdir, jobname)} y results/")
+    print(f"📊 Métricas guardadas en {salida['metricas']}")
@@ -0,0 +1,466 @@
+# servicio_trabajos.py
+import os
+import sys
+import json
+import shutil
+import time
+import uuid
+import hashlib
+import fcntl
+import sqlite3
+import argparse
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from monitor_orca import EstimadorProgreso, leer_evento
+import entradas_orca
+import cache_orca
+import modelo_costes
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+RUN_ORCA = os.path.join(PROJECT_DIR, "run_orca.py")
+
+# Configuración (se puede sobrescribir por entorno)
+DB_PATH = os.environ.get("ORCA_JOBS_DB", os.path.join(PROJECT_DIR, "trabajos.sqlite"))
+TRABAJOS_DIR = os.environ.get("ORCA_JOBS_DIR", os.path.join(PROJECT_DIR, "trabajos"))
+MAX_WORKERS = int(os.environ.get("ORCA_JOBS_WORKERS", 2))
+MAX_POR_USUARIO = int(os.environ.get("ORCA_JOBS_POR_USUARIO", 3))
+MAX_LOTE = int(os.environ.get("ORCA_JOBS_LOTE", 50))   # trabajos activos por usuario al subir un lote
+# Núcleos que reparte el planificador entre los trabajos en curso
+NUCLEOS = int(os.environ.get("ORCA_JOBS_NUCLEOS", 0)) or entradas_orca.recursos_host()[0]
+# Ejecutar los trabajos en workers calientes (worker_caliente.py) en vez de un `python run_orca.py` por trabajo
+CALIENTE = os.environ.get("ORCA_JOBS_CALIENTE", "1") != "0"
+
+
+PENDIENTE, EJECUTANDO, TERMINADO, ERROR = "pendiente", "ejecutando", "terminado", "error"
+ACTIVOS = (PENDIENTE, EJECUTANDO)
+
+
+class LimiteExcedido(Exception):
+    """El usuario ya tiene el máximo de trabajos activos."""
+
+
+def conectar(db_path=None):
+    """Abre la base de datos de trabajos y crea las tablas si no existen."""
+    con = sqlite3.connect(db_path or DB_PATH, timeout=30, isolation_level=None)
+    con.row_factory = sqlite3.Row
+    con.execute("PRAGMA journal_mode=WAL")
+    con.executescript("""
+        CREATE TABLE IF NOT EXISTS trabajos (
+            id TEXT PRIMARY KEY,
+            usuario TEXT NOT NULL,
+            nombre TEXT NOT NULL,
+            molfile TEXT NOT NULL,
+            opciones TEXT NOT NULL DEFAULT '[]',
+            estado TEXT NOT NULL,
+            progreso INTEGER NOT NULL DEFAULT 0,
+            mensaje TEXT NOT NULL DEFAULT '',
+            resultados TEXT NOT NULL DEFAULT '{}',
+            creado REAL NOT NULL,
+            iniciado REAL,
+            terminado REAL
+        );
+        CREATE INDEX IF NOT EXISTS trabajos_estado ON trabajos (estado, creado);
+        CREATE INDEX IF NOT EXISTS trabajos_usuario ON trabajos (usuario, estado);
+        CREATE TABLE IF NOT EXISTS servicio (clave TEXT PRIMARY KEY, valor REAL);
+    """)
+    # Bases creadas antes de las columnas huella, coste y nucleos
+    existentes = {c["name"] for c in con.execute("PRAGMA table_info(trabajos)")}
+    for columna, tipo in (("huella", "TEXT"), ("coste", "REAL"), ("nucleos", "INTEGER")):
+        if columna not in existentes:
+            con.execute(f"ALTER TABLE trabajos ADD COLUMN {columna} {tipo}")
+    con.execute("CREATE INDEX IF NOT EXISTS trabajos_huella ON trabajos (huella, estado)")
+    return con
+
+
+def _como_dict(fila):
+    if fila is None:
+        return None
+    d = dict(fila)
+    d["opciones"] = json.loads(d["opciones"])
+    d["resultados"] = json.loads(d["resultados"])
+    return d
+
+
+def huella(contenido, opciones=()):
+    """Hash del contenido subido (sin depender de los finales de línea) y de las opciones."""
+    h = hashlib.sha256(contenido.replace(b"\r\n", b"\n"))
+    h.update(json.dumps(list(opciones)).encode())
+    return h.hexdigest()
+
+
+def _anterior(con, clave):
+    """Resultados de un trabajo terminado con la misma huella, si sus archivos siguen en disco."""
+    for fila in con.execute(
+        "SELECT id, resultados FROM trabajos WHERE huella = ? AND estado = ? ORDER BY terminado DESC",
+        (clave, TERMINADO),
+    ):
+        resultados = json.loads(fila["resultados"])
+        if resultados and all(os.path.exists(r) for r in resultados.values()):
+            return fila["id"], resultados
+    return None
+
+
+def _insertar(con, contenido, nombre, usuario, opciones):
+    """Crea el trabajo dentro de la transacción abierta. Devuelve (id, reutilizado)."""
+    trabajo_id = uuid.uuid4().hex[:12]
+    carpeta = os.path.join(TRABAJOS_DIR, trabajo_id)
+    os.makedirs(carpeta, exist_ok=True)
+    molfile = os.path.join(carpeta, os.path.basename(nombre))
+    with open(molfile, "wb") as f:
+        f.write(contenido)
+
+    clave = huella(contenido, opciones)
+    anterior = _anterior(con, clave)
+    ahora = time.time()
+    if anterior is not None:
+        # Misma estructura y opciones: se sirven los artefactos ya generados sin ejecutar ORCA
+        origen, resultados = anterior
+        con.execute(
+            "INSERT INTO trabajos (id, usuario, nombre, molfile, opciones, estado, progreso, mensaje,"
+            " resultados, creado, iniciado, terminado, huella) VALUES (?, ?, ?, ?, ?, ?, 100, ?, ?, ?, ?, ?, ?)",
+            (trabajo_id, usuario, nombre, molfile, json.dumps(list(opciones)), TERMINADO,
+             f"♻️ Resultados reutilizados del trabajo {origen}", json.dumps(resultados),
+             ahora, ahora, ahora, clave),
+        )
+        return trabajo_id, True
+    # Tiempo y núcleos estimados para el planificador (None si el .xyz no se puede leer)
+    tarea = modelo_costes.estimar_trabajo(molfile, opciones, NUCLEOS)
+    con.execute(
+        "INSERT INTO trabajos (id, usuario, nombre, molfile, opciones, estado, creado, huella, coste, nucleos)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (trabajo_id, usuario, nombre, molfile, json.dumps(list(opciones)), PENDIENTE, ahora, clave,
+         tarea and tarea.tiempo_s, tarea and min(tarea.nucleos, NUCLEOS)),
+    )
+    return trabajo_id, False
+
+
+def _activos(con, usuario):
+    return con.execute(
+        "SELECT COUNT(*) FROM trabajos WHERE usuario = ? AND estado IN (?, ?)",
+        (usuario, *ACTIVOS),
+    ).fetchone()[0]
+
+
+def encolar(contenido, nombre, usuario, opciones=("--pdf", "--csv", "--view"), db_path=None):
+    """Guarda el .xyz subido y crea un trabajo pendiente. Devuelve su id.
+
+    Si ya hay un trabajo terminado con el mismo contenido y opciones, el
+    nuevo se crea terminado y reutiliza sus resultados.
+    """
+    con = conectar(db_path)
+    try:
+        con.execute("BEGIN IMMEDIATE")
+        activos = _activos(con, usuario)
+        if activos >= MAX_POR_USUARIO:
+            con.execute("ROLLBACK")
+            raise LimiteExcedido(
+                f"Ya tienes {activos} trabajos en curso (máximo {MAX_POR_USUARIO})"
+            )
+        trabajo_id, _ = _insertar(con, contenido, nombre, usuario, opciones)
+        con.execute("COMMIT")
+        return trabajo_id
+    finally:
+        con.close()
+
+
+def encolar_lote(archivos, usuario, opciones=("--pdf", "--csv", "--view"), db_path=None):
+    """Encola varios .xyz [(contenido, nombre), ...] de una vez. Devuelve sus ids en orden.
+
+    Se admiten hasta MAX_LOTE trabajos activos por usuario; los que se
+    ejecutan a la vez siguen limitados por MAX_POR_USUARIO y los repetidos
+    (misma huella que un trabajo terminado) no cuentan porque no se ejecutan.
+    """
+    archivos = list(archivos)
+    con = conectar(db_path)
+    try:
+        con.execute("BEGIN IMMEDIATE")
+        activos = _activos(con, usuario)
+        ids = []
+        for contenido, nombre in archivos:
+            trabajo_id, reutilizado = _insertar(con, contenido, nombre, usuario, opciones)
+            ids.append(trabajo_id)
+            activos += not reutilizado
+            if activos > MAX_LOTE:
+                con.execute("ROLLBACK")
+                for i in ids:
+                    shutil.rmtree(os.path.join(TRABAJOS_DIR, i), ignore_errors=True)
+                raise LimiteExcedido(f"El lote supera el máximo de {MAX_LOTE} trabajos en curso")
+        con.execute("COMMIT")
+        return ids
+    finally:
+        con.close()
+
+
+def estado(trabajo_id, db_path=None):
+    """Devuelve el trabajo como dict, o None si no existe."""
+    con = conectar(db_path)
+    try:
+        return _como_dict(con.execute("SELECT * FROM trabajos WHERE id = ?", (trabajo_id,)).fetchone())
+    finally:
+        con.close()
+
+
+def estados(ids, db_path=None):
+    """Varios trabajos en una sola consulta, en el orden de `ids` (los inexistentes se omiten)."""
+    ids = list(ids)
+    if not ids:
+        return []
+    con = conectar(db_path)
+    try:
+        filas = con.execute(
+            f"SELECT * FROM trabajos WHERE id IN ({', '.join('?' * len(ids))})", ids
+        ).fetchall()
+        por_id = {f["id"]: _como_dict(f) for f in filas}
+        return [por_id[i] for i in ids if i in por_id]
+    finally:
+        con.close()
+
+
+def listar(usuario, limite=20, db_path=None):
+    """Trabajos más recientes de un usuario."""
+    con = conectar(db_path)
+    try:
+        filas = con.execute(
+            "SELECT * FROM trabajos WHERE usuario = ? ORDER BY creado DESC LIMIT ?",
+            (usuario, limite),
+        ).fetchall()
+        return [_como_dict(f) for f in filas]
+    finally:
+        con.close()
+
+
+def _actualizar(con, trabajo_id, **campos):
+    asignaciones = ", ".join(f"{k} = ?" for k in campos)
+    con.execute(f"UPDATE trabajos SET {asignaciones} WHERE id = ?", (*campos.values(), trabajo_id))
+
+
+def _tarea(fila):
+    return modelo_costes.Tarea(fila["id"], fila["nucleos"] or 1, fila["coste"] or 0.0, 0.0, fila["creado"])
+
+
+def _reclamar(con):
+    """Marca como en ejecución el pendiente que toca según el planificador y lo devuelve (o None).
+
+    Entre los pendientes se elige por tiempo estimado con envejecimiento
+    (modelo_costes.planificar) el que cabe en los NUCLEOS que dejan libres
+    los trabajos en curso. Se salta a los usuarios que ya tienen
+    MAX_POR_USUARIO trabajos ejecutándose, para que un usuario con muchos
+    envíos no acapare todos los workers.
+    """
+    con.execute("BEGIN IMMEDIATE")
+    filas = con.execute(
+        """
+        SELECT * FROM trabajos t
+        WHERE estado = ?
+          AND (SELECT COUNT(*) FROM trabajos e WHERE e.usuario = t.usuario AND e.estado = ?) < ?
+        """,
+        (PENDIENTE, EJECUTANDO, MAX_POR_USUARIO),
+    ).fetchall()
+    en_curso = [(_tarea(f), f["iniciado"] or f["creado"])
+                for f in con.execute("SELECT * FROM trabajos WHERE estado = ?", (EJECUTANDO,))]
+    libres = NUCLEOS - sum(t.nucleos for t, _ in en_curso)
+    elegida = modelo_costes.planificar([_tarea(f) for f in filas], libres, en_curso=en_curso,
+                                       ahora=time.time(), maximo=1)
+    fila = next(f for f in filas if f["id"] == elegida[0].clave) if elegida else None
+    if fila is not None:
+        _actualizar(con, fila["id"], estado=EJECUTANDO, iniciado=time.time(), progreso=10,
+                    mensaje="Iniciando cálculos ORCA...")
+    con.execute("COMMIT")
+    return _como_dict(fila)
+
+
+def _recoger_resultados(carpeta):
+    """Rutas de los archivos generados por run_orca.py dentro de la carpeta del trabajo."""
+    resultados = {}
+    for sub in ("reportes", "espectros", "moleculas_3d"):
+        directorio = os.path.join(carpeta, "results", sub)
+        if os.path.isdir(directorio):
+            for nombre in sorted(os.listdir(directorio)):
+                if not nombre.startswith("."):
+                    resultados[nombre] = os.path.join(directorio, nombre)
+    return resultados
+
+
+# Un worker caliente por hilo del pool: cada uno atiende un trabajo a la vez
+_hilo = threading.local()
+
+
+def _worker_caliente():
+    if getattr(_hilo, "worker", None) is None:
+        from worker_caliente import WorkerCaliente
+        _hilo.worker = WorkerCaliente()
+    return _hilo.worker
+
+
+def _opciones(trabajo):
+    """Opciones de run_orca.py del trabajo, con los núcleos que le asignó el planificador."""
+    if trabajo["nucleos"] and "--cores" not in trabajo["opciones"]:
+        return [*trabajo["opciones"], "--cores", str(trabajo["nucleos"])]
+    return trabajo["opciones"]
+
+
+def _ejecutar_subproceso(trabajo, carpeta, al_linea, al_evento):
+    """Un `python run_orca.py` por trabajo; las líneas de eventos JSON se separan del resto."""
+    proceso = subprocess.Popen(
+        [sys.executable, RUN_ORCA, "--mol", trabajo["molfile"], "--eventos", *_opciones(trabajo)],
+        cwd=carpeta,
+        env=cache_orca.entorno_hijo(),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+    )
+    for linea in proceso.stdout:
+        evento = leer_evento(linea.strip())
+        if evento is None:
+            al_linea(linea)
+        else:
+            al_evento(evento)
+    proceso.wait()
+    return proceso.returncode
+
+
+def _ejecutar_caliente(trabajo, carpeta, al_linea, al_evento):
+    from worker_caliente import ErrorTrabajo
+    try:
+        _worker_caliente().ejecutar(trabajo["molfile"], carpeta, _opciones(trabajo),
+                                    al_evento=al_evento, al_linea=al_linea)
+        return 0
+    except ErrorTrabajo as e:
+        al_linea(e.detalle or str(e))
+        return 1
+
+
+def ejecutar_trabajo(trabajo, db_path=None):
+    """Ejecuta el pipeline de un trabajo en su propia carpeta y guarda el resultado.
+
+    Con CALIENTE, run_orca.run_pipeline corre en el worker caliente del hilo
+    (sin arrancar un intérprete ni reimportar dependencias por trabajo); si
+    no, en un `python run_orca.py` nuevo.
+    """
+    con = conectar(db_path)
+    carpeta = os.path.dirname(trabajo["molfile"])
+    salida = []
+    estimador = EstimadorProgreso()
+
+    def al_linea(linea):
+        linea = linea.strip()
+        if linea:
+            salida.append(linea)
+            _actualizar(con, trabajo["id"], mensaje=linea)
+
+    def al_evento(evento):
+        # El progreso sale de los eventos reales de ORCA
+        progreso, mensaje = estimador.actualizar(evento)
+        _actualizar(con, trabajo["id"], progreso=progreso, mensaje=mensaje)
+
+    try:
+        ejecutar = _ejecutar_caliente if CALIENTE else _ejecutar_subproceso
+        codigo = ejecutar(trabajo, carpeta, al_linea, al_evento)
+        if codigo != 0:
+            _actualizar(con, trabajo["id"], estado=ERROR, terminado=time.time(),
+                        mensaje="\n".join(salida[-20:]) or f"Código de salida {codigo}")
+            return
+
+        _actualizar(con, trabajo["id"], estado=TERMINADO, progreso=100, terminado=time.time(),
+                    mensaje="¡Proceso completado!",
+                    resultados=json.dumps(_recoger_resultados(carpeta)))
+    except Exception as e:
+        _actualizar(con, trabajo["id"], estado=ERROR, terminado=time.time(), mensaje=str(e))
+    finally:
+        con.close()
+
+
+def _cerrojo(db_path=None):
+    """Archivo de bloqueo del servicio, junto a la base de datos."""
+    ruta = (db_path or DB_PATH) + ".servicio.lock"
+    os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+    return open(ruta, "a")
+
+
+def _tomar_cerrojo(db_path=None, espera=2.0):
+    """Toma en exclusiva el cerrojo del servicio; devuelve el archivo abierto o None si otro lo tiene.
+
+    Se reintenta durante `espera` s porque servicio_activo lo sondea un instante.
+    El bloqueo dura lo que el proceso: el sistema lo suelta si el servicio muere.
+    """
+    f = _cerrojo(db_path)
+    limite = time.monotonic() + espera
+    while True:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return f
+        except BlockingIOError:
+            if time.monotonic() > limite:
+                f.close()
+                return None
+            time.sleep(0.1)
+
+
+def servicio_activo(db_path=None):
+    """True si hay un servicio con el cerrojo tomado."""
+    with _cerrojo(db_path) as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        fcntl.flock(f, fcntl.LOCK_UN)
+        return False
+
+
+def asegurar_servicio(db_path=None):
+    """Arranca el servicio en segundo plano si no hay ninguno activo.
+
+    Si dos llamadas coinciden mientras el servicio arranca, el segundo
+    proceso no consigue el cerrojo y termina sin tocar los trabajos.
+    """
+    if servicio_activo(db_path):
+        return False
+    subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__)],
+        cwd=PROJECT_DIR,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    return True
+
+
+def servir(workers=MAX_WORKERS, intervalo=0.5, db_path=None):
+    """Bucle principal: reparte los trabajos pendientes entre `workers` hilos.
+
+    Sólo corre un servicio por base de datos: el cerrojo se mantiene
+    mientras viva el proceso. Devuelve False si ya había otro.
+    """
+    cerrojo = _tomar_cerrojo(db_path)
+    if cerrojo is None:
+        print("⚠️ Ya hay un servicio de trabajos activo")
+        return False
+    con = conectar(db_path)
+    # Trabajos que quedaron a medias si un servicio anterior murió: con el
+    # cerrojo tomado, ningún otro servicio los está ejecutando
+    con.execute("UPDATE trabajos SET estado = ?, progreso = 0 WHERE estado = ?", (PENDIENTE, EJECUTANDO))
+    print(f"🚀 Servicio de trabajos activo ({workers} workers, base de datos {db_path or DB_PATH})")
+
+    en_curso = set()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            # Última señal de vida (informativa; la exclusión la da el cerrojo)
+            con.execute("INSERT OR REPLACE INTO servicio (clave, valor) VALUES ('latido', ?)", (time.time(),))
+            en_curso = {f for f in en_curso if not f.done()}
+            while len(en_curso) < workers:
+                trabajo = _reclamar(con)
+                if trabajo is None:
+                    break
+                print(f"▶️ Trabajo {trabajo['id']} ({trabajo['nombre']}, usuario {trabajo['usuario']})")
+                en_curso.add(pool.submit(ejecutar_trabajo, trabajo, db_path))
+            time.sleep(intervalo)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servicio local de trabajos ORCA")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS, help="Trabajos simultáneos")
+    parser.add_argument("--db", default=None, help="Ruta de la base de datos SQLite")
+    args = parser.parse_args()
+    if servir(args.workers, db_path=args.db) is False:
+        raise SystemExit(1)
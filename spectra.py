@@ -1,122 +1,253 @@
 # spectra.py
 import os
-import matplotlib.pyplot as plt
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from parser_orca import process_ir_data
-import pandas as pd
+from espectro import COLUMNAS
 
-def plot_ir_spectrum(molfile, freqs, intensidades):
-    """Genera un espectro IR profesional y lo guarda como PNG."""
+# Plantillas de las variantes del espectro IR
+PLANTILLAS = {
+    "discrete": {
+        "titulo": "Espectro IR (Picos Discretos)",
+        "ylabel": "Intensidad",
+        "grid": "--",
+    },
+    "smooth": {
+        "titulo": "Espectro IR (Suavizado)",
+        "ylabel": "Transmitancia",
+        "grid": ":",
+        "xlim": (4000, 400),
+        "invertir_y": True,
+    },
+    "labeled": {
+        "titulo": "Espectro IR (Etiquetado)",
+        "ylabel": "Transmitancia",
+        "grid": ":",
+        "xlim": (4000, 400),
+        "ylim": (-0.05, 1.1),
+        "invertir_y": True,
+        "etiquetas": True,
+    },
+}
+VARIANTES = ("discrete", "smooth", "labeled")
+
+
+def _nueva_figura(figsize):
+    """Figura con lienzo Agg propio, sin pasar por el estado global de pyplot."""
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig, fig.add_subplot()
+
+
+def _dibujar_picos(ax, peaks):
+    # Líneas verticales y etiquetas para los picos significativos (Espectro normalizado)
+    significativos = peaks.seleccion(peaks.intensidad > 0.1)
+    ax.vlines(significativos.x, 0, significativos.intensidad, colors='gray', linestyles=':', alpha=0.5)
+    for freq, inten in zip(significativos.x.tolist(), significativos.intensidad.tolist()):
+        ax.text(freq, inten+0.02, f'{int(freq)}', rotation=90, ha='center', va='bottom', fontsize=8)
+
+
+def _huella(*partes):
+    """Hash de las entradas de un gráfico, para saber si hay que volver a dibujarlo."""
+    h = hashlib.sha256()
+    for parte in partes:
+        if isinstance(parte, np.ndarray):
+            h.update(np.ascontiguousarray(parte).tobytes())
+        else:
+            h.update(json.dumps(parte, default=str).encode())
+    return h.hexdigest()
+
+
+def _ruta_huella(ruta):
+    carpeta, nombre = os.path.split(ruta)
+    return os.path.join(carpeta, f".{nombre}.sha256")
+
+
+def _vigente(rutas, huella):
+    """True si todos los archivos existen y se generaron con la misma huella."""
+    for ruta in rutas:
+        try:
+            with open(_ruta_huella(ruta)) as f:
+                if f.read() != huella or not os.path.exists(ruta):
+                    return False
+        except OSError:
+            return False
+    return True
+
+
+def _renderizar(tarea):
+    """Dibuja una variante y la guarda en todos los formatos pedidos (proceso hijo)."""
+    nombre, rutas, huella, dpi, base_name, espectro, x_values, y_values, peaks = tarea
+    plantilla = PLANTILLAS[nombre]
+    fig, ax = _nueva_figura((10, 6))
+
+    if nombre == "discrete":
+        ax.plot(espectro.x, espectro.intensidad, color="blue", marker='o', markersize=4)
+    else:
+        ax.plot(x_values, y_values, color='darkblue', linewidth=1.5)
+    if plantilla.get("etiquetas"):
+        _dibujar_picos(ax, peaks)
+
+    ax.set_title(f"{plantilla['titulo']} - {base_name}")
+    ax.set_xlabel("Número de onda (cm⁻¹)")
+    ax.set_ylabel(plantilla["ylabel"])
+    ax.grid(True, linestyle=plantilla["grid"], alpha=0.3)
+    if plantilla.get("invertir_y"):
+        ax.invert_yaxis()
+    if "xlim" in plantilla:
+        ax.set_xlim(*plantilla["xlim"])
+    if "ylim" in plantilla:
+        ax.set_ylim(*plantilla["ylim"])
+    fig.tight_layout()
+
+    for ruta in rutas:
+        fig.savefig(ruta, dpi=dpi)
+        with open(_ruta_huella(ruta), "w") as f:
+            f.write(huella)
+    return rutas
+
+
+def plot_ir_spectrum(molfile, espectro, curva=None, dpi=300, formato="png"):
+    """Genera un espectro IR profesional y lo guarda como PNG (u otro formato).
+
+    `curva` permite reutilizar un resultado previo de process_ir_data.
+    """
     os.makedirs("results/espectros", exist_ok=True)
     pngfile = os.path.join(
         "results/espectros",
-        os.path.basename(molfile).replace(".xyz", "_IR.png")
+        os.path.basename(molfile).replace(".xyz", f"_IR.{formato}")
     )
 
     # Procesar datos
-    x_values, y_values, peaks = process_ir_data(freqs, intensidades)
+    x_values, y_values, peaks = curva or process_ir_data(espectro.x, espectro.intensidad)
     
     # Crear figura con estilo profesional
-    plt.figure(figsize=(12, 6))
+    fig, ax = _nueva_figura((12, 6))
     
     # Graficar espectro principal
-    plt.plot(x_values, y_values, color='darkblue', linewidth=1.5)
+    ax.plot(x_values, y_values, color='darkblue', linewidth=1.5)
     
-    # Añadir líneas verticales para los picos principales
-    for freq, inten in peaks:
-        if inten > 0.1:  # Solo mostrar picos significativos
-            plt.vlines(freq, 0, inten, colors='gray', linestyles=':', alpha=0.5)
-            # Añadir etiqueta de frecuencia
-            plt.text(freq, inten+0.02, f'{int(freq)}', 
-                    rotation=90, ha='center', va='bottom', fontsize=8)
+    # Añadir líneas verticales y etiquetas para los picos principales
+    _dibujar_picos(ax, peaks)
     
     # Configurar apariencia
-    plt.title(f"Espectro IR - {os.path.basename(molfile)}", pad=20)
-    plt.xlabel("Número de onda (cm⁻¹)")
-    plt.ylabel("Transmitancia")
+    ax.set_title(f"Espectro IR - {os.path.basename(molfile)}", pad=20)
+    ax.set_xlabel("Número de onda (cm⁻¹)")
+    ax.set_ylabel("Transmitancia")
     
     # Ajustar ejes y grid
-    plt.grid(True, linestyle=':', alpha=0.3)
-    plt.xlim(4000, 400)  # Invertir eje x (convención IR)
-    plt.ylim(-0.05, 1.1)
+    ax.grid(True, linestyle=':', alpha=0.3)
+    ax.set_xlim(4000, 400)  # Invertir eje x (convención IR)
+    ax.set_ylim(-0.05, 1.1)
     
     # Invertir eje y para mostrar picos hacia abajo
-    plt.gca().invert_yaxis()
+    ax.invert_yaxis()
     
-    plt.tight_layout()
-    plt.savefig(pngfile, dpi=300, bbox_inches='tight')
-    plt.close()
+    fig.tight_layout()
+    fig.savefig(pngfile, dpi=dpi, bbox_inches='tight')
 
     print(f"✅ Espectro IR guardado en: {pngfile}")
     return pngfile
 
-def plot_ir_variants(molfile, freqs, intensidades):
-    """Genera tres variantes del espectro IR."""
+def plot_ir_variants(molfile, espectro, dpi=300, formatos=("png",),
+                     procesos=1, forzar=False):
+    """Genera tres variantes del espectro IR (discreto, suavizado y etiquetado).
+
+    La curva suavizada se calcula una sola vez y se comparte entre variantes,
+    que por defecto se dibujan en serie: con matplotlib ya cargado un pool
+    no gana tiempo. `procesos` > 1 (None = uno por variante, hasta los
+    núcleos) sólo conviene desde un llamador de primer nivel, nunca dentro
+    de un proceso que ya es parte de un pool. Se puede pedir cualquier
+    formato de matplotlib (png, svg, pdf...). Una variante no se vuelve a
+    dibujar si sus entradas no cambiaron, salvo con `forzar`.
+
+    Devuelve las rutas de las tres variantes en el primer formato.
+    """
     os.makedirs("results/espectros", exist_ok=True)
     base_name = os.path.basename(molfile).replace(".xyz", "")
-    
-    # 1. Espectro original (picos discretos)
-    pngfile1 = os.path.join("results/espectros", f"{base_name}_IR_discrete.png")
-    plt.figure(figsize=(10, 6))
-    plt.plot(freqs, intensidades, color="blue", marker='o', markersize=4)
-    plt.title(f"Espectro IR (Picos Discretos) - {base_name}")
-    plt.xlabel("Número de onda (cm⁻¹)")
-    plt.ylabel("Intensidad")
-    plt.grid(True, linestyle="--", alpha=0.3)
-    plt.tight_layout()
-    plt.savefig(pngfile1, dpi=300)
-    plt.close()
-
-    # 2. Espectro suavizado invertido (estilo tradicional)
-    pngfile2 = os.path.join("results/espectros", f"{base_name}_IR_smooth.png")
-    x_values, y_values, peaks = process_ir_data(freqs, intensidades)
-    plt.figure(figsize=(10, 6))
-    plt.plot(x_values, y_values, color='darkblue', linewidth=1.5)
-    plt.title(f"Espectro IR (Suavizado) - {base_name}")
-    plt.xlabel("Número de onda (cm⁻¹)")
-    plt.ylabel("Transmitancia")
-    plt.grid(True, linestyle=':', alpha=0.3)
-    plt.gca().invert_yaxis()
-    plt.xlim(4000, 400)
-    plt.tight_layout()
-    plt.savefig(pngfile2, dpi=300)
-    plt.close()
-
-    # 3. Espectro con picos etiquetados
-    pngfile3 = os.path.join("results/espectros", f"{base_name}_IR_labeled.png")
-    plt.figure(figsize=(10, 6))
-    plt.plot(x_values, y_values, color='darkblue', linewidth=1.5)
-    for freq, inten in peaks:
-        if inten > 0.1:
-            plt.vlines(freq, 0, inten, colors='gray', linestyles=':', alpha=0.5)
-            plt.text(freq, inten+0.02, f'{int(freq)}', rotation=90, ha='center', va='bottom', fontsize=8)
-    plt.title(f"Espectro IR (Etiquetado) - {base_name}")
-    plt.xlabel("Número de onda (cm⁻¹)")
-    plt.ylabel("Transmitancia")
-    plt.grid(True, linestyle=':', alpha=0.3)
-    plt.gca().invert_yaxis()
-    plt.xlim(4000, 400)
-    plt.ylim(-0.05, 1.1)
-    plt.tight_layout()
-    plt.savefig(pngfile3, dpi=300)
-    plt.close()
-    
-    return pngfile1, pngfile2, pngfile3
+    curva = None
+
+    tareas, principales = [], []
+    for nombre in VARIANTES:
+        rutas = [os.path.join("results/espectros", f"{base_name}_IR_{nombre}.{fmt}")
+                 for fmt in formatos]
+        principales.append(rutas[0])
+        huella = _huella(nombre, base_name, dpi, espectro.x, espectro.intensidad)
+        if not forzar and _vigente(rutas, huella):
+            continue
+        if curva is None:
+            curva = process_ir_data(espectro.x, espectro.intensidad)
+        tareas.append((nombre, rutas, huella, dpi, base_name, espectro, *curva))
 
-def export_csv(molfile, freqs, intensidades):
-    """Exporta frecuencias e intensidades IR a CSV."""
+    if procesos is None:
+        procesos = min(len(tareas), os.cpu_count() or 1)
+    if procesos > 1 and len(tareas) > 1:
+        with ProcessPoolExecutor(max_workers=procesos) as pool:
+            list(pool.map(_renderizar, tareas))
+    else:
+        for tarea in tareas:
+            _renderizar(tarea)
+
+    return tuple(principales)
+
+def export_csv(molfile, espectro):
+    """Exporta un Espectro (IR, Raman o NMR) a CSV: posición, intensidad y modo o átomo.
+
+    El archivo es <molécula>_IR.csv, _Raman.csv o _NMR.csv.
+    """
     os.makedirs("results/espectros", exist_ok=True)
+    sufijo = {"ir": "IR", "raman": "Raman", "nmr": "NMR"}[espectro.tipo]
     csvfile = os.path.join(
         "results/espectros",
-        os.path.basename(molfile).replace(".xyz", "_IR.csv")
+        os.path.basename(molfile).replace(".xyz", f"_{sufijo}.csv")
     )
 
+    columnas = espectro.columnas()
     # Si todas las intensidades son 0 → asignar 1.0
-    if not intensidades or all(i == 0.0 for i in intensidades):
-        intensidades = [1.0] * len(freqs)
+    if not espectro.intensidad.any():
+        columnas[COLUMNAS[espectro.tipo][1]] = np.ones(len(espectro))
 
-    df = pd.DataFrame({"Frecuencia (cm-1)": freqs, "Intensidad": intensidades})
+    import pandas as pd  # sólo hace falta para el CSV
+    df = pd.DataFrame(columnas)
     df.to_csv(csvfile, index=False)
 
     print(f"✅ Datos exportados a: {csvfile}")
     return csvfile
+
+def plot_nmr(molfile, espectro, curvas, dpi=300):
+    """Guarda un PNG por núcleo con el espectro RMN ensanchado y sus picos.
+
+    `curvas` es {núcleo: (x en ppm, y)} (ver rmn.espectros_lote); el eje de
+    desplazamiento va de mayor a menor (convención RMN). Devuelve las rutas.
+    """
+    from rmn import ISOTOPOS
+    os.makedirs("results/espectros", exist_ok=True)
+    base_name = os.path.basename(molfile).replace(".xyz", "")
+    rutas = []
+    for nucleo, (x, y) in curvas.items():
+        picos = espectro.seleccion(espectro.elemento == nucleo)
+        if not len(picos):
+            continue
+        isotopo = ISOTOPOS.get(nucleo, nucleo)
+        ruta = os.path.join("results/espectros", f"{base_name}_NMR_{isotopo}.png")
+        fig, ax = _nueva_figura((10, 5))
+        ymax = max(float(y.max()), 1e-12)
+        ax.plot(x, y / ymax, color="darkgreen", linewidth=1.2)
+        for d in picos.x.tolist():
+            ax.text(d, 1.03, f"{d:.2f}", rotation=90, ha="center", va="bottom", fontsize=7)
+        margen = 0.05 * (picos.x.max() - picos.x.min()) + 10 * float(x[1] - x[0]) + 0.5
+        ax.set_xlim(picos.x.max() + margen, picos.x.min() - margen)
+        ax.set_ylim(0, 1.25)
+        ax.set_title(f"Espectro RMN {isotopo} - {base_name}")
+        ax.set_xlabel("Desplazamiento químico (ppm)")
+        ax.set_ylabel("Intensidad (normalizada)")
+        ax.grid(True, linestyle=":", alpha=0.3)
+        fig.tight_layout()
+        fig.savefig(ruta, dpi=dpi)
+        rutas.append(ruta)
+        print(f"✅ Espectro RMN {isotopo} guardado en: {ruta}")
+    return rutas
@@ -0,0 +1,42 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import base_espectros  # noqa: E402
+from parser_orca import OrcaResult  # noqa: E402
+
+
+def _resultado():
+    return OrcaResult(
+        outfile="acetona.out",
+        energia=-193.1,
+        ir_freqs=np.array([1210.0, 1715.0, 3010.0]),
+        ir_intens=np.array([40.0, 250.0, 12.0]),
+        ir_modos=np.array([7, 12, 20], dtype=np.int64),
+    )
+
+
+def test_agregar_dos_veces_una_fila_por_pico(tmp_path):
+    raiz = str(tmp_path)
+    for _ in range(2):
+        base_espectros.agregar_resultado("acetona", _resultado(), "B3LYP", "def2-SVP", "abc123",
+                                         raiz=raiz)
+
+    picos = base_espectros.consultar_picos("ir", raiz=raiz)
+    assert picos.num_rows == 3
+    banda = base_espectros.moleculas_con_banda(1650, 1750, raiz=raiz).to_pylist()
+    assert banda[0]["valor_count"] == 1
+    conteo = base_espectros.agregado("energia", "count", raiz=raiz).to_pylist()
+    assert conteo[0]["energia_count"] == 1
+
+
+def test_otra_entrada_se_registra(tmp_path):
+    raiz = str(tmp_path)
+    assert base_espectros.agregar_resultado("acetona", _resultado(), "B3LYP", "def2-SVP", "abc123",
+                                            raiz=raiz)
+    assert base_espectros.agregar_resultado("acetona", _resultado(), "B3LYP", "def2-TZVP", "def456",
+                                            raiz=raiz)
+    assert base_espectros.consultar_calculos(raiz=raiz).num_rows == 2
@@ -0,0 +1,119 @@
+# trayectorias.py
+import os
+import re
+import csv
+import math
+import random
+import itertools
+from dataclasses import dataclass
+
+# kcal/mol por Hartree y constante de Boltzmann (kcal/mol/K)
+HARTREE_KCAL = 627.5095
+KB_KCAL = 0.0019872041
+
+_frame_re = re.compile(r"_f(\d+)\.xyz$")
+
+
+@dataclass
+class Frame:
+    """Una estructura de un .xyz multi-frame."""
+    indice: int
+    comentario: str
+    elementos: list
+    lineas: list       # líneas de coordenadas tal cual vienen en el archivo
+
+    def escribir(self, xyz_file):
+        with open(xyz_file, "w") as f:
+            f.write(f"{len(self.lineas)}\n{self.comentario}\n")
+            f.writelines(l if l.endswith("\n") else l + "\n" for l in self.lineas)
+        return xyz_file
+
+
+def leer_frames(xyz_file, paso=1, inicio=0, fin=None, fraccion=None, semilla=0, maximo=None):
+    """Genera los frames de un .xyz multi-frame sin cargar el archivo entero.
+
+    Se leen los frames inicio, inicio+paso, ... (hasta `fin`, sin incluir); con
+    `fraccion` cada uno de ellos se conserva con esa probabilidad (muestreo
+    reproducible con `semilla`) y con `maximo` se para tras ese número de frames.
+    Los frames descartados se saltan sin interpretar sus coordenadas.
+    """
+    azar = random.Random(semilla)
+    entregados = 0
+    with open(xyz_file) as f:
+        for indice in itertools.count():
+            cabecera = f.readline()
+            if not cabecera.strip():
+                return
+            n = int(cabecera.split()[0])
+            if fin is not None and indice >= fin:
+                return
+            elegido = indice >= inicio and (indice - inicio) % paso == 0
+            if elegido and fraccion is not None:
+                elegido = azar.random() < fraccion
+            if not elegido:
+                for _ in itertools.islice(f, n + 1):
+                    pass
+                continue
+            comentario = f.readline().rstrip("\n")
+            lineas = list(itertools.islice(f, n))
+            if len(lineas) < n:
+                raise ValueError(f"{xyz_file}: frame {indice} incompleto ({len(lineas)} de {n} átomos)")
+            yield Frame(indice, comentario, [l.split()[0].capitalize() for l in lineas], lineas)
+            entregados += 1
+            if maximo is not None and entregados >= maximo:
+                return
+
+
+def contar_frames(xyz_file):
+    """Número de frames del archivo (lo recorre una vez sin guardar nada)."""
+    return sum(1 for _ in leer_frames(xyz_file))
+
+
+def escribir_frames(frames, outdir, nombre):
+    """Escribe cada frame en <outdir>/<nombre>_fNNNNNN.xyz a medida que se pide; genera las rutas."""
+    os.makedirs(outdir, exist_ok=True)
+    for frame in frames:
+        yield frame.escribir(os.path.join(outdir, f"{nombre}_f{frame.indice:06d}.xyz"))
+
+
+def indice_frame(xyz_file):
+    """Índice del frame codificado en el nombre de archivo por escribir_frames, o None."""
+    m = _frame_re.search(os.path.basename(xyz_file))
+    return int(m.group(1)) if m else None
+
+
+def agregar_por_frame(energias, errores, csv_file, temperatura=298.15):
+    """Tabla por frame: energía, energía relativa (kcal/mol), peso de Boltzmann y error.
+
+    `energias` y `errores` son los dicts {xyz: ...} que devuelve ejecutar_lote.
+    Devuelve la lista de filas, ordenadas por índice de frame.
+    """
+    validas = {mol: e for mol, e in energias.items() if e is not None}
+    e_min = min(validas.values(), default=None)
+    pesos = {}
+    if validas:
+        rel = {mol: (e - e_min) * HARTREE_KCAL for mol, e in validas.items()}
+        factores = {mol: math.exp(-r / (KB_KCAL * temperatura)) for mol, r in rel.items()}
+        total = sum(factores.values())
+        pesos = {mol: f / total for mol, f in factores.items()}
+
+    filas = []
+    for mol in set(energias) | set(errores):
+        e = validas.get(mol)
+        filas.append({
+            "frame": indice_frame(mol),
+            "xyz": mol,
+            "energia_eh": e,
+            "energia_rel_kcal": (e - e_min) * HARTREE_KCAL if e is not None else None,
+            "peso_boltzmann": pesos.get(mol),
+            "error": errores.get(mol, ""),
+        })
+    filas.sort(key=lambda r: (r["frame"] is None, r["frame"], r["xyz"]))
+
+    os.makedirs(os.path.dirname(csv_file) or ".", exist_ok=True)
+    with open(csv_file, "w", newline="") as f:
+        escritor = csv.DictWriter(f, fieldnames=list(filas[0]) if filas else ["frame"])
+        escritor.writeheader()
+        escritor.writerows(filas)
+    print(f"✅ Resumen por frame guardado en: {csv_file}")
+    return filas
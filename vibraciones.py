@@ -0,0 +1,107 @@
+# vibraciones.py
+"""Animaciones de los modos normales de una salida de ORCA.
+
+Cada modo se exporta como un .xyz multi-frame (un periodo de oscilación,
+legible por cualquier visor o por trayectorias.leer_frames) y, opcionalmente,
+como una vista HTML de py3Dmol animada con visualize.save_molecule_html.
+
+    python vibraciones.py runs/water/outputs/water.out --modos 6 7 8
+"""
+import os
+import argparse
+import numpy as np
+from parser_orca import leer_resultado, geometria_final, parse_normal_modes
+from visualize import leer_xyz, save_molecule_html
+
+AMPLITUD = 0.3      # desplazamiento máximo de un átomo en la animación (Å)
+FRAMES = 20         # frames por periodo de oscilación
+
+
+def cargar_modos(outfile, xyz_file=None):
+    """(elementos, coords Nx3, freqs, modos 3N×3N) de una salida con frecuencias.
+
+    La geometría es la final del .out o, si no la tiene, la de `xyz_file`.
+    """
+    modos = parse_normal_modes(outfile)
+    if modos is None:
+        raise ValueError(f"{outfile} no tiene bloque NORMAL MODES")
+    geometria = geometria_final(outfile)
+    if geometria is None and xyz_file:
+        geometria = leer_xyz(xyz_file)
+    if geometria is None:
+        raise ValueError(f"{outfile} no tiene geometría (indica el .xyz)")
+    elementos, coords = geometria
+    if 3 * len(elementos) != modos.shape[0]:
+        raise ValueError(f"{outfile}: {len(elementos)} átomos pero {modos.shape[0]} coordenadas en los modos")
+    freqs = leer_resultado(outfile).vib_freqs
+    if freqs.size != modos.shape[1]:
+        freqs = np.full(modos.shape[1], np.nan)
+    return elementos, coords, freqs, modos
+
+
+def desplazamiento(modos, k, amplitud=AMPLITUD):
+    """Desplazamientos Nx3 del modo k, escalados para que el átomo que más se mueve lo haga `amplitud` Å."""
+    d = np.asarray(modos[:, k], dtype=np.float64).reshape(-1, 3)
+    maximo = np.linalg.norm(d, axis=1).max()
+    return d * (amplitud / maximo) if maximo > 0 else d
+
+
+def frames_modo(coords, desp, n_frames=FRAMES):
+    """Geometrías (n_frames × N × 3) de un periodo de oscilación alrededor de `coords`."""
+    fase = np.sin(2 * np.pi * np.arange(n_frames) / n_frames)
+    return coords[None, :, :] + fase[:, None, None] * desp[None, :, :]
+
+
+def escribir_xyz_animado(xyz_file, elementos, frames, titulo=""):
+    """Escribe las geometrías como un .xyz multi-frame."""
+    with open(xyz_file, "w") as f:
+        for i, geom in enumerate(frames):
+            f.write(f"{len(elementos)}\n{titulo} frame {i}\n")
+            f.writelines(f"{e} {x:12.6f} {y:12.6f} {z:12.6f}\n" for e, (x, y, z) in zip(elementos, geom))
+    return xyz_file
+
+
+def exportar_modos(outfile, modos=None, outdir="results/modos", amplitud=AMPLITUD,
+                   n_frames=FRAMES, html=True, xyz_file=None):
+    """Exporta la animación de los modos indicados (índices de ORCA).
+
+    Por defecto se exportan todos los modos con frecuencia no nula (los de
+    traslación y rotación quedan fuera). Escribe <nombre>_modoK.xyz y, con
+    html=True, la vista animada <nombre>_modoK_3D.html.
+    Devuelve una lista de dicts {modo, freq, xyz, html}.
+    """
+    elementos, coords, freqs, matriz = cargar_modos(outfile, xyz_file)
+    if modos is None:
+        modos = [k for k, f in enumerate(freqs) if f != 0]
+    os.makedirs(outdir, exist_ok=True)
+    nombre = os.path.splitext(os.path.basename(outfile))[0]
+
+    exportados = []
+    for k in modos:
+        if not 0 <= k < matriz.shape[1]:
+            print(f"⚠️ Modo {k} fuera de rango (0-{matriz.shape[1] - 1})")
+            continue
+        desp = desplazamiento(matriz, k, amplitud)
+        titulo = f"{nombre} modo {k} ({freqs[k]:.2f} cm-1)"
+        xyz = escribir_xyz_animado(os.path.join(outdir, f"{nombre}_modo{k}.xyz"), elementos,
+                                   frames_modo(coords, desp, n_frames), titulo)
+        html_file = save_molecule_html(xyz, outdir, vibracion=desp, frames=n_frames)[0] if html else None
+        exportados.append({"modo": k, "freq": float(freqs[k]), "xyz": xyz, "html": html_file})
+
+    print(f"✅ {len(exportados)} modos normales exportados en: {outdir}")
+    return exportados
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Animaciones de modos normales de una salida de ORCA")
+    parser.add_argument("outfile", help="Salida .out de ORCA con frecuencias")
+    parser.add_argument("--modos", nargs="+", type=int, default=None,
+                        help="Índices de los modos (como en ORCA); por defecto todos los vibracionales")
+    parser.add_argument("--xyz", default=None, help=".xyz con la geometría si el .out no la tiene")
+    parser.add_argument("--outdir", default="results/modos", help="Directorio de salida")
+    parser.add_argument("--amplitud", type=float, default=AMPLITUD, help="Desplazamiento máximo (Å)")
+    parser.add_argument("--frames", type=int, default=FRAMES, help="Frames por periodo")
+    parser.add_argument("--sin-html", action="store_true", help="Sólo los .xyz multi-frame")
+    args = parser.parse_args()
+    exportar_modos(args.outfile, args.modos, args.outdir, args.amplitud, args.frames,
+                   not args.sin_html, args.xyz)
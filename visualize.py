@@ -1,11 +1,233 @@
 import os
-import py3Dmol
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
+import zlib
+import struct
+import atexit
+import numpy as np
 
+# Radios covalentes (Å) para detectar enlaces
+RADIOS_COVALENTES = {
+    "H": 0.31, "He": 0.28, "Li": 1.28, "Be": 0.96, "B": 0.84, "C": 0.76, "N": 0.71,
+    "O": 0.66, "F": 0.57, "Na": 1.66, "Mg": 1.41, "Al": 1.21, "Si": 1.11, "P": 1.07,
+    "S": 1.05, "Cl": 1.02, "K": 2.03, "Ca": 1.76, "Fe": 1.32, "Cu": 1.32, "Zn": 1.22,
+    "Br": 1.20, "I": 1.39,
+}
+RADIO_DEFECTO = 0.80
 
-def save_molecule_html(xyz_file, outdir="results/moleculas_3d"):
-    """Genera un archivo HTML con la molécula en 3D y una captura PNG."""
+# Colores CPK (RGB 0-1)
+COLORES_CPK = {
+    "H": (0.95, 0.95, 0.95), "C": (0.35, 0.35, 0.35), "N": (0.19, 0.31, 0.97),
+    "O": (1.00, 0.05, 0.05), "F": (0.56, 0.88, 0.31), "Cl": (0.12, 0.94, 0.12),
+    "Br": (0.65, 0.16, 0.16), "I": (0.58, 0.00, 0.58), "S": (1.00, 1.00, 0.19),
+    "P": (1.00, 0.50, 0.00), "B": (1.00, 0.71, 0.71), "Si": (0.94, 0.78, 0.63),
+    "Fe": (0.88, 0.40, 0.20), "Na": (0.67, 0.36, 0.95), "Mg": (0.54, 1.00, 0.00),
+}
+COLOR_DEFECTO = (1.00, 0.08, 0.58)
+
+# Tolerancia sobre la suma de radios covalentes para considerar un enlace
+TOLERANCIA_ENLACE = 1.15
+
+
+def leer_xyz(xyz_file):
+    """Lee un .xyz y devuelve (elementos, coordenadas Nx3)."""
+    with open(xyz_file) as f:
+        lines = f.readlines()
+    n = int(lines[0].split()[0])
+    elementos, coords = [], []
+    for line in lines[2:2 + n]:
+        partes = line.split()
+        elementos.append(partes[0].capitalize())
+        coords.append([float(v) for v in partes[1:4]])
+    return elementos, np.array(coords, dtype=np.float64).reshape(-1, 3)
+
+
+def xyz_con_vectores(elementos, coords, vectores, titulo=""):
+    """Texto .xyz con un vector por átomo en las columnas 5-7 (3Dmol lo usa para animar vibraciones)."""
+    lineas = [f"{len(elementos)}", titulo]
+    for e, (x, y, z), (dx, dy, dz) in zip(elementos, coords, vectores):
+        lineas.append(f"{e} {x:12.6f} {y:12.6f} {z:12.6f} {dx:10.6f} {dy:10.6f} {dz:10.6f}")
+    return "\n".join(lineas) + "\n"
+
+
+def detectar_enlaces(elementos, coords, tolerancia=TOLERANCIA_ENLACE):
+    """Pares (i, j) cuya distancia es menor que la suma de radios covalentes × tolerancia."""
+    radios = np.array([RADIOS_COVALENTES.get(e, RADIO_DEFECTO) for e in elementos])
+    d = np.linalg.norm(coords[:, None, :] - coords[None, :, :], axis=-1)
+    limite = (radios[:, None] + radios[None, :]) * tolerancia
+    i, j = np.nonzero(np.triu((d < limite) & (d > 0.1), k=1))
+    return np.stack([i, j], axis=1)
+
+
+def _orientar(coords):
+    """Centra la molécula y la rota para que su mayor extensión quede en el plano de la imagen."""
+    centrado = coords - coords.mean(axis=0)
+    if len(coords) < 3:
+        return centrado
+    _, vecs = np.linalg.eigh(np.cov(centrado.T))
+    return centrado @ vecs[:, ::-1]
+
+
+def vista_plana(elementos, coords):
+    """Coordenadas orientadas (x, y en el plano de la imagen, z hacia el observador) y enlaces."""
+    coords = np.asarray(coords, dtype=np.float64)
+    return _orientar(coords), detectar_enlaces(elementos, coords)
+
+
+_LUZ = np.array([-0.4, -0.5, 1.0]) / np.linalg.norm([-0.4, -0.5, 1.0])
+_MEDIO = (_LUZ + [0.0, 0.0, 1.0]) / np.linalg.norm(_LUZ + [0.0, 0.0, 1.0])
+
+
+def _sombrear(nx, ny, nz, color):
+    """Iluminación difusa + especular para normales (nx, ny, nz)."""
+    difusa = np.clip(nx * _LUZ[0] + ny * _LUZ[1] + nz * _LUZ[2], 0.0, 1.0)
+    especular = np.clip(nx * _MEDIO[0] + ny * _MEDIO[1] + nz * _MEDIO[2], 0.0, 1.0) ** 30
+    return (0.30 + 0.70 * difusa)[..., None] * color + 0.35 * especular[..., None]
+
+
+def _caja(cx0, cx1, cy0, cy1, r, forma):
+    alto, ancho = forma
+    x0, x1 = max(int(min(cx0, cx1) - r), 0), min(int(max(cx0, cx1) + r) + 2, ancho)
+    y0, y1 = max(int(min(cy0, cy1) - r), 0), min(int(max(cy0, cy1) + r) + 2, alto)
+    return x0, x1, y0, y1
+
+
+def _pintar(img, zbuf, caja, visible, z, sombra):
+    x0, x1, y0, y1 = caja
+    img[y0:y1, x0:x1][visible] = np.clip(sombra[visible], 0.0, 1.0)
+    zbuf[y0:y1, x0:x1][visible] = z[visible]
+
+
+def _dibujar_esferas(img, zbuf, centros, radios, colores):
+    """Rasteriza esferas sombreadas con z-buffer (centros en píxeles: x, y, z)."""
+    for (cx, cy, cz), r, color in zip(centros, radios, colores):
+        caja = _caja(cx, cx, cy, cy, r, zbuf.shape)
+        x0, x1, y0, y1 = caja
+        if x0 >= x1 or y0 >= y1:
+            continue
+        dx = np.arange(x0, x1) - cx
+        dy = (np.arange(y0, y1) - cy)[:, None]
+        d2 = r * r - dx * dx - dy * dy
+        dentro = d2 > 0
+        dz = np.sqrt(np.where(dentro, d2, 0.0))
+        z = cz + dz
+        visible = dentro & (z > zbuf[y0:y1, x0:x1])
+        if visible.any():
+            # Normal (y de imagen crece hacia abajo)
+            _pintar(img, zbuf, caja, visible, z, _sombrear(dx / r, dy / r, dz / r, np.asarray(color)))
+
+
+def _dibujar_varillas(img, zbuf, extremos, r, colores):
+    """Rasteriza cilindros entre pares de puntos; cada mitad con el color de su átomo."""
+    for (p, q), (color_p, color_q) in zip(extremos, colores):
+        caja = _caja(p[0], q[0], p[1], q[1], r, zbuf.shape)
+        x0, x1, y0, y1 = caja
+        eje = q[:2] - p[:2]
+        largo2 = eje @ eje
+        if x0 >= x1 or y0 >= y1 or largo2 < 1e-9:
+            continue
+        dx = np.arange(x0, x1) - p[0]
+        dy = (np.arange(y0, y1) - p[1])[:, None]
+        t = np.clip((dx * eje[0] + dy * eje[1]) / largo2, 0.0, 1.0)
+        ox, oy = dx - t * eje[0], dy - t * eje[1]
+        d2 = r * r - ox * ox - oy * oy
+        dentro = d2 > 0
+        dz = np.sqrt(np.where(dentro, d2, 0.0))
+        z = p[2] + t * (q[2] - p[2]) + dz
+        visible = dentro & (z > zbuf[y0:y1, x0:x1])
+        if visible.any():
+            color = np.where((t < 0.5)[..., None], color_p, color_q)
+            _pintar(img, zbuf, caja, visible, z, _sombrear(ox / r, oy / r, dz / r, color))
+
+
+def renderizar_molecula(elementos, coords, tam=400, fondo=(1.0, 1.0, 1.0), supermuestreo=2):
+    """Renderiza una vista bola-y-varilla en un array RGB uint8 (tam × tam), sin navegador."""
+    n = tam * supermuestreo
+    pos = _orientar(np.asarray(coords, dtype=np.float64))
+    radios_cov = np.array([RADIOS_COVALENTES.get(e, RADIO_DEFECTO) for e in elementos])
+    radios_bola = 0.35 * radios_cov + 0.12
+
+    extension = np.abs(pos[:, :2]).max() + radios_bola.max() if len(pos) else 1.0
+    escala = 0.45 * n / max(extension, 1e-6)
+    px = np.column_stack([n / 2 + pos[:, 0] * escala, n / 2 - pos[:, 1] * escala, pos[:, 2] * escala])
+
+    img = np.empty((n, n, 3), dtype=np.float32)
+    img[:] = fondo
+    zbuf = np.full((n, n), -np.inf)
+
+    colores = [np.asarray(COLORES_CPK.get(e, COLOR_DEFECTO)) for e in elementos]
+    enlaces = detectar_enlaces(elementos, coords)
+    _dibujar_varillas(img, zbuf, [(px[i], px[j]) for i, j in enlaces], 0.12 * escala,
+                      [(colores[i], colores[j]) for i, j in enlaces])
+    _dibujar_esferas(img, zbuf, px, radios_bola * escala, colores)
+
+    # Antialiasing por promedio de bloques
+    s = supermuestreo
+    img = sum(img[i::s, j::s] for i in range(s) for j in range(s)) * (255.0 / (s * s))
+    return (img + 0.5).astype(np.uint8)
+
+
+def guardar_png(png_file, rgb):
+    """Escribe un array RGB uint8 como PNG usando sólo zlib."""
+    alto, ancho, _ = rgb.shape
+    filas = np.hstack([np.zeros((alto, 1), dtype=np.uint8), rgb.reshape(alto, -1)])
+
+    def bloque(tipo, datos):
+        return (struct.pack(">I", len(datos)) + tipo + datos
+                + struct.pack(">I", zlib.crc32(tipo + datos) & 0xFFFFFFFF))
+
+    with open(png_file, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(bloque(b"IHDR", struct.pack(">IIBBBBB", ancho, alto, 8, 2, 0, 0, 0)))
+        f.write(bloque(b"IDAT", zlib.compress(filas.tobytes(), 1)))
+        f.write(bloque(b"IEND", b""))
+    return png_file
+
+
+class NavegadorPersistente:
+    """Una sesión de Chrome headless reutilizada para capturar muchas vistas HTML."""
+
+    def __init__(self, tam=600):
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
+
+        chrome_options = Options()
+        chrome_options.add_argument("--headless")
+        chrome_options.add_argument("--no-sandbox")
+        chrome_options.add_argument("--disable-dev-shm-usage")
+        self.driver = webdriver.Chrome(options=chrome_options)
+        self.driver.set_window_size(tam, tam)
+
+    def capturar(self, html_file, png_file):
+        self.driver.get("file://" + os.path.abspath(html_file))
+        self.driver.save_screenshot(png_file)
+        return png_file
+
+    def cerrar(self):
+        if self.driver is not None:
+            self.driver.quit()
+            self.driver = None
+
+
+_navegador = None
+
+
+def obtener_navegador():
+    """Devuelve la sesión de navegador compartida del proceso (se crea la primera vez)."""
+    global _navegador
+    if _navegador is None or _navegador.driver is None:
+        _navegador = NavegadorPersistente()
+        atexit.register(_navegador.cerrar)
+    return _navegador
+
+
+def save_molecule_html(xyz_file, outdir="results/moleculas_3d", modo="raster", vibracion=None,
+                       frames=20):
+    """Genera un archivo HTML con la molécula en 3D y una captura PNG.
+
+    modo="raster" dibuja el PNG en Python puro (sin navegador); modo="navegador"
+    usa una sesión de Chrome persistente compartida por todas las capturas.
+    Con `vibracion` (desplazamientos Nx3 en Å, p. ej. de un modo normal) la
+    vista HTML anima la molécula oscilando entre ±vibracion en `frames` pasos.
+    """
     os.makedirs(outdir, exist_ok=True)
     jobname = os.path.splitext(os.path.basename(xyz_file))[0]
 
@@ -17,9 +239,17 @@ def save_molecule_html(xyz_file, outdir="results/moleculas_3d"):
     with open(xyz_file) as f:
         xyz_data = f.read()
 
-    # Generar visualización interactiva con py3Dmol
+    # Generar visualización interactiva con py3Dmol (importado aquí: arrastra IPython)
+    import py3Dmol
     view = py3Dmol.view(width=400, height=400)
-    view.addModel(xyz_data, "xyz")
+    if vibracion is None:
+        view.addModel(xyz_data, "xyz")
+    else:
+        # 3Dmol genera los frames en el navegador a partir de un vector por átomo
+        elementos, coords = leer_xyz(xyz_file)
+        view.addModel(xyz_con_vectores(elementos, coords, vibracion), "xyz",
+                      {"vibrate": {"frames": frames, "amplitude": 1.0}})
+        view.animate({"loop": "backAndForth"})
     view.setStyle({"stick": {}})
     view.zoomTo()
 
@@ -27,21 +257,20 @@ def save_molecule_html(xyz_file, outdir="results/moleculas_3d"):
     with open(html_file, "w") as f:
         f.write(view._make_html())
 
-    # Intentar guardar captura PNG usando selenium
+    # Captura PNG estática
     try:
-        chrome_options = Options()
-        chrome_options.add_argument("--headless")
-        chrome_options.add_argument("--no-sandbox")
-        chrome_options.add_argument("--disable-dev-shm-usage")
-
-        driver = webdriver.Chrome(options=chrome_options)
-        driver.set_window_size(600, 600)
-        driver.get("file://" + os.path.abspath(html_file))
-        driver.save_screenshot(png_file)
-        driver.quit()
+        if modo == "navegador":
+            obtener_navegador().capturar(html_file, png_file)
+        else:
+            guardar_png(png_file, renderizar_molecula(*leer_xyz(xyz_file)))
     except Exception as e:
         print(f"⚠️ No se pudo generar PNG estático de la molécula: {e}")
         png_file = None
 
     print(f"✅ Visualización 3D guardada en: {html_file}")
     return html_file, png_file
+
+
+def capturar_lote(xyz_files, outdir="results/moleculas_3d", modo="raster"):
+    """Genera HTML y PNG para muchas moléculas reutilizando la misma sesión de render."""
+    return [save_molecule_html(xyz, outdir, modo) for xyz in xyz_files]
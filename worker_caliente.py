@@ -0,0 +1,183 @@
+# worker_caliente.py
+"""Proceso de larga duración que ejecuta run_orca.run_pipeline sin arrancar un intérprete por trabajo.
+
+El proceso hijo importa run_orca y las dependencias pesadas (matplotlib,
+pandas, reportlab, py3Dmol, pyarrow) una sola vez y recibe trabajos por una
+tubería local (stdin/stdout del hijo, una línea JSON por mensaje). Mientras un trabajo corre, el hijo
+devuelve por la misma tubería sus eventos de ORCA y cada línea que imprime,
+de modo que el primer mensaje llega en milisegundos.
+
+    with WorkerCaliente() as worker:
+        worker.ejecutar("trabajos/abc/water.xyz", carpeta="trabajos/abc", opciones=["--csv"])
+"""
+import os
+import io
+import sys
+import json
+import importlib
+import traceback
+import contextlib
+import subprocess
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Módulos que el hijo importa al arrancar para que ningún trabajo pague su importación
+PRECARGA = ("spectra", "reportes", "visualize", "base_espectros", "vibraciones")
+# Trabajos tras los que se recicla el proceso (acota fugas de memoria de librerías)
+MAX_TRABAJOS = int(os.environ.get("ORCA_WORKER_TRABAJOS", 50))
+
+
+class ErrorTrabajo(RuntimeError):
+    """El trabajo falló dentro del worker (o el worker murió); `detalle` trae la traza."""
+
+    def __init__(self, mensaje, detalle=""):
+        super().__init__(mensaje)
+        self.detalle = detalle
+
+
+class _Lineas(io.TextIOBase):
+    """stdout/stderr del hijo durante un trabajo: envía cada línea completa al padre."""
+
+    def __init__(self, enviar):
+        self.enviar = enviar
+        self.pendiente = ""
+
+    def writable(self):
+        return True
+
+    def write(self, texto):
+        self.pendiente += texto
+        *lineas, self.pendiente = self.pendiente.split("\n")
+        for linea in lineas:
+            self.enviar("linea", linea)
+        return len(texto)
+
+    def flush(self):
+        if self.pendiente:
+            self.enviar("linea", self.pendiente)
+            self.pendiente = ""
+
+
+def _bucle(precarga):
+    """Cuerpo del proceso hijo: importa una vez y atiende trabajos (JSON por stdin) hasta EOF."""
+    # El protocolo usa una copia privada del stdout original; el fd 1 pasa a stderr para
+    # que nada escrito directamente en él (bibliotecas, procesos hijos) corrompa los mensajes
+    protocolo = os.fdopen(os.dup(1), "w")
+    os.dup2(2, 1)
+
+    def enviar(*mensaje):
+        protocolo.write(json.dumps(mensaje, default=str) + "\n")
+        protocolo.flush()
+
+    import run_orca
+    for modulo in precarga:
+        importlib.import_module(modulo)
+    enviar("listo", os.getpid())
+
+    for linea in sys.stdin:
+        trabajo = json.loads(linea)
+        salida = _Lineas(enviar)
+        try:
+            os.chdir(trabajo["carpeta"])
+            kwargs = {**run_orca.opciones_pipeline(trabajo["opciones"]), **trabajo["kwargs"]}
+            with contextlib.redirect_stdout(salida), contextlib.redirect_stderr(salida):
+                r = run_orca.run_pipeline(trabajo["molfile"], al_evento=lambda ev: enviar("evento", ev),
+                                          **kwargs)
+            salida.flush()
+            # El OrcaResult no se envía: el padre sólo necesita el resumen y las rutas
+            enviar("fin", {"energia": r["energia"], "outfile": os.path.abspath(r["outfile"]),
+                           "metricas": os.path.abspath(r["metricas"])})
+        except BaseException as e:
+            salida.flush()
+            enviar("error", f"{type(e).__name__}: {e}", traceback.format_exc())
+            if isinstance(e, KeyboardInterrupt):
+                break
+
+
+class WorkerCaliente:
+    """Un proceso hijo reutilizable con el pipeline ya importado.
+
+    Los trabajos y los mensajes viajan como líneas JSON por la entrada y la
+    salida estándar del hijo. No es seguro compartir un mismo WorkerCaliente
+    entre hilos: cada hilo que ejecute trabajos debe tener el suyo.
+    """
+
+    def __init__(self, precarga=PRECARGA, max_trabajos=MAX_TRABAJOS):
+        self.precarga = tuple(precarga)
+        self.max_trabajos = max_trabajos
+        self.proc = None
+        self.trabajos = 0
+
+    def _arrancar(self):
+        from cache_orca import entorno_hijo
+        self.proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), *self.precarga],
+                                     stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True,
+                                     cwd=PROJECT_DIR, env=entorno_hijo())
+        if self._recibir()[0] != "listo":
+            raise ErrorTrabajo("El worker caliente no arrancó")
+        self.trabajos = 0
+
+    def _recibir(self):
+        linea = self.proc.stdout.readline()
+        if not linea:
+            codigo = self.proc.wait()
+            self.cerrar()
+            raise ErrorTrabajo(f"El worker caliente terminó inesperadamente (código {codigo})")
+        return json.loads(linea)
+
+    def ejecutar(self, molfile, carpeta=".", opciones=(), al_evento=None, al_linea=None, **kwargs):
+        """Ejecuta run_pipeline(molfile, ...) en el hijo, con `carpeta` como directorio actual.
+
+        `opciones` son opciones de run_orca.py (["--pdf", "--csv", ...]) y
+        `kwargs` argumentos directos de run_pipeline, que tienen prioridad.
+        Cada evento de ORCA se pasa a `al_evento` y cada línea impresa a
+        `al_linea` (por defecto se imprimen). Devuelve {energia, outfile,
+        metricas} o lanza ErrorTrabajo.
+        """
+        if self.proc is None or self.proc.poll() is not None or self.trabajos >= self.max_trabajos:
+            self.cerrar()
+            self._arrancar()
+        self.trabajos += 1
+        al_linea = al_linea or print
+        trabajo = {"molfile": os.path.abspath(molfile), "carpeta": os.path.abspath(carpeta),
+                   "opciones": list(opciones), "kwargs": kwargs}
+        self.proc.stdin.write(json.dumps(trabajo) + "\n")
+        self.proc.stdin.flush()
+        while True:
+            tipo, *datos = self._recibir()
+            if tipo == "evento":
+                if al_evento:
+                    al_evento(datos[0])
+            elif tipo == "linea":
+                al_linea(datos[0])
+            elif tipo == "fin":
+                return datos[0]
+            elif tipo == "error":
+                raise ErrorTrabajo(*datos)
+
+    def cerrar(self, espera=10):
+        """Cierra la entrada del hijo (que termina al leer EOF) o lo mata si no responde."""
+        if self.proc is None:
+            return
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.proc.wait(espera)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            self.proc.wait()
+        self.proc.stdout.close()
+        self.proc = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+
+if __name__ == "__main__":
+    # Proceso hijo lanzado por WorkerCaliente: los argumentos son los módulos a precargar
+    _bucle(sys.argv[1:])